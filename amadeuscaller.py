@@ -3,72 +3,142 @@ Amadeus API handler
 From here we interact with the Amadeus API endpoints 
 """
 
-from amadeus import Client, ResponseError
+from amadeus import ResponseError
+from amadeus.client.errors import ClientError, NetworkError, NotFoundError, ServerError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+from datetime import date, timedelta
+import logging
 import os
+import time
+
+from hotelstore import HotelStore, REFERENCE_RADIUS_KM
+from locations import location_index, validate_flight_search, validate_hotel_search
+from ratelimiter import rate_limiter, RateLimitError
+from resources import AMADEUS_CASSETTE_MODE, get_amadeus_client
+from searchcache import response_cache, make_key
+from singleflight import single_flight
+from telemetry import telemetry, get_logger
 
 
 # ============================================================
 #  CONFIGURATION
 # ============================================================
 
-AMADEUS_API_KEY = os.getenv("AMADEUS_API_KEY", "INSERT YOUR OWN")
-AMADEUS_API_SECRET = os.getenv("AMADEUS_API_SECRET", "INSERT YOUR OWN")
+# The Amadeus client (credentials: AMADEUS_API_KEY / AMADEUS_API_SECRET) is
+# created once per process on first use, see resources.get_amadeus_client
+
+# hotel offers are looked up in parallel chunks of hotel IDs
+MAX_HOTELS = int(os.getenv("AMADEUS_MAX_HOTELS", "50"))
+HOTEL_OFFERS_CHUNK_SIZE = int(os.getenv("AMADEUS_HOTEL_CHUNK_SIZE", "10"))
+HOTEL_OFFERS_MAX_WORKERS = int(os.getenv("AMADEUS_HOTEL_MAX_WORKERS", "4"))
+HOTEL_OFFERS_RETRIES = 2
+
+log = get_logger("amadeus")
+
+
+# ============================================================
+#  RATE-LIMITED CALLS
+# ============================================================
+
+def _status_code(error):
+    return getattr(getattr(error, "response", None), "status_code", None)
+
 
-amadeus = Client(
-    client_id=AMADEUS_API_KEY,
-    client_secret=AMADEUS_API_SECRET
-)
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _call(endpoint: str, fn, *args, **kwargs):
+    """
+    Make one Amadeus API call through the shared rate limiter for
+    `endpoint`. 429s are retried within the current action budget;
+    server and network errors count towards the endpoint's circuit breaker.
+    The call (including rate-limit waits and retries) is one telemetry
+    span; every failed attempt is counted by status. Replayed calls
+    (AMADEUS_CASSETTE_MODE=replay) skip the rate limiter.
+    """
+    def attempt():
+        try:
+            response = fn(*args, **kwargs)
+        except ResponseError as e:
+            telemetry.count("upstream_errors", service="amadeus", op=endpoint, status=_status_code(e) or "network")
+            raise
+        telemetry.observe_size("amadeus_response", len(getattr(response, "body", None) or ""), op=endpoint)
+        return response
+
+    with telemetry.span("amadeus", endpoint):
+        if AMADEUS_CASSETTE_MODE == "replay":
+            return attempt()  # replayed responses cost no quota
+        return rate_limiter.call(
+            f"amadeus:{endpoint}",
+            attempt,
+            is_throttle=lambda e: isinstance(e, ResponseError) and _status_code(e) == 429,
+            retry_after_of=_retry_after,
+            is_failure=lambda e: isinstance(e, ResponseError) and (_status_code(e) is None or _status_code(e) >= 500),
+        )
 
 
 # ============================================================
 #  FLIGHT METHODS
 # ============================================================
 
-def search_flights(origin: str, destination: str, departure_date: str, adults: int = 1, max_results: int = 3):
+def search_flights(origin: str, destination: str, departure_date: str, adults: int = 1, max_results: int = 3, fresh: bool = False,
+                   return_date: str = None):
     """
     Search for flights between two airports using Amadeus API.
-    Returns a list of flight offers.
+    Returns a list of flight offers; with return_date each offer is a round
+    trip (two itineraries, one combined price).
+    Results are cached per search; pass fresh=True to skip the cache.
+    Searches that cannot succeed (unknown codes, past dates) raise
+    InvalidSearchError without a request being made.
     """
+    origin, destination = validate_flight_search(origin, destination, departure_date, return_date, adults)
+    params = dict(origin=origin, destination=destination, departure_date=departure_date, adults=adults, max_results=max_results)
+    if return_date:
+        params["return_date"] = return_date
+    # identical searches already in flight (other sessions/threads) are joined, not repeated
+    fetch = lambda: single_flight.do(make_key("flights", params), lambda: _search_flights(**params))
+    return response_cache.get_or_fetch("flights", params, fetch, bypass=fresh)
+
+
+def _search_flights(origin: str, destination: str, departure_date: str, adults: int, max_results: int, return_date: str = None):
     try:
-        print(f"\n✈️ Searching flights from {origin} → {destination} on {departure_date}...")
+        log.info("flight_search origin=%s destination=%s departure=%s return=%s", origin, destination,
+                 departure_date, return_date)
 
-        response = amadeus.shopping.flight_offers_search.get(
+        extra = {"returnDate": return_date} if return_date else {}
+        response = _call(
+            "flight_offers_search", get_amadeus_client().shopping.flight_offers_search.get,
             originLocationCode=origin,
             destinationLocationCode=destination,
             departureDate=departure_date,
             adults=adults,
-            max=max_results
+            max=max_results,
+            **extra
         )
 
         if response.data == None: 
-            print("No available Flights")
+            log.info("flight_search_empty origin=%s destination=%s", origin, destination)
             return None
 
-        flights = []
-        for idx, offer in enumerate(response.data):
-            flights.append(offer)
-            price = offer["price"]["total"]
-            itineraries = offer["itineraries"]
-            first_leg = itineraries[0]["segments"][0]
-            last_leg = itineraries[0]["segments"][len(itineraries[0]["segments"])-1]
-
-            departure = first_leg["departure"]["iataCode"]
-            arrival = last_leg["arrival"]["iataCode"]
-            departure_time = first_leg["departure"]["at"]
-            arrival_time = last_leg["arrival"]["at"]
-            carrier = first_leg["carrierCode"]
-
-            print(f"\nFlight #{idx+1}")
-            print(f"  Airline: {carrier}")
-            print(f"  From: {departure} ({departure_time})")
-            print(f"  To: {arrival} ({arrival_time})")
-            print(f"  Price: €{price}")
-            print("-" * 40)
-
+        flights = list(response.data)
+        # per-offer details are only walked when debug logging is on
+        if log.isEnabledFor(logging.DEBUG):
+            for idx, offer in enumerate(flights):
+                segments = offer["itineraries"][0]["segments"]
+                log.debug("flight_offer n=%d carrier=%s from=%s at=%s to=%s at=%s price=%s %s", idx + 1,
+                          segments[0]["carrierCode"], segments[0]["departure"]["iataCode"], segments[0]["departure"]["at"],
+                          segments[-1]["arrival"]["iataCode"], segments[-1]["arrival"]["at"],
+                          offer["price"]["total"], offer["price"].get("currency", ""))
         return flights
 
     except ResponseError as e:
-        print("❌ Flight Search Error:", e)
+        log.warning("flight_search_failed origin=%s destination=%s error=%s", origin, destination, e)
         return []
 
 
@@ -78,7 +148,7 @@ def book_flight(flight_offer):
     Expects a flight offer object returned by search_flights().
     """
     try:
-        print("\n🧾 Booking flight (sandbox)...")
+        log.info("flight_booking offer=%s", flight_offer.get("id"))
 
         travelers = [
             {
@@ -109,16 +179,32 @@ def book_flight(flight_offer):
             }
         ]
 
-        response = amadeus.booking.flight_orders.post(
+        response = _call(
+            "flight_orders", get_amadeus_client().booking.flight_orders.post,
             flight=flight_offer,
             travelers=travelers
         )
 
-        print("✅ Flight booked successfully!")
+        log.info("flight_booked")
         return response.data
 
     except ResponseError as e:
-        print("❌ Flight Booking Error:", e)
+        log.warning("flight_booking_failed error=%s", e)
+        return None
+
+
+def price_flight_offer(flight_offer):
+    """
+    Confirm the current price and availability of a flight offer (sandbox).
+    Returns the priced flight offer, or None if it can no longer be priced.
+    """
+    try:
+        response = _call("flight_offers_pricing", get_amadeus_client().shopping.flight_offers.pricing.post, flight_offer)
+        priced = (response.data or {}).get("flightOffers") or []
+        return priced[0] if priced else None
+
+    except ResponseError as e:
+        log.warning("flight_pricing_failed error=%s", e)
         return None
 
 
@@ -126,59 +212,157 @@ def book_flight(flight_offer):
 #  HOTEL METHODS
 # ============================================================
 
-def search_hotels(city_code: str, check_in: str, check_out: str, radius_km: int = 20, rating=None):
+def search_hotels(city_code: str, check_in: str, check_out: str, radius_km: int = 20, rating=None, fresh: bool = False):
     """
     Search for hotels in a given city using Amadeus API.
     Returns a list of hotel offers with their IDs.
+    Results are cached per search; pass fresh=True to skip the cache.
+    An airport code is searched as its city (CGK -> JKT); searches that
+    cannot succeed raise InvalidSearchError without a request being made.
+    """
+    city_code = validate_hotel_search(city_code, check_in, check_out)
+    params = dict(city_code=city_code, check_in=check_in, check_out=check_out, radius_km=radius_km, rating=rating)
+    fetch = lambda: single_flight.do(make_key("hotels", params), lambda: _search_hotels(**params))
+    return response_cache.get_or_fetch("hotels", params, fetch, bypass=fresh)
+
+
+def _search_hotels(city_code: str, check_in: str, check_out: str, radius_km: int, rating):
+    try:
+        hotel_offers = []
+        for chunk_offers in stream_hotel_offers(city_code, check_in, check_out, radius_km=radius_km, rating=rating):
+            hotel_offers.extend(chunk_offers)
+
+        if not hotel_offers: 
+            log.info("hotel_search_empty city=%s", city_code)
+            return None 
+
+        return hotel_offers
+
+    except ResponseError as e:
+        log.warning("hotel_search_failed city=%s error=%s", city_code, e)
+        return []
+
+
+def stream_hotel_offers(city_code: str, check_in: str, check_out: str, radius_km: int = 20, rating=None,
+                        max_hotels: int = MAX_HOTELS, chunk_size: int = HOTEL_OFFERS_CHUNK_SIZE,
+                        max_workers: int = HOTEL_OFFERS_MAX_WORKERS):
+    """
+    Search for hotel offers in a city, yielding a list of offers each time
+    one chunk of hotel IDs has been looked up. Not cached.
+    """
+    city_code = location_index.city_code(city_code)
+    log.info("hotel_search city=%s check_in=%s check_out=%s", city_code, check_in, check_out)
+
+    # hotel IDs come from the local reference store; the hotel list is
+    # only fetched from Amadeus the first time a city is seen
+    hotel_ids = hotel_store.hotel_ids(city_code, radius_km=radius_km, rating=rating, limit=max_hotels)
+    log.info("hotel_ids city=%s count=%d", city_code, len(hotel_ids))
+    log.debug("hotel_ids city=%s ids=%s", city_code, hotel_ids)
+
+    yield from iter_hotel_offers(hotel_ids, check_in, check_out, chunk_size=chunk_size, max_workers=max_workers)
+
+
+def iter_hotel_offers(hotel_ids: list, check_in: str, check_out: str,
+                      chunk_size: int = HOTEL_OFFERS_CHUNK_SIZE, max_workers: int = HOTEL_OFFERS_MAX_WORKERS):
+    """
+    Look up offers for `hotel_ids` in chunks of `chunk_size`, at most
+    `max_workers` chunks at a time, and yield each chunk's offers as soon as
+    it completes. A chunk that still fails after its retries is skipped.
     """
+    chunks = [hotel_ids[i:i + chunk_size] for i in range(0, len(hotel_ids), chunk_size)]
+    if not chunks:
+        return
+
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(chunks)), thread_name_prefix="hotel-offers")
     try:
-        print(f"\n🏨 Searching for hotels in {city_code} ({check_in} to {check_out})...")
+        futures = {
+            pool.submit(contextvars.copy_context().run, _fetch_hotel_offers_chunk, chunk, check_in, check_out): chunk
+            for chunk in chunks
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except (ResponseError, RateLimitError) as e:
+                log.warning("hotel_offers_chunk_failed hotels=%s error=%s", futures[future], e)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _fetch_hotel_offers_chunk(hotel_ids: list, check_in: str, check_out: str, retries: int = HOTEL_OFFERS_RETRIES):
+    for attempt in range(retries + 1):
+        try:
+            offers_response = _call(
+                "hotel_offers_search", get_amadeus_client().shopping.hotel_offers_search.get,
+                hotelIds=hotel_ids,
+                checkInDate=check_in,
+                checkOutDate=check_out
+            )
+            return _simplify_hotel_offers(offers_response.data or [])
+        except (NetworkError, ServerError) as e:
+            # transient upstream errors are retried for this chunk only
+            if attempt == retries:
+                raise
+            time.sleep(0.5 * (2 ** attempt))
+
+
+def _simplify_hotel_offers(data: list):
+    hotel_offers = []
+    for hotel_entry in data:
+        hotel_name = hotel_entry["hotel"]["name"]
+        for offer in hotel_entry["offers"]:
+            offer_info = {
+                "hotel_name": hotel_name,
+                "offer_id": offer["id"],
+                "price": offer["price"]["base"],
+                "currency": offer["price"]["currency"]
+            }
+            hotel_offers.append(offer_info)
+            log.debug("hotel_offer hotel=%r price=%s %s offer_id=%s", hotel_name, offer_info["price"],
+                      offer_info["currency"], offer_info["offer_id"])
+    return hotel_offers
+
 
+def _fetch_city_hotels(city_code: str, rating=None):
+    """
+    Raw hotel list for a city, used to fill the local hotel store. None when
+    Amadeus has no list for the code, so the store does not ask again at
+    once; transient errors are raised.
+    """
+    try:
         if rating == None: 
-            hotel_response = amadeus.reference_data.locations.hotels.by_city.get(
+            hotel_response = _call(
+                "hotels_by_city", get_amadeus_client().reference_data.locations.hotels.by_city.get,
                 cityCode=city_code,
-                radius=radius_km,
+                radius=REFERENCE_RADIUS_KM,
             )
         else: 
-            hotel_response = amadeus.reference_data.locations.hotels.by_city.get(
+            hotel_response = _call(
+                "hotels_by_city", get_amadeus_client().reference_data.locations.hotels.by_city.get,
                 cityCode=city_code,
-                radius=radius_km,
+                radius=REFERENCE_RADIUS_KM,
                 ratings=rating
             )
-        if hotel_response.data == None: 
-            print("No available Hotels")
-            return None 
-        
-        hotel_ids = [hotel["hotelId"] for hotel in hotel_response.data[:10]]
-        print(f"Found {len(hotel_ids)} hotels: {hotel_ids}")
-
-        offers_response = amadeus.shopping.hotel_offers_search.get(
-            hotelIds=hotel_ids,
-            checkInDate=check_in,
-            checkOutDate=check_out
-        )
-        if offers_response.data == None: 
-            print("No available Hotels")
-            return None 
-        
-        hotel_offers = []
-        for hotel_entry in offers_response.data:
-            hotel_name = hotel_entry["hotel"]["name"]
-            for offer in hotel_entry["offers"]:
-                offer_info = {
-                    "hotel_name": hotel_name,
-                    "offer_id": offer["id"],
-                    "price": offer["price"]["base"],
-                    "currency": offer["price"]["currency"]
-                }
-                hotel_offers.append(offer_info)
-                print(f"💤 {hotel_name} — {offer_info['price']} {offer_info['currency']} (Offer ID: {offer_info['offer_id']})")
+    except (ClientError, NotFoundError) as e:
+        log.warning("hotel_list_unavailable city=%s error=%s", city_code, e)
+        return None
+    return hotel_response.data
 
-        return hotel_offers
+
+hotel_store = HotelStore(_fetch_city_hotels)
+
+
+def check_hotel_offer(hotel_offer_id: str):
+    """
+    Re-fetch a hotel offer by ID to confirm it is still available.
+    Returns the offer data (hotel + offers), or None if it is gone.
+    """
+    try:
+        response = _call("hotel_offer_search", get_amadeus_client().shopping.hotel_offer_search(hotel_offer_id).get)
+        return response.data
 
     except ResponseError as e:
-        print("❌ Hotel Search Error:", e)
-        return []
+        log.warning("hotel_offer_check_failed offer=%s error=%s", hotel_offer_id, e)
+        return None
 
 
 def book_hotel(hotel_offer_id: str):
@@ -186,9 +370,10 @@ def book_hotel(hotel_offer_id: str):
     Book a hotel using Amadeus API sandbox with a given offer ID.
     """
     try:
-        print(f"\n🧾 Booking hotel offer {hotel_offer_id}...")
+        log.info("hotel_booking offer=%s", hotel_offer_id)
 
-        booking_response = amadeus.booking.hotel_orders.post(
+        booking_response = _call(
+            "hotel_orders", get_amadeus_client().booking.hotel_orders.post,
             travel_agent={"contact": {"email": "bob.smith@email.com"}},
             guests=[
                 {
@@ -219,11 +404,11 @@ def book_hotel(hotel_offer_id: str):
             }
         )
 
-        print("✅ Hotel booked successfully!")
+        log.info("hotel_booked offer=%s", hotel_offer_id)
         return booking_response.data
 
     except ResponseError as e:
-        print("❌ Hotel Booking Error:", e)
+        log.warning("hotel_booking_failed offer=%s error=%s", hotel_offer_id, e)
         return None
 
 
@@ -232,8 +417,12 @@ def book_hotel(hotel_offer_id: str):
 # ============================================================
 
 if __name__ == "__main__":
+    # dates in the past are rejected before any request, so search a month ahead
+    check_in = date.today() + timedelta(days=30)
+    check_out = check_in + timedelta(days=3)
+
     # --- Test Flight Search + Booking ---
-    flights = search_flights(origin="CGK", destination="AMS", departure_date="2025-12-20")
+    flights = search_flights(origin="CGK", destination="AMS", departure_date=check_in.isoformat())
 
     # print(flights[1])
     if flights:
@@ -242,7 +431,7 @@ if __name__ == "__main__":
         book_flight(flights[0])
 
     # # --- Test Hotel Search + Booking ---
-    # hotels = search_hotels(city_code="AMS", check_in="2025-12-20", check_out="2025-12-23", rating=5)
+    # hotels = search_hotels(city_code="AMS", check_in=check_in.isoformat(), check_out=check_out.isoformat(), rating=5)
     # if hotels:
     #     print("🛏️ Booking the first available hotel...")
     #     book_hotel(hotels[0]["offer_id"])
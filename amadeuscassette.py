@@ -0,0 +1,330 @@
+"""
+Amadeus cassettes
+Record/replay transport for the Amadeus SDK's `http` option. In record mode
+every answered request is passed through to Amadeus and its response is
+appended, zlib-compressed, to a cassette; in replay mode responses are
+served from the cassette without any network I/O, so the app can run
+offline and without spending quota.
+
+A cassette is two files: `<path>.data`, the compressed responses one after
+another, and `<path>.idx`, a sorted array of fixed-size (key digest, offset,
+length) entries that is memory-mapped and binary-searched on lookup. While
+recording, the index is rewritten in batches rather than per response.
+
+Whether the app records or replays is AMADEUS_CASSETTE_MODE, read in
+resources.py, which builds the transport.
+
+Each response is indexed under one key per matching level, so the rule can
+be chosen at replay time:
+    exact         method, path, query and body as sent
+    ignore_dates  the same with every date / date-time value masked
+    fuzzy         only the location and hotel ID parameters, then any
+                  response recorded for the endpoint
+"""
+
+import atexit
+from email.message import Message
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.parse import parse_qsl, urlsplit
+import zlib
+
+from amadeustransport import _PooledResponse
+from telemetry import get_logger
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+AMADEUS_CASSETTE_PATH = os.getenv("AMADEUS_CASSETTE_PATH", os.path.join("cassettes", "amadeus"))
+AMADEUS_CASSETTE_MATCH = os.getenv("AMADEUS_CASSETTE_MATCH", "exact")  # exact | ignore_dates | fuzzy
+CASSETTE_FLUSH_EVERY = 64  # recordings between index rewrites (and always at exit)
+
+MATCH_LEVELS = ("exact", "ignore_dates", "fuzzy", "endpoint")
+# request parameters that still identify a search once everything else is ignored
+FUZZY_PARAMS = {"originLocationCode", "destinationLocationCode", "cityCode", "hotelIds"}
+TOKEN_PATH = "/v1/security/oauth2/token"
+
+_INDEX_MAGIC = b"AMCX\x00\x01"
+_ENTRY = struct.Struct(">16sQI")  # blake2b-128 key digest, data offset, compressed length
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}(T[\d:.]+)?$")
+
+log = get_logger("cassette")
+
+
+# ============================================================
+#  REQUEST KEYS
+# ============================================================
+
+def _mask_dates(value):
+    if isinstance(value, str):
+        return "*" if _DATE.match(value) else value
+    if isinstance(value, dict):
+        return {k: _mask_dates(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_mask_dates(v) for v in value]
+    return value
+
+
+def request_keys(method: str, url: str, body: bytes = None) -> list:
+    """
+    Digest of the request at each matching level, strictest first.
+    """
+    parts = urlsplit(url)
+    params = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    try:
+        payload = json.loads(body) if body else None
+    except ValueError:
+        payload = body.decode("utf8", "replace")
+
+    masked = [(k, _mask_dates(v)) for k, v in params]
+    shapes = (
+        (params, payload),
+        (masked, _mask_dates(payload)),
+        ([(k, v) for k, v in masked if k in FUZZY_PARAMS], None),
+        (None, None),
+    )
+    keys = []
+    for level, (query, data) in zip(MATCH_LEVELS, shapes):
+        canonical = json.dumps([level, method.upper(), parts.path, query, data], sort_keys=True, separators=(",", ":"))
+        keys.append(hashlib.blake2b(canonical.encode("utf8"), digest_size=16).digest())
+    return keys
+
+
+# ============================================================
+#  CASSETTE FILES
+# ============================================================
+
+class Cassette:
+    """
+    One cassette on disk. Lookups binary-search the memory-mapped index.
+    Recordings are appended to the data file straight away and kept in
+    memory until the index is rewritten, every `flush_every` recordings
+    and on flush() / close(); lookups see them in the meantime. Record from
+    one process at a time.
+    """
+
+    def __init__(self, path: str = AMADEUS_CASSETTE_PATH, flush_every: int = CASSETTE_FLUSH_EVERY):
+        self.data_path = path + ".data"
+        self.index_path = path + ".idx"
+        self.flush_every = flush_every
+        self._index = None    # mmap of the index file
+        self._data = None     # mmap of the data file
+        self._entries = None  # key -> (offset, length) of the whole index, only kept while recording
+        self._pending = {}    # key -> (offset, length) recorded since the index was last written
+        self._unflushed = 0   # recordings in _pending
+        self._lock = threading.Lock()
+        self._open()
+
+    def _close_maps(self):
+        for m in (self._index, self._data):
+            if m is not None:
+                m.close()
+        self._index = self._data = None
+
+    def _open(self):
+        self._close_maps()
+        if not os.path.exists(self.index_path) or not os.path.exists(self.data_path) \
+                or not os.path.getsize(self.data_path):
+            return
+        with open(self.index_path, "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.data_path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._index[:len(_INDEX_MAGIC)] != _INDEX_MAGIC:
+            raise ValueError(f"{self.index_path} is not a cassette index")
+
+    def __len__(self):
+        # entries in the index file, not counting recordings still pending
+        if self._index is None:
+            return 0
+        return (len(self._index) - len(_INDEX_MAGIC)) // _ENTRY.size
+
+    def _entry(self, i: int):
+        return _ENTRY.unpack_from(self._index, len(_INDEX_MAGIC) + i * _ENTRY.size)
+
+    def _lookup(self, key: bytes):
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(self):
+            return None
+        digest, offset, length = self._entry(lo)
+        return (offset, length) if digest == key else None
+
+    def _read(self, offset: int, length: int) -> bytes:
+        if self._data is not None and offset + length <= len(self._data):
+            return self._data[offset:offset + length]
+        # appended after the data file was mapped
+        with open(self.data_path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def find(self, key: bytes):
+        """
+        The recorded response for `key`, or None.
+        """
+        with self._lock:
+            location = self._pending.get(key) or self._lookup(key)
+            if location is None:
+                return None
+            frame = self._read(*location)
+        return json.loads(zlib.decompress(frame))
+
+    def add(self, keys: list, record: dict):
+        """
+        Append `record` and index it under `keys`; a later recording of the
+        same request replaces the earlier one.
+        """
+        frame = zlib.compress(json.dumps(record, separators=(",", ":")).encode("utf8"), 9)
+        with self._lock:
+            if os.path.dirname(self.data_path):
+                os.makedirs(os.path.dirname(self.data_path), exist_ok=True)
+            with open(self.data_path, "ab") as f:
+                offset = f.tell()
+                f.write(frame)
+            for key in keys:
+                self._pending[key] = (offset, len(frame))
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._write_index()
+
+    def flush(self):
+        """
+        Write pending recordings to the index file.
+        """
+        with self._lock:
+            if self._pending:
+                self._write_index()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._close_maps()
+
+    def _write_index(self):
+        if self._entries is None:
+            self._entries = {digest: (offset, length) for digest, offset, length in map(self._entry, range(len(self)))}
+        self._entries.update(self._pending)
+        tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_INDEX_MAGIC)
+            for key in sorted(self._entries):
+                f.write(_ENTRY.pack(key, *self._entries[key]))
+        # a file that is still mapped cannot be replaced on Windows
+        self._close_maps()
+        os.replace(tmp, self.index_path)
+        self._pending.clear()
+        self._unflushed = 0
+        self._open()
+
+
+# ============================================================
+#  TRANSPORT
+# ============================================================
+
+class CassetteTransport:
+    """
+    `urlopen`-compatible callable for the SDK's `http` option. `inner` is
+    the transport that reaches Amadeus while recording; it is never called
+    in replay mode.
+
+    Access tokens are never written to a cassette. In replay mode the token
+    request is answered with a placeholder token, and a request with no
+    recording gets a 404 in Amadeus' error format (a NotFoundError in the
+    SDK), so callers handle it like any other failed search.
+    """
+
+    def __init__(self, mode: str, path: str = AMADEUS_CASSETTE_PATH, match: str = AMADEUS_CASSETTE_MATCH, inner=None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"cassette mode must be 'record' or 'replay', not {mode!r}")
+        if match not in MATCH_LEVELS[:3]:
+            raise ValueError(f"cassette match must be one of {', '.join(MATCH_LEVELS[:3])}, not {match!r}")
+        self.mode = mode
+        self.match = match
+        self.inner = inner
+        self.cassette = Cassette(path)
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0, **{f"matched_{level}": 0 for level in MATCH_LEVELS}}
+        self._stats_lock = threading.Lock()
+        if mode == "record":
+            # recordings since the last batch would otherwise be missing from the index
+            atexit.register(self.cassette.flush)
+        elif not len(self.cassette):
+            log.warning("cassette_empty path=%s (every request will miss)", path)
+
+    @property
+    def levels(self):
+        # fuzzy also falls back to any response recorded for the endpoint
+        last = MATCH_LEVELS.index(self.match)
+        return MATCH_LEVELS[:last + 1] + (("endpoint",) if self.match == "fuzzy" else ())
+
+    def __call__(self, request):
+        method, url = request.get_method(), request.full_url
+        if urlsplit(url).path == TOKEN_PATH:
+            if self.mode == "record":
+                return self.inner(request)
+            return self._response(200, json.dumps({
+                "type": "amadeusOAuth2Token", "access_token": "replayed", "token_type": "Bearer", "expires_in": 1799,
+            }))
+
+        keys = request_keys(method, url, request.data)
+        if self.mode == "record":
+            return self._record(request, keys)
+        for level, key in zip(MATCH_LEVELS, keys):
+            if level not in self.levels:
+                continue
+            record = self.cassette.find(key)
+            if record is not None:
+                self._count("replayed", f"matched_{level}")
+                return self._response(record["status"], record["body"], record.get("content_type"))
+
+        self._count("misses")
+        log.warning("cassette_miss method=%s url=%s match=%s", method, url, self.match)
+        return self._response(404, json.dumps({"errors": [{
+            "status": 404, "code": 0, "title": "NOT RECORDED",
+            "detail": f"No recorded response for {method} {urlsplit(url).path} (match={self.match})",
+        }]}))
+
+    def _record(self, request, keys: list):
+        try:
+            response = self.inner(request)
+        except HTTPError as e:
+            response = e  # plain urlopen raises 4xx/5xx answers; they are recorded like any other
+        status = getattr(response, "status", None) or getattr(response, "code", None)
+        body = response.read()
+        content_type = response.info().get("Content-Type", "application/vnd.amadeus+json")
+        # throttling and server errors are not what the request would normally get
+        if status is not None and status < 500 and status != 429:
+            self.cassette.add(keys, {
+                "status": status,
+                "content_type": content_type,
+                "body": body.decode("utf8", "replace") if isinstance(body, bytes) else body,
+                "method": request.get_method(),
+                "url": request.full_url,
+                "recorded_at": time.time(),
+            })
+            self._count("recorded")
+        return self._response(status, body, content_type)
+
+    def _count(self, *names):
+        with self._stats_lock:
+            for name in names:
+                self.stats[name] += 1
+
+    @staticmethod
+    def _response(status: int, body, content_type: str = None):
+        headers = Message()
+        headers["Content-Type"] = content_type or "application/vnd.amadeus+json"
+        return _PooledResponse(status, headers, body.encode("utf8") if isinstance(body, str) else body)
@@ -0,0 +1,285 @@
+"""
+Amadeus transport
+A keep-alive connection pool that plugs into the SDK's `http` option in place
+of a fresh `urlopen` (and TLS handshake) per request, and an access token
+shared by all worker processes through a small SQLite table, refreshed a
+little before it expires.
+"""
+
+from email.message import Message
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from urllib.error import URLError
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+AMADEUS_POOL_SIZE = int(os.getenv("AMADEUS_POOL_SIZE", "10"))         # keep-alive connections per host
+AMADEUS_HTTP_TIMEOUT = float(os.getenv("AMADEUS_HTTP_TIMEOUT", "30"))  # seconds, connect + read
+AMADEUS_TOKEN_CACHE_PATH = os.getenv("AMADEUS_TOKEN_CACHE_PATH", os.path.join(".cache", "tokens.sqlite"))
+AMADEUS_TOKEN_REFRESH_AHEAD = int(os.getenv("AMADEUS_TOKEN_REFRESH_AHEAD", "120"))  # seconds before expiry
+TOKEN_MIN_VALIDITY = 10  # a token closer than this to expiry is never sent (the SDK's own buffer)
+TOKEN_CLAIM_SECONDS = AMADEUS_HTTP_TIMEOUT + 5  # a refresh claim older than this is abandoned (its fetch timed out)
+TOKEN_WAIT_POLL = 0.05   # seconds between checks while another process fetches the token
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    key TEXT PRIMARY KEY,
+    access_token TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    fetched_by INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS token_refreshes (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    claimed_until REAL NOT NULL
+);
+"""
+
+
+# ============================================================
+#  POOLED HTTP
+# ============================================================
+
+class _PooledResponse:
+    """
+    The parts of an `urlopen` response the SDK reads: status, headers
+    (via info()) and body.
+    """
+
+    __slots__ = ("status", "code", "_headers", "_body")
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.code = status
+        self._headers = headers
+        self._body = body
+
+    def info(self):
+        return self._headers
+
+    def read(self):
+        return self._body
+
+
+class PooledTransport:
+    """
+    `urlopen`-compatible callable backed by a urllib3 pool manager, so
+    connections are kept alive and reused between requests (and threads).
+    Connection failures are raised as URLError, which the SDK turns into a
+    NetworkError just like with its default transport.
+    """
+
+    def __init__(self, pool_size: int = AMADEUS_POOL_SIZE, timeout: float = AMADEUS_HTTP_TIMEOUT):
+        import urllib3
+
+        self._errors = (urllib3.exceptions.HTTPError,)
+        self.pool = urllib3.PoolManager(num_pools=4, maxsize=pool_size, block=False)
+        self.timeout = timeout
+        self.stats = {"requests": 0, "connections_opened": 0, "connections_reused": 0}
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        try:
+            response = self.pool.urlopen(
+                request.get_method(), request.full_url, body=request.data, headers=dict(request.header_items()),
+                retries=False, redirect=False, timeout=self.timeout, preload_content=False,
+            )
+            try:
+                self._count(response.connection)
+                body = response.read()
+            finally:
+                response.release_conn()
+        except self._errors as e:
+            raise URLError(e) from e
+
+        headers = Message()
+        for name, value in response.headers.items():
+            headers[name] = value
+        return _PooledResponse(response.status, headers, body)
+
+    def _count(self, connection):
+        served = getattr(connection, "_amadeus_requests", 0)
+        if connection is not None:
+            connection._amadeus_requests = served + 1
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["connections_reused" if served else "connections_opened"] += 1
+
+    def reuse_ratio(self) -> float:
+        requests = self.stats["requests"]
+        return self.stats["connections_reused"] / requests if requests else 0.0
+
+
+# ============================================================
+#  SHARED ACCESS TOKEN
+# ============================================================
+
+class SharedAccessToken:
+    """
+    Drop-in for the SDK's AccessToken (which each process would otherwise
+    fetch and keep for itself). Tokens are stored in SQLite keyed on host +
+    client id; whichever process needs a new one first claims the refresh,
+    fetches the token without holding the database's write lock, and
+    everyone else waits for it and picks it up from there.
+
+    A token within `refresh_ahead` seconds of expiry is refreshed by one
+    caller while the others keep using it, so requests never wait on a
+    token that is still valid.
+    """
+
+    def __init__(self, client, path: str = AMADEUS_TOKEN_CACHE_PATH,
+                 refresh_ahead: int = AMADEUS_TOKEN_REFRESH_AHEAD):
+        self.client = client
+        self.path = path
+        self.refresh_ahead = refresh_ahead
+        self.key = hashlib.sha256(f"{client.host}|{client.client_id}".encode("utf8")).hexdigest()
+        self.access_token = None
+        self.expires_at = 0.0
+        self.refresh_at = 0.0
+        self.stats = {"fetches": 0, "shared": 0, "refreshed_ahead": 0}
+        self._refresh_lock = threading.Lock()
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+        try:
+            os.chmod(path, 0o600)  # bearer tokens: owner only
+        except OSError:
+            pass
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # the SDK calls this for every authenticated request
+    def _bearer_token(self):
+        return f"Bearer {self._token()}"
+
+    def _refresh_time(self, fetched_at, expires_at):
+        # short-lived tokens are refreshed after half their lifetime at the latest
+        return expires_at - min(self.refresh_ahead, (expires_at - fetched_at) / 2)
+
+    def _token(self):
+        now = time.time()
+        if now < self.refresh_at:
+            return self.access_token
+
+        if now + TOKEN_MIN_VALIDITY < self.expires_at:
+            # still usable: one thread refreshes, the others carry on
+            if not self._refresh_lock.acquire(blocking=False):
+                return self.access_token
+            try:
+                if self._refresh(wait=False):
+                    self.stats["refreshed_ahead"] += 1
+            finally:
+                self._refresh_lock.release()
+            return self.access_token
+
+        with self._refresh_lock:
+            if time.time() + TOKEN_MIN_VALIDITY >= self.expires_at:
+                self._refresh()
+        return self.access_token
+
+    def _refresh(self, wait: bool = True) -> bool:
+        """
+        Take the shared token if another process refreshed it already,
+        otherwise fetch a new one and store it for everyone. While another
+        process is fetching, wait for its token, or with wait=False keep the
+        current (still valid) one and return False.
+        """
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        while True:
+            claim = self._claim(owner)
+            if claim is None:
+                break
+            if claim != "busy":
+                self.access_token, fetched_at, self.expires_at = claim
+                self.refresh_at = self._refresh_time(fetched_at, self.expires_at)
+                self.stats["shared"] += 1
+                return True
+            if not wait:
+                self.refresh_at = time.time() + 1.0  # look for the other process's token in a second
+                return False
+            time.sleep(TOKEN_WAIT_POLL)
+
+        # the network call runs outside any transaction
+        try:
+            data = self._fetch()
+        except BaseException:
+            self._conn().execute("DELETE FROM token_refreshes WHERE key = ? AND owner = ?", (self.key, owner))
+            raise
+        token = data.get("access_token")
+        fetched_at = time.time()
+        expires_at = fetched_at + data.get("expires_in", 0)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO tokens (key, access_token, fetched_at, expires_at, fetched_by)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (self.key, token, fetched_at, expires_at, os.getpid()),
+            )
+            conn.execute("DELETE FROM token_refreshes WHERE key = ? AND owner = ?", (self.key, owner))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.access_token, self.expires_at = token, expires_at
+        self.refresh_at = self._refresh_time(fetched_at, expires_at)
+        self.stats["fetches"] += 1
+        return True
+
+    def _claim(self, owner: str):
+        """
+        In one short write transaction: the stored token row if it is newer
+        than ours and not yet due, "busy" if another process is fetching,
+        otherwise None after claiming the refresh for `owner`.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT access_token, fetched_at, expires_at FROM tokens WHERE key = ?", (self.key,)
+            ).fetchone()
+            if row is not None and row[0] != self.access_token and now < self._refresh_time(row[1], row[2]):
+                conn.execute("COMMIT")
+                return row
+            claim = conn.execute(
+                "SELECT owner, claimed_until FROM token_refreshes WHERE key = ?", (self.key,)
+            ).fetchone()
+            if claim is not None and claim[0] != owner and now < claim[1]:
+                conn.execute("COMMIT")
+                return "busy"
+            conn.execute(
+                "INSERT OR REPLACE INTO token_refreshes (key, owner, claimed_until) VALUES (?, ?, ?)",
+                (self.key, owner, now + TOKEN_CLAIM_SECONDS),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return None
+
+    def _fetch(self) -> dict:
+        response = self.client._unauthenticated_request(
+            "POST",
+            "/v1/security/oauth2/token",
+            {
+                "grant_type": "client_credentials",
+                "client_id": self.client.client_id,
+                "client_secret": self.client.client_secret,
+            },
+        )
+        return response.result or {}
@@ -0,0 +1,255 @@
+"""
+Batch search runner
+Runs flight/hotel searches from a JSONL file (or stdin) without the UI and
+writes one normalized JSON result per line as each search finishes.
+
+Input lines look like:
+    {"id": "cgk-ams", "type": "flight", "origin": "CGK", "destination": "AMS", "departure_date": "+30"}
+    {"id": "ams-hotels", "type": "hotel", "city_code": "AMS", "check_in": "+30", "check_out": "+33", "rating": 4}
+Dates are YYYY-MM-DD or "+N" for N days from today, so a routes file can be
+re-run on later days without editing it.
+
+Usage:
+    python batchsearch.py routes.jsonl -o results.jsonl --workers 4 --rate 2 --checkpoint routes.ckpt
+    cat routes.jsonl | python batchsearch.py - > results.jsonl
+"""
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import ExitStack
+from datetime import date, timedelta
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from amadeuscaller import search_flights, search_hotels
+
+
+# ============================================================
+#  RATE LIMITING
+# ============================================================
+
+class MinIntervalLimiter:
+    """
+    Spaces request starts at least 1/rate seconds apart across all workers.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + self.interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
+# ============================================================
+#  REQUESTS
+# ============================================================
+
+def _normalize_flight(offer: dict):
+    segments = offer["itineraries"][0]["segments"]
+    first_leg, last_leg = segments[0], segments[-1]
+    return {
+        "airline": first_leg["carrierCode"],
+        "origin": first_leg["departure"]["iataCode"],
+        "destination": last_leg["arrival"]["iataCode"],
+        "departure_at": first_leg["departure"]["at"],
+        "arrival_at": last_leg["arrival"]["at"],
+        "stops": len(segments) - 1,
+        "price": float(offer["price"]["total"]),
+        "currency": offer["price"]["currency"],
+    }
+
+
+def resolve_date(value):
+    """
+    "+N" as the ISO date N days from today; anything else unchanged.
+    """
+    if isinstance(value, str) and value.startswith("+") and value[1:].isdigit():
+        return (date.today() + timedelta(days=int(value[1:]))).isoformat()
+    return value
+
+
+def run_request(request: dict, fresh: bool = False):
+    """
+    Run one batch request and return its normalized results list.
+    """
+    kind = request.get("type", "flight")
+    if kind == "flight":
+        offers = search_flights(
+            origin=request["origin"],
+            destination=request["destination"],
+            departure_date=resolve_date(request["departure_date"]),
+            adults=request.get("adults", 1),
+            max_results=request.get("max_results", 5),
+            fresh=fresh,
+        )
+        return [_normalize_flight(offer) for offer in offers or []]
+    if kind == "hotel":
+        offers = search_hotels(
+            city_code=request["city_code"],
+            check_in=resolve_date(request["check_in"]),
+            check_out=resolve_date(request["check_out"]),
+            radius_km=request.get("radius_km", 20),
+            rating=request.get("rating"),
+            fresh=fresh,
+        )
+        return list(offers or [])
+    raise ValueError(f"Unknown request type: {kind}")
+
+
+def _read_requests(stream, done_ids: set, counts: dict):
+    """
+    Lazily parse input lines, skipping blanks and already completed ids
+    (counted in counts["skipped"]).
+    """
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield str(line_no), None, e
+            continue
+        request_id = str(request.get("id", line_no))
+        if request_id in done_ids:
+            counts["skipped"] += 1
+            continue
+        yield request_id, request, None
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# ============================================================
+#  RUNNER
+# ============================================================
+
+def run_batch(stream, out, workers: int = 4, rate: float = 0.0, checkpoint_path: str = None, fresh: bool = False):
+    """
+    Run every request from `stream` on a bounded worker pool, writing results
+    to `out` as they complete. At most 2 x workers requests are held in
+    memory at once. Completed ids are appended to `checkpoint_path`, and ids
+    already listed there are skipped. Returns a summary dict.
+    """
+    done_ids = set()
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf8") as f:
+            done_ids = {line.strip() for line in f if line.strip()}
+    checkpoint = open(checkpoint_path, "a", encoding="utf8") if checkpoint_path else None
+
+    limiter = MinIntervalLimiter(rate)
+    latencies = []
+    counts = {"ok": 0, "failed": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    def work(request_id, request):
+        limiter.wait()
+        t0 = time.perf_counter()
+        try:
+            results = run_request(request, fresh=fresh)
+            error = None
+        except Exception as e:
+            results, error = [], e
+        return request_id, request, results, error, time.perf_counter() - t0
+
+    def emit(request_id, request, results, error, latency):
+        record = {
+            "id": request_id,
+            "type": (request or {}).get("type", "flight"),
+            "ok": error is None,
+            "latency_ms": round(latency * 1000, 1),
+            "count": len(results),
+            "results": results,
+        }
+        if error is not None:
+            record["error"] = str(error)
+            counts["failed"] += 1
+        else:
+            counts["ok"] += 1
+        if request is not None:
+            latencies.append(latency)
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+        if checkpoint is not None and error is None:
+            checkpoint.write(request_id + "\n")
+            checkpoint.flush()
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+    pending = set()
+    try:
+        for request_id, request, parse_error in _read_requests(stream, done_ids, counts):
+            if parse_error is not None:
+                emit(request_id, None, [], parse_error, 0.0)
+                continue
+            pending.add(pool.submit(work, request_id, request))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    emit(*future.result())
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                emit(*future.result())
+    finally:
+        pool.shutdown(wait=True)
+        if checkpoint is not None:
+            checkpoint.close()
+
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    processed = counts["ok"] + counts["failed"]
+    return {
+        "processed": processed,
+        "ok": counts["ok"],
+        "failed": counts["failed"],
+        "skipped": counts["skipped"],
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(processed / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "latency_p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "latency_max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Amadeus flight/hotel searches from a JSONL file.")
+    parser.add_argument("input", help="JSONL file with one search per line, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent searches")
+    parser.add_argument("--rate", type=float, default=0.0, help="max searches started per second (0 = unlimited)")
+    parser.add_argument("--checkpoint", help="file of completed ids; completed ids are skipped on restart")
+    parser.add_argument("--fresh", action="store_true", help="bypass the search cache")
+    args = parser.parse_args(argv)
+
+    # append on resume so earlier results are kept
+    mode = "a" if args.checkpoint and os.path.exists(args.checkpoint) else "w"
+    with ExitStack() as files:
+        stream = sys.stdin if args.input == "-" else files.enter_context(open(args.input, encoding="utf8"))
+        out = sys.stdout if args.output == "-" else files.enter_context(open(args.output, mode, encoding="utf8"))
+
+        # progress is logged to stderr (telemetry.get_logger), so stdout is only JSONL
+        summary = run_batch(stream, out, workers=args.workers, rate=args.rate,
+                            checkpoint_path=args.checkpoint, fresh=args.fresh)
+
+    print(json.dumps(summary), file=sys.stderr)
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,461 @@
+"""
+Benchmarks
+Runs the app's search, itinerary and rendering paths against the local fake
+upstream (fakeupstream.py, started here on a free port) and prints the
+results as JSON, so runs before and after a change can be compared.
+
+Run with:  python benchmark.py [--scenarios single_search,throughput] [-o after.json] [--compare before.json]
+
+Scenarios:
+    single_search   latency of one fresh flight / hotel search, and of a cached one
+    throughput      concurrent sessions each running the "Generate Travel Plan" searches
+    itinerary       time to first token and total time of streamed itineraries
+    grounding       prompt size and itinerary latency without / with compact / with full-JSON search results
+    memory          memory held per Streamlit session after a search
+    render          Streamlit rerun time with large result sets
+
+All state (caches, ledgers, rate-limit buckets) goes to a temporary
+directory. Client-side rate limits are lifted unless --limits sandbox is
+given, so the numbers show the code rather than the limiter.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+import gc
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_VERSION = 1
+
+ROUTES = [("CGK", "AMS"), ("CGK", "SIN"), ("LHR", "JFK"), ("CDG", "NRT"), ("SYD", "LAX"),
+          ("FRA", "DXB"), ("MAD", "GRU"), ("AMS", "BCN"), ("SIN", "HND"), ("YYZ", "LHR")]
+
+
+# ============================================================
+#  HELPERS
+# ============================================================
+
+def percentile(values, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+def latency_metrics(prefix: str, seconds: list) -> dict:
+    ms = [s * 1000 for s in seconds]
+    return {
+        f"{prefix}_p50_ms": round(percentile(ms, 0.5), 2),
+        f"{prefix}_p95_ms": round(percentile(ms, 0.95), 2),
+        f"{prefix}_max_ms": round(max(ms), 2),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def trip_dates(offset: int = 0):
+    departure = date.today() + timedelta(days=30 + offset)
+    return departure.isoformat(), (departure + timedelta(days=4)).isoformat()
+
+
+class FakeUpstream:
+    """
+    fakeupstream.py in a child process, so its event loop does not compete
+    with the code under test for the GIL.
+    """
+
+    def __init__(self, args):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        command = [sys.executable, os.path.join(HERE, "fakeupstream.py"), "--port", str(self.port),
+                   "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate),
+                   "--throttle-rate", str(args.throttle_rate), "--gemini-ttft-ms", str(args.gemini_ttft_ms)]
+        self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        deadline = time.time() + 15
+        while True:
+            try:
+                self.config = self.request("GET", "/_fake/config")
+                break
+            except OSError:
+                if time.time() > deadline or self.process.poll() is not None:
+                    self.close()
+                    raise RuntimeError("fake upstream did not start")
+                time.sleep(0.1)
+
+    def request(self, method: str, path: str, payload: dict = None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        with urllib.request.urlopen(urllib.request.Request(self.url + path, data=data, method=method), timeout=5) as r:
+            body = r.read()
+        return json.loads(body) if body else None
+
+    def configure(self, **update):
+        self.config = self.request("PUT", "/_fake/config", update)
+
+    def stats(self) -> dict:
+        return self.request("GET", "/_fake/stats")
+
+    def reset_stats(self):
+        self.request("DELETE", "/_fake/stats")
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait(timeout=5)
+
+
+def configure_environment(upstream: FakeUpstream, workdir: str):
+    """
+    Point the app at the fake upstream and keep all of its state in
+    `workdir`. Must run before the app modules are imported.
+    """
+    os.environ.pop("TRAVEL_API_URL", None)
+    os.environ.update({
+        "AMADEUS_BASE_URL": upstream.url,
+        "GOOGLE_GEMINI_BASE_URL": upstream.url,
+        "AMADEUS_API_KEY": "benchmark",
+        "AMADEUS_API_SECRET": "benchmark",
+        "GOOGLE_API_KEY": "benchmark",
+        "AMADEUS_CACHE_BACKEND": "memory",
+        "TRAVEL_LOG_LEVEL": "WARNING",
+    })
+    for name, filename in (("AMADEUS_CACHE_PATH", "cache.sqlite"), ("AMADEUS_TOKEN_CACHE_PATH", "tokens.sqlite"),
+                           ("BOOKING_LEDGER_PATH", "bookings.sqlite"), ("HOTEL_STORE_PATH", "hotels.sqlite"),
+                           ("ITINERARY_CACHE_PATH", "itineraries.sqlite"), ("PRICE_WATCH_PATH", "pricewatch.sqlite"),
+                           ("RATE_LIMIT_PATH", "ratelimits.sqlite"), ("SINGLEFLIGHT_PATH", "singleflight.sqlite")):
+        os.environ[name] = os.path.join(workdir, filename)
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+
+
+# ============================================================
+#  SCENARIOS
+# ============================================================
+
+def single_search(ctx) -> dict:
+    from amadeuscaller import search_flights, search_hotels
+
+    n = ctx.args.repeat
+    flights, hotels, cached = [], [], []
+    search_hotels("AMS", *trip_dates(), fresh=True)  # fills the hotel reference store once
+    for i in range(n):
+        departure, ret = trip_dates(i)
+        flights.append(timed(search_flights, "CGK", "AMS", departure, max_results=10, fresh=True)[0])
+        hotels.append(timed(search_hotels, "AMS", departure, ret, fresh=True)[0])
+        cached.append(timed(search_flights, "CGK", "AMS", departure, max_results=10)[0])
+    return {
+        **latency_metrics("flight_search", flights),
+        **latency_metrics("hotel_search", hotels),
+        **latency_metrics("cached_flight_search", cached),
+        "upstream_latency_ms": ctx.upstream.config["amadeus"]["latency_ms"],
+    }
+
+
+def throughput(ctx) -> dict:
+    from amadeuscaller import search_flights, search_hotels
+    from orchestrator import run_concurrently
+    from ratelimiter import action_budget
+    from searchcache import response_cache
+    from singleflight import single_flight
+
+    sessions, rounds = ctx.args.sessions, ctx.args.rounds
+    ctx.upstream.reset_stats()
+    hits_before = dict(response_cache.stats)
+    coalesced_before = single_flight.stats["coalesced"]
+
+    def session(number):
+        durations, failures = [], 0
+        for i in range(rounds):
+            # sessions share a small pool of routes and dates, like real traffic
+            route = (number + i) % len(ROUTES)
+            origin, destination = ROUTES[route]
+            departure, ret = trip_dates(route % 3)
+            branches = {
+                "flights": (search_flights, dict(origin=origin, destination=destination, departure_date=departure,
+                                                 max_results=5), 30),
+                "hotels": (search_hotels, dict(city_code=destination, check_in=departure, check_out=ret), 45),
+            }
+            started = time.perf_counter()
+            with action_budget(20):
+                failures += sum(error is not None for _, _, error, _ in run_concurrently(branches))
+            durations.append(time.perf_counter() - started)
+        return durations, failures
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = list(pool.map(session, range(sessions)))
+    elapsed = time.perf_counter() - started
+
+    durations = [d for session_durations, _ in results for d in session_durations]
+    served = sum(response_cache.stats[k] - hits_before[k] for k in ("hits", "stale_hits"))
+    misses = response_cache.stats["misses"] - hits_before["misses"]
+    upstream = ctx.upstream.stats()
+    return {
+        "sessions": sessions,
+        "actions": len(durations),
+        "actions_per_s": round(len(durations) / elapsed, 2),
+        **latency_metrics("action", durations),
+        "failed_searches": sum(failures for _, failures in results),
+        "cache_hit_ratio": round(served / (served + misses), 3) if served + misses else 0.0,
+        "coalesced_searches": single_flight.stats["coalesced"] - coalesced_before,
+        "upstream_requests": sum(upstream["requests"].values()),
+        "upstream_429s": sum(upstream["throttled"].values()),
+        "upstream_errors": sum(upstream["errors"].values()),
+    }
+
+
+def itinerary(ctx) -> dict:
+    from itinerary import ItineraryStream
+    from resources import get_planner
+
+    ttft, total, chunks = [], [], []
+    for i in range(max(3, ctx.args.repeat // 2)):
+        stream = ItineraryStream(get_planner(), f"Create a cultural itinerary for trip {i} to AMS")
+        for _ in stream:
+            pass
+        ttft.append(stream.metrics["ttft_s"])
+        total.append(stream.metrics["total_s"])
+        chunks.append(stream.metrics["chunks"])
+    return {
+        **latency_metrics("first_token", ttft),
+        **latency_metrics("itinerary_total", total),
+        "chunks_per_itinerary": round(sum(chunks) / len(chunks), 1),
+        "upstream_ttft_ms": ctx.upstream.config["gemini"]["latency_ms"],
+    }
+
+
+def grounding(ctx) -> dict:
+    from amadeuscaller import search_flights, search_hotels
+    from grounding import grounded_prompt
+    from itinerary import ItineraryStream
+    from offermodels import parse_flight_offers, parse_hotel_offers
+    from resources import get_planner
+
+    departure, ret = trip_dates()
+    flights = parse_flight_offers(search_flights("CGK", "AMS", departure, max_results=100))
+    hotels = parse_hotel_offers(search_hotels("AMS", departure, ret))
+    metrics = {"flight_results": len(flights), "hotel_results": len(hotels)}
+    for mode in ("none", "compact", "json"):
+        ttft, total = [], []
+        for i in range(max(3, ctx.args.repeat // 4)):
+            prompt, stats = grounded_prompt(f"Create a cultural itinerary for trip {i} to AMS", mode, flights, hotels)
+            stream = ItineraryStream(get_planner(), prompt)
+            for _ in stream:
+                pass
+            ttft.append(stream.metrics["ttft_s"])
+            total.append(stream.metrics["total_s"])
+        metrics[f"{mode}_prompt_tokens"] = stats["prompt_tokens"]
+        metrics.update(latency_metrics(f"{mode}_first_token", ttft))
+        metrics.update(latency_metrics(f"{mode}_itinerary_total", total))
+    return metrics
+
+
+def _app_session(at_class, departure, ret):
+    at = at_class.from_file(os.path.join(HERE, "travelagent.py"), default_timeout=120).run()
+    at.date_input[0].set_value(departure)
+    at.date_input[1].set_value(ret)
+    next(b for b in at.button if b.label.startswith("🚀")).click().run()
+    return at
+
+
+def memory(ctx) -> dict:
+    from streamlit.testing.v1 import AppTest
+    from amadeuscaller import search_flights, search_hotels
+    from offermodels import parse_flight_offers, parse_hotel_offers
+
+    departure, ret = trip_dates()
+    keep = [_app_session(AppTest, departure, ret)]  # warm-up: imports, caches, hotel store
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for _ in range(ctx.args.app_sessions):
+        keep.append(_app_session(AppTest, departure, ret))
+    gc.collect()
+    per_session = (tracemalloc.get_traced_memory()[0] - baseline) / ctx.args.app_sessions
+
+    # the parsed results each session keeps in st.session_state
+    raw_flights = search_flights("CGK", "AMS", departure, max_results=5)
+    raw_hotels = search_hotels("AMS", departure, ret)
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    parsed = (parse_flight_offers(raw_flights), parse_hotel_offers(raw_hotels))
+    results_size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del keep, parsed
+    return {
+        "app_sessions": ctx.args.app_sessions,
+        "per_session_kb": round(per_session / 1024, 1),
+        "session_results_kb": round(results_size / 1024, 1),
+    }
+
+
+def render(ctx) -> dict:
+    from streamlit.testing.v1 import AppTest
+    from amadeuscaller import iter_hotel_offers, search_flights
+    from offermodels import parse_flight_offers, parse_hotel_offers
+
+    departure, ret = trip_dates()
+    flights = parse_flight_offers(search_flights("CGK", "AMS", departure, max_results=ctx.args.result_flights))
+    hotel_ids = [f"FKAMS{i:03d}" for i in range(ctx.args.result_hotels)]
+    hotels = parse_hotel_offers([offer for chunk in iter_hotel_offers(hotel_ids, departure, ret) for offer in chunk])
+
+    at = AppTest.from_file(os.path.join(HERE, "travelagent.py"), default_timeout=120).run()
+    empty = [timed(at.run)[0] for _ in range(ctx.args.repeat // 4 + 2)]
+    at.session_state.flight_results = flights
+    at.session_state.hotel_results = hotels
+    full = [timed(at.run)[0] for _ in range(ctx.args.repeat // 4 + 2)]
+    return {
+        "flight_results": len(flights),
+        "hotel_results": len(hotels),
+        **latency_metrics("rerun_empty", empty),
+        **latency_metrics("rerun_large_results", full),
+    }
+
+
+SCENARIOS = {
+    "single_search": single_search,
+    "throughput": throughput,
+    "itinerary": itinerary,
+    "grounding": grounding,
+    "memory": memory,
+    "render": render,
+}
+
+
+# ============================================================
+#  COMPARISON
+# ============================================================
+
+def better_direction(metric: str):
+    """
+    +1 if higher is better, -1 if lower is better, None for counts,
+    maxima and settings that are not compared.
+    """
+    if metric.endswith(("_per_s", "_ratio")):
+        return 1
+    if metric.endswith("_max_ms") or metric.startswith("upstream_"):
+        return None  # single samples are too noisy; upstream settings are not results
+    if metric.endswith(("_ms", "_kb", "_tokens")):
+        return -1
+    return None
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    rows = []
+    for scenario, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(scenario, {}).get("metrics", {})
+        for metric, value in result.get("metrics", {}).items():
+            direction = better_direction(metric)
+            old = before.get(metric)
+            if direction is None or not isinstance(old, (int, float)) or not isinstance(value, (int, float)):
+                continue
+            change = (value - old) / old * 100 if old else 0.0
+            rows.append({
+                "scenario": scenario, "metric": metric, "before": old, "after": value,
+                "change_pct": round(change, 1),
+                "regression": change * direction < -threshold,
+            })
+    return rows
+
+
+# ============================================================
+#  CLI
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the travel planner against a local fake Amadeus/Gemini.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("-o", "--output", default="-", help="JSON results file (default: stdout)")
+    parser.add_argument("--compare", help="earlier results file; regressions beyond --threshold exit with status 1")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent (default: 10)")
+    parser.add_argument("--repeat", type=int, default=20, help="samples per latency measurement")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions in the throughput scenario")
+    parser.add_argument("--rounds", type=int, default=5, help="searches per session in the throughput scenario")
+    parser.add_argument("--app-sessions", type=int, default=5, help="Streamlit sessions in the memory scenario")
+    parser.add_argument("--result-flights", type=int, default=250)
+    parser.add_argument("--result-hotels", type=int, default=400)
+    parser.add_argument("--limits", choices=("off", "sandbox"), default="off",
+                        help="client-side rate limits: lifted (default) or as configured for the sandbox")
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--gemini-ttft-ms", type=float, default=400)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix="travel-bench-")
+    upstream = FakeUpstream(args)
+    try:
+        configure_environment(upstream, workdir)
+        from ratelimiter import rate_limiter
+        if args.limits == "off":
+            for key in list(rate_limiter.limits):
+                rate_limiter.limits[key] = (1e6, 1e6)
+
+        ctx = argparse.Namespace(args=args, upstream=upstream)
+        results = {}
+        for name in names:
+            print(f"running {name}...", file=sys.stderr, flush=True)
+            elapsed, metrics = timed(SCENARIOS[name], ctx)
+            results[name] = {"seconds": round(elapsed, 2), "metrics": metrics}
+    finally:
+        upstream.close()
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    report = {
+        "schema": SCHEMA_VERSION,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": results,
+    }
+
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding="utf8") as f:
+            rows = compare(json.load(f), report, args.threshold)
+        report["comparison"] = {"baseline": args.compare, "threshold_pct": args.threshold, "metrics": rows}
+        for row in rows:
+            flag = "  REGRESSION" if row["regression"] else ""
+            print(f"{row['scenario']:>14} {row['metric']:<32} {row['before']:>10} -> {row['after']:>10} "
+                  f"({row['change_pct']:+.1f}%){flag}", file=sys.stderr)
+        status = 1 if any(row["regression"] for row in rows) else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf8") as f:
+            f.write(text + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
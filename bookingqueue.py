@@ -0,0 +1,419 @@
+"""
+Booking queue
+Bookings run on a background worker pool instead of inside the Streamlit
+script. Every job is recorded in a durable SQLite ledger; the UI submits a
+job, then only polls the ledger for status changes.
+
+Job states: queued -> repricing (claimed) -> booking -> booked
+            (or failed / price_changed / interrupted)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from amadeuscaller import book_flight, book_hotel, price_flight_offer, check_hotel_offer
+from telemetry import get_logger
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+BOOKING_LEDGER_PATH = os.getenv("BOOKING_LEDGER_PATH", os.path.join(".cache", "bookings.sqlite"))
+BOOKING_WORKERS = int(os.getenv("BOOKING_WORKERS", "2"))
+PRICE_TOLERANCE = 0.01  # price differences below this are not treated as a change
+STALE_AFTER = 600  # seconds without progress before an active job is treated as abandoned
+RECLAIM_INTERVAL = 60  # seconds between sweeps for abandoned jobs while running
+
+log = get_logger("bookings")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookings (
+    seq INTEGER NOT NULL,
+    job_id TEXT PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    title TEXT,
+    price TEXT,
+    payload TEXT NOT NULL,
+    reprice INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    claim_token TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookings_session_seq ON bookings (session_id, seq);
+"""
+
+FINAL_STATES = ("booked", "failed", "price_changed", "interrupted")
+
+
+def idempotency_key(session_id: str, kind: str, payload) -> str:
+    """
+    Same session + same offer -> same key, so a double-clicked Book button
+    maps onto the job that already exists.
+    """
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{session_id}|{kind}|{body}".encode("utf8")).hexdigest()
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ============================================================
+#  QUEUE
+# ============================================================
+
+class BookingQueue:
+
+    def __init__(self, path: str = BOOKING_LEDGER_PATH, workers: int = BOOKING_WORKERS):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="booking")
+        self._reclaimer = None
+        self._active = {}  # job_id -> claim token of the jobs this process is working on
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        if "claim_token" not in {row[1] for row in conn.execute("PRAGMA table_info(bookings)")}:
+            conn.execute("ALTER TABLE bookings ADD COLUMN claim_token TEXT")  # ledgers from before claim tokens
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # ---------- ledger ----------
+
+    def _update(self, job_id: str, token: str = None, from_status: str = None, **fields) -> bool:
+        """
+        Change a job and give it a new sequence number, so incremental
+        readers pick the change up. With `token` (and `from_status`) the
+        change is a compare-and-set: it only applies while the job is still
+        claimed with that token (and in that status). Returns whether it
+        applied.
+        """
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        where, params = " WHERE job_id = ?", [job_id]
+        if token is not None:
+            where, params = where + " AND claim_token = ?", params + [token]
+        if from_status is not None:
+            where, params = where + " AND status = ?", params + [from_status]
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                changed = conn.execute(
+                    f"UPDATE bookings SET {columns}, seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM bookings)" + where,
+                    list(fields.values()) + params,
+                ).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return changed == 1
+
+    def _claim(self, job_id: str):
+        """
+        Atomically move a queued job to "repricing", so only one worker (in
+        any process) handles it. Returns the claim token the worker's
+        later changes must carry, or None if the job was not queued.
+        """
+        token = uuid.uuid4().hex
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                claimed = conn.execute(
+                    "UPDATE bookings SET status = 'repricing', claim_token = ?, updated_at = ?,"
+                    " seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM bookings)"
+                    " WHERE job_id = ? AND status = 'queued'",
+                    (token, time.time(), job_id),
+                ).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return token if claimed == 1 else None
+
+    def _heartbeat(self):
+        """
+        Mark the jobs this process is working on as alive, so a slow
+        pricing or booking call is not reclaimed as abandoned.
+        """
+        now = time.time()
+        with self._write_lock:
+            if self._active:
+                self._conn().executemany(
+                    "UPDATE bookings SET updated_at = ? WHERE job_id = ? AND claim_token = ?",
+                    [(now, job_id, token) for job_id, token in self._active.items()],
+                )
+
+    def _load(self, job_id: str):
+        conn = self._conn()
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute("SELECT * FROM bookings WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.row_factory = None
+        return dict(row) if row else None
+
+    def changes_since(self, session_id: str, seq: int = 0) -> list:
+        """
+        Jobs of `session_id` created or changed after sequence `seq`,
+        oldest change first (without payloads).
+        """
+        rows = self._conn().execute(
+            "SELECT seq, job_id, kind, title, price, status, result, error, created_at FROM bookings"
+            " WHERE session_id = ? AND seq > ? ORDER BY seq",
+            (session_id, seq),
+        ).fetchall()
+        return [
+            {"seq": r[0], "job_id": r[1], "kind": r[2], "title": r[3], "price": r[4], "status": r[5],
+             "result": json.loads(r[6]) if r[6] else None, "error": r[7], "created_at": r[8]}
+            for r in rows
+        ]
+
+    def status(self, job_id: str):
+        job = self._load(job_id)
+        if job is None:
+            return None
+        job.pop("payload", None)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    # ---------- submission ----------
+
+    def submit(self, session_id: str, kind: str, payload, title: str = None, price: str = None,
+               reprice: bool = True, key: str = None) -> str:
+        """
+        Queue a booking and return its job id. Submitting the same offer
+        again from the same session returns the existing job instead of
+        creating a second order.
+        """
+        key = key or idempotency_key(session_id, kind, payload)
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = conn.execute("SELECT job_id FROM bookings WHERE idempotency_key = ?", (key,)).fetchone()
+                if existing is None:
+                    conn.execute(
+                        "INSERT INTO bookings (seq, job_id, idempotency_key, session_id, kind, title, price, payload,"
+                        " reprice, status, created_at, updated_at)"
+                        " VALUES ((SELECT COALESCE(MAX(seq), 0) + 1 FROM bookings), ?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?)",
+                        (job_id, key, session_id, kind, title, price, json.dumps(payload), int(reprice), now, now),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if existing is not None:
+            # a failed attempt may be retried; anything else is a duplicate
+            self._requeue(existing[0], from_status="failed")
+            return existing[0]
+        self._pool.submit(self._process, job_id)
+        return job_id
+
+    def accept_price_change(self, job_id: str) -> bool:
+        """
+        Book a job that stopped at "price_changed" at the new price.
+        """
+        return self._requeue(job_id, from_status="price_changed", reprice=False)
+
+    def _requeue(self, job_id: str, from_status: str, reprice: bool = None) -> bool:
+        job = self._load(job_id)
+        if job is None or job["status"] != from_status:
+            return False
+        fields = {"status": "queued", "claim_token": None, "error": None, "result": None}
+        if reprice is not None:
+            fields["reprice"] = int(reprice)
+        self._update(job_id, **fields)
+        self._pool.submit(self._process, job_id)
+        return True
+
+    def submit_flight(self, session_id: str, flight_offer: dict, title: str = None, price: str = None,
+                      reprice: bool = True) -> str:
+        return self.submit(session_id, "flight", flight_offer, title=title, price=price, reprice=reprice)
+
+    def submit_hotel(self, session_id: str, hotel_offer_id: str | None, hotel_name: str = None, price: str = None,
+                     display_price: str = None, reprice: bool = True) -> str:
+        if not hotel_offer_id:
+            raise ValueError("This hotel offer has no offer ID and cannot be booked")
+        return self.submit(session_id, "hotel", {"offer_id": hotel_offer_id, "price": price},
+                           title=hotel_name, price=display_price or price, reprice=reprice)
+
+    # ---------- workers ----------
+
+    def _process(self, job_id: str):
+        token = self._claim(job_id)
+        if token is None:
+            return
+        with self._write_lock:
+            self._active[job_id] = token
+        job = self._load(job_id)
+        payload = json.loads(job["payload"])
+        try:
+            if job["kind"] == "flight":
+                self._book_flight(job, payload)
+            else:
+                self._book_hotel(job, payload)
+        except Exception as e:
+            self._update(job_id, token, status="failed", error=str(e) or e.__class__.__name__)
+        finally:
+            with self._write_lock:
+                self._active.pop(job_id, None)
+
+    def _book_flight(self, job, offer):
+        job_id, token = job["job_id"], job["claim_token"]
+        if job["reprice"]:
+            priced = price_flight_offer(offer)
+            if priced is None:
+                self._update(job_id, token, status="failed", error="Offer is no longer available")
+                return
+            old = _to_float(offer.get("price", {}).get("total"))
+            new = _to_float(priced.get("price", {}).get("total"))
+            if old is not None and new is not None and abs(new - old) >= PRICE_TOLERANCE:
+                self._update(job_id, token, status="price_changed", result=json.dumps({"old_price": old, "new_price": new}),
+                             error=f"Price changed from {old} to {new}")
+                return
+            offer = priced
+
+        if not self._update(job_id, token, from_status="repricing", status="booking"):
+            return  # reclaimed while repricing; whoever claimed it since books it
+        order = book_flight(offer)
+        if not order:
+            self._update(job_id, token, status="failed", error="Flight booking failed")
+            return
+        self._update(job_id, token, status="booked", result=json.dumps(order))
+
+    def _book_hotel(self, job, payload):
+        job_id, token = job["job_id"], job["claim_token"]
+        offer_id = payload["offer_id"]
+        if job["reprice"]:
+            current = check_hotel_offer(offer_id)
+            if not current:
+                self._update(job_id, token, status="failed", error="Offer is no longer available")
+                return
+            offers = current.get("offers") or [{}]
+            old = _to_float(payload.get("price"))
+            new = _to_float(offers[0].get("price", {}).get("base"))
+            if old is not None and new is not None and abs(new - old) >= PRICE_TOLERANCE:
+                self._update(job_id, token, status="price_changed", result=json.dumps({"old_price": old, "new_price": new}),
+                             error=f"Price changed from {old} to {new}")
+                return
+
+        if not self._update(job_id, token, from_status="repricing", status="booking"):
+            return  # reclaimed while repricing; whoever claimed it since books it
+        order = book_hotel(offer_id)
+        if not order:
+            self._update(job_id, token, status="failed", error="Hotel booking failed")
+            return
+        self._update(job_id, token, status="booked", result=json.dumps(order))
+
+    def _recover(self):
+        """
+        After a restart: abandoned jobs are reclaimed and every queued job
+        is resubmitted.
+        """
+        self.reclaim_stale()
+        for (job_id,) in self._conn().execute("SELECT job_id FROM bookings WHERE status = 'queued'").fetchall():
+            self._pool.submit(self._process, job_id)
+
+    def reclaim_stale(self, max_age: float = STALE_AFTER) -> int:
+        """
+        Recover jobs that made no progress for `max_age` seconds, e.g.
+        because the process working on them died. A job that never reached
+        the order call is queued again; one that was mid-booking may or may
+        not have an order, so it is flagged for manual checking instead.
+        Queued jobs left behind by another process are picked up here too.
+        Live workers heartbeat their jobs, so only dead ones go stale; a
+        worker whose job was reclaimed anyway stops at its next
+        compare-and-set. Returns the number of jobs reclaimed.
+        """
+        self._heartbeat()
+        now = time.time()
+        conn = self._conn()
+        requeue = []
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                stale = conn.execute(
+                    "SELECT job_id, status FROM bookings WHERE status IN ('queued', 'repricing', 'booking')"
+                    " AND updated_at < ?", (now - max_age,)
+                ).fetchall()
+                for job_id, status in stale:
+                    if status == "queued":
+                        # not a change readers need to see, so no new sequence number
+                        conn.execute("UPDATE bookings SET updated_at = ? WHERE job_id = ?", (now, job_id))
+                    elif status == "repricing":
+                        # a new claim token, so the old worker can no longer move it on
+                        conn.execute(
+                            "UPDATE bookings SET status = 'queued', claim_token = NULL, updated_at = ?,"
+                            " seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM bookings) WHERE job_id = ?",
+                            (now, job_id),
+                        )
+                    else:
+                        # keeps its token: if the worker does finish, its outcome is still recorded
+                        conn.execute(
+                            "UPDATE bookings SET status = 'interrupted', error = ?, updated_at = ?,"
+                            " seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM bookings) WHERE job_id = ?",
+                            ("Interrupted while booking; check the order status", now, job_id),
+                        )
+                        continue
+                    requeue.append(job_id)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        for job_id in requeue:
+            self._pool.submit(self._process, job_id)
+        return len(stale)
+
+    def start(self, interval: float = RECLAIM_INTERVAL):
+        """
+        Recover jobs left over from before a restart, then sweep for
+        abandoned jobs every `interval` seconds (once per process), so a job
+        stuck in repricing or booking does not wait for the next restart.
+        A forking server calls this in each worker after the fork.
+        """
+        with self._start_lock:
+            if self._reclaimer is not None:
+                return
+            self._recover()
+
+            def loop():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        self.reclaim_stale()
+                    except Exception as e:
+                        log.warning("booking_reclaim_failed error=%s", e)
+
+            self._reclaimer = threading.Thread(target=loop, name="booking-reclaim", daemon=True)
+            self._reclaimer.start()
+
+
+booking_queue = BookingQueue()
@@ -0,0 +1,452 @@
+"""
+Fake upstream
+Local stand-in for the Amadeus endpoints and the Gemini model API the app
+uses, for benchmarks and offline runs. Responses are synthetic but shaped
+like the real ones and deterministic per request; latency, 5xx errors and
+429s can be injected per service, at start-up or at runtime through
+PUT /_fake/config.
+
+Run with:  python fakeupstream.py [--port 9100] [--latency-ms 80] [--throttle-rate 0.02]
+Then start the app (or the travel API) with
+    AMADEUS_BASE_URL=http://127.0.0.1:9100 GOOGLE_GEMINI_BASE_URL=http://127.0.0.1:9100
+"""
+
+import argparse
+import asyncio
+from collections import Counter
+import copy
+import hashlib
+import json
+import random
+import re
+import time
+
+import tornado.web
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+DEFAULT_CONFIG = {
+    "amadeus": {
+        "latency_ms": 80,
+        "jitter_ms": 20,
+        "error_rate": 0.0,      # share of calls answered 500
+        "throttle_rate": 0.0,   # share of calls answered 429
+        "retry_after": 1,
+        # slower endpoints, as in the sandbox
+        "endpoint_latency_ms": {"hotel_offers_search": 250, "flight_orders": 400, "hotel_orders": 400},
+        "hotels_per_city": 60,
+        "price_change_rate": 0.0,  # share of pricing/offer checks that come back at another price
+    },
+    "gemini": {
+        "latency_ms": 400,      # time to first token
+        "jitter_ms": 50,
+        "prefill_ms_per_1k_tokens": 30,  # added to the first token for long prompts
+        "error_rate": 0.0,
+        "throttle_rate": 0.0,
+        "chunks": 40,
+        "chunk_ms": 25,
+    },
+}
+
+CARRIERS = ("KL", "GA", "SQ", "EK", "QR", "LH", "AF", "BA", "CX", "TK")
+HOTEL_CHAINS = ("HI", "MC", "RT", "HL", "BW", "IC")
+
+
+def _merge(base: dict, update: dict) -> dict:
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def _rng(*parts) -> random.Random:
+    # same request, same data
+    seed = hashlib.sha256("|".join(map(str, parts)).encode()).hexdigest()
+    return random.Random(int(seed[:16], 16))
+
+
+def _iso_duration(minutes: int) -> str:
+    return f"PT{minutes // 60}H{minutes % 60}M" if minutes % 60 else f"PT{minutes // 60}H"
+
+
+# ============================================================
+#  SYNTHETIC DATA
+# ============================================================
+
+def _itinerary(rng, origin, destination, day):
+    stops = rng.choice((0, 0, 1, 1, 2))
+    points = [origin] + [rng.choice(("SIN", "DXB", "DOH", "IST", "FRA", "HKG")) for _ in range(stops)] + [destination]
+    segments, minutes = [], 0
+    hour = rng.randint(0, 23)
+    for i, (a, b) in enumerate(zip(points, points[1:])):
+        flight = rng.randint(90, 720)
+        layover = rng.randint(60, 240) if i else 0
+        minutes += flight + layover
+        carrier = rng.choice(CARRIERS)
+        segments.append({
+            "departure": {"iataCode": a, "at": f"{day}T{(hour + minutes // 60) % 24:02d}:{rng.choice((0, 15, 30, 45)):02d}:00"},
+            "arrival": {"iataCode": b, "at": f"{day}T{(hour + (minutes + flight) // 60) % 24:02d}:{rng.choice((0, 20, 40)):02d}:00"},
+            "carrierCode": carrier,
+            "number": str(rng.randint(10, 999)),
+            "duration": _iso_duration(flight),
+            "id": str(i + 1),
+            "numberOfStops": 0,
+        })
+    return {"duration": _iso_duration(minutes), "segments": segments}
+
+
+def flight_offers(params: dict) -> list:
+    origin, destination = params.get("originLocationCode", "AAA"), params.get("destinationLocationCode", "BBB")
+    departure, ret = params.get("departureDate", "2030-01-01"), params.get("returnDate")
+    adults = int(params.get("adults", 1))
+    count = min(int(params.get("max", 250)), 250)
+    rng = _rng(origin, destination, departure, ret, adults)
+    offers = []
+    for i in range(count):
+        itineraries = [_itinerary(rng, origin, destination, departure)]
+        if ret:
+            itineraries.append(_itinerary(rng, destination, origin, ret))
+        total = round(rng.uniform(180, 1400) * adults * len(itineraries) * 0.8, 2)
+        offers.append({
+            "type": "flight-offer",
+            "id": str(i + 1),
+            "source": "GDS",
+            "oneWay": not ret,
+            "numberOfBookableSeats": rng.randint(1, 9),
+            "itineraries": itineraries,
+            "price": {"currency": "EUR", "total": f"{total:.2f}", "base": f"{total * 0.85:.2f}",
+                      "grandTotal": f"{total:.2f}"},
+            "validatingAirlineCodes": [itineraries[0]["segments"][0]["carrierCode"]],
+            "travelerPricings": [{"travelerId": str(n + 1), "travelerType": "ADULT"} for n in range(adults)],
+        })
+    offers.sort(key=lambda offer: float(offer["price"]["total"]))
+    return offers
+
+
+def city_hotels(city_code: str, count: int, ratings=None, radius: float = None) -> list:
+    rng = _rng("hotels", city_code)
+    hotels = []
+    for i in range(count):
+        rating = rng.randint(2, 5)
+        distance = round(rng.uniform(0.2, 30.0), 2)
+        hotels.append({
+            "chainCode": rng.choice(HOTEL_CHAINS),
+            "iataCode": city_code,
+            "name": f"{city_code} {rng.choice(('GRAND', 'PARK', 'CITY', 'HARBOUR', 'CENTRAL'))} HOTEL {i + 1}",
+            "hotelId": f"FK{city_code[:3]}{i:03d}",
+            "geoCode": {"latitude": round(52.37 + rng.uniform(-0.2, 0.2), 5),
+                        "longitude": round(4.89 + rng.uniform(-0.2, 0.2), 5)},
+            "distance": {"value": distance, "unit": "KM"},
+            "rating": rating,
+        })
+    if ratings:
+        wanted = {int(r) for r in str(ratings).split(",")}
+        hotels = [h for h in hotels if h["rating"] in wanted]
+    if radius:
+        hotels = [h for h in hotels if h["distance"]["value"] <= float(radius)]
+    return hotels
+
+
+def _hotel_offer(hotel_id: str, check_in: str, check_out: str, n: int, rng) -> dict:
+    base = round(rng.uniform(60, 480), 2)
+    return {
+        "id": hashlib.sha1(f"{hotel_id}{check_in}{check_out}{n}".encode()).hexdigest()[:10].upper(),
+        "checkInDate": check_in,
+        "checkOutDate": check_out,
+        "room": {"type": rng.choice(("STD", "DLX", "SUP"))},
+        "price": {"currency": "EUR", "base": f"{base:.2f}", "total": f"{base * 1.1:.2f}"},
+    }
+
+
+def hotel_offers(params: dict) -> list:
+    check_in, check_out = params.get("checkInDate", "2030-01-01"), params.get("checkOutDate", "2030-01-02")
+    data = []
+    # a list of IDs arrives as its repr ("['A', 'B']"), as repeated keys or comma-separated
+    for hotel_id in re.findall(r"[A-Z0-9]{8}", str(params.get("hotelIds", ""))):
+        rng = _rng(hotel_id, check_in, check_out)
+        if rng.random() < 0.2:  # some hotels have nothing available
+            continue
+        data.append({
+            "type": "hotel-offers",
+            "hotel": {"hotelId": hotel_id, "name": f"HOTEL {hotel_id}", "cityCode": hotel_id[2:5]},
+            "available": True,
+            "offers": [_hotel_offer(hotel_id, check_in, check_out, n, rng) for n in range(rng.randint(1, 2))],
+        })
+    return data
+
+
+def itinerary_text(prompt: str) -> str:
+    rng = _rng("itinerary", prompt)
+    sights = ("old town walk", "museum visit", "food market", "river cruise", "local cooking class",
+              "botanical garden", "street food tour", "viewpoint at sunset", "day trip", "gallery")
+    days = rng.randint(3, 7)
+    lines = ["# Your itinerary", ""]
+    for day in range(1, days + 1):
+        lines.append(f"## Day {day}")
+        lines += [f"- {slot}: {rng.choice(sights)}" for slot in ("Morning", "Afternoon", "Evening")]
+        lines.append("")
+    return "\n".join(lines)
+
+
+# ============================================================
+#  HANDLERS
+# ============================================================
+
+class FakeHandler(tornado.web.RequestHandler):
+    service = "amadeus"
+    endpoint = None
+
+    def initialize(self, state):
+        self.state = state
+
+    @property
+    def config(self) -> dict:
+        return self.state["config"][self.service]
+
+    def params(self) -> dict:
+        # repeated keys (hotelIds=A&hotelIds=B) are joined like a comma list
+        return {key: ",".join(self.get_query_arguments(key)) for key in self.request.query_arguments}
+
+    def json_body(self) -> dict:
+        try:
+            return json.loads(self.request.body or b"{}")
+        except ValueError:
+            return {}
+
+    def reply(self, payload, status: int = 200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/vnd.amadeus+json" if self.service == "amadeus"
+                        else "application/json")
+        self.finish(json.dumps(payload))
+
+    async def inject(self) -> bool:
+        """
+        Wait the configured latency, then maybe answer with an injected
+        429 or 500. Returns False if the request was answered here.
+        """
+        config, rng, stats = self.config, self.state["rng"], self.state["stats"]
+        stats["requests"][f"{self.service}:{self.endpoint}"] += 1
+        latency = config.get("endpoint_latency_ms", {}).get(self.endpoint, config["latency_ms"])
+        await asyncio.sleep(max(0.0, latency + rng.uniform(-config["jitter_ms"], config["jitter_ms"])) / 1000)
+
+        roll = rng.random()
+        if roll < config["throttle_rate"]:
+            stats["throttled"][f"{self.service}:{self.endpoint}"] += 1
+            self.set_header("Retry-After", str(config.get("retry_after", 1)))
+            self.reply(self.error_payload(429, "Too many requests"), 429)
+            return False
+        if roll < config["throttle_rate"] + config["error_rate"]:
+            stats["errors"][f"{self.service}:{self.endpoint}"] += 1
+            self.reply(self.error_payload(500, "Internal error"), 500)
+            return False
+        return True
+
+    def error_payload(self, status: int, title: str) -> dict:
+        if self.service == "gemini":
+            return {"error": {"code": status, "message": title,
+                              "status": "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL"}}
+        return {"errors": [{"status": status, "code": 38194 if status == 429 else 141, "title": title}]}
+
+
+class TokenHandler(FakeHandler):
+    def post(self):
+        self.reply({"type": "amadeusOAuth2Token", "access_token": f"fake-{time.time_ns()}",
+                    "token_type": "Bearer", "expires_in": 1799, "state": "approved"})
+
+
+class FlightOffersHandler(FakeHandler):
+    endpoint = "flight_offers_search"
+
+    async def get(self):
+        if await self.inject():
+            offers = flight_offers(self.params())
+            self.reply({"meta": {"count": len(offers)}, "data": offers})
+
+
+class FlightPricingHandler(FakeHandler):
+    endpoint = "flight_offers_pricing"
+
+    async def post(self):
+        if await self.inject():
+            offers = copy.deepcopy(self.json_body().get("data", {}).get("flightOffers", []))
+            if offers and self.state["rng"].random() < self.config["price_change_rate"]:
+                total = round(float(offers[0]["price"]["total"]) * 1.08, 2)
+                offers[0]["price"].update(total=f"{total:.2f}", grandTotal=f"{total:.2f}")
+            self.reply({"data": {"type": "flight-offers-pricing", "flightOffers": offers}})
+
+
+class FlightOrdersHandler(FakeHandler):
+    endpoint = "flight_orders"
+
+    async def post(self):
+        if await self.inject():
+            order_id = hashlib.sha1(self.request.body).hexdigest()[:12]
+            self.reply({"data": {"type": "flight-order", "id": order_id,
+                                 "associatedRecords": [{"reference": order_id[:6].upper()}]}}, 201)
+
+
+class HotelsByCityHandler(FakeHandler):
+    endpoint = "hotels_by_city"
+
+    async def get(self):
+        if await self.inject():
+            params = self.params()
+            hotels = city_hotels(params.get("cityCode", "AAA"), self.config["hotels_per_city"],
+                                 params.get("ratings"), params.get("radius"))
+            self.reply({"meta": {"count": len(hotels)}, "data": hotels})
+
+
+class HotelOffersHandler(FakeHandler):
+    endpoint = "hotel_offers_search"
+
+    async def get(self):
+        if await self.inject():
+            self.reply({"data": hotel_offers(self.params())})
+
+
+class HotelOfferHandler(FakeHandler):
+    endpoint = "hotel_offer_search"
+
+    async def get(self, offer_id):
+        if await self.inject():
+            base = 100.0 * (1.1 if self.state["rng"].random() < self.config["price_change_rate"] else 1.0)
+            self.reply({"data": {"type": "hotel-offers", "hotel": {"hotelId": "FK", "name": "HOTEL"},
+                                 "available": True,
+                                 "offers": [{"id": offer_id, "price": {"currency": "EUR", "base": f"{base:.2f}"}}]}})
+
+
+class HotelOrdersHandler(FakeHandler):
+    endpoint = "hotel_orders"
+
+    async def post(self):
+        if await self.inject():
+            order_id = hashlib.sha1(self.request.body).hexdigest()[:12]
+            self.reply({"data": {"type": "hotel-order", "id": order_id,
+                                 "hotelBookings": [{"id": order_id, "bookingStatus": "CONFIRMED"}]}}, 201)
+
+
+class GeminiHandler(FakeHandler):
+    service = "gemini"
+
+    async def post(self, model, method):
+        self.endpoint = method
+        if not await self.inject():
+            return
+        body = self.json_body()
+        prompt = " ".join(part.get("text", "") for content in body.get("contents", [])
+                          for part in content.get("parts", []))
+        text = itinerary_text(prompt)
+        await asyncio.sleep(self.config.get("prefill_ms_per_1k_tokens", 0) * len(prompt) / 4 / 1000 / 1000)
+        usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4,
+                 "totalTokenCount": (len(prompt) + len(text)) // 4}
+
+        def chunk(piece, last):
+            candidate = {"content": {"role": "model", "parts": [{"text": piece}]}, "index": 0}
+            if last:
+                candidate["finishReason"] = "STOP"
+            return {"candidates": [candidate], "usageMetadata": usage, "modelVersion": model}
+
+        if method == "generateContent":
+            self.reply(chunk(text, True))
+            return
+
+        # server-sent events, one chunk every chunk_ms
+        self.set_header("Content-Type", "text/event-stream")
+        size = max(1, len(text) // max(1, self.config["chunks"]))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        for i, piece in enumerate(pieces):
+            self.write(f"data: {json.dumps(chunk(piece, i == len(pieces) - 1))}\r\n\r\n")
+            await self.flush()
+            if i < len(pieces) - 1:
+                await asyncio.sleep(self.config["chunk_ms"] / 1000)
+        self.finish()
+
+
+class ConfigHandler(FakeHandler):
+    def get(self):
+        self.reply(self.state["config"])
+
+    def put(self):
+        _merge(self.state["config"], self.json_body())
+        self.reply(self.state["config"])
+
+
+class StatsHandler(FakeHandler):
+    def get(self):
+        self.reply({name: dict(counter) for name, counter in self.state["stats"].items()})
+
+    def delete(self):
+        for counter in self.state["stats"].values():
+            counter.clear()
+        self.set_status(204)
+        self.finish()
+
+
+def make_app(config: dict = None, seed: int = 0):
+    state = {
+        "config": _merge(copy.deepcopy(DEFAULT_CONFIG), config or {}),
+        "rng": random.Random(seed),
+        "stats": {"requests": Counter(), "throttled": Counter(), "errors": Counter()},
+    }
+    routes = [
+        (r"/v1/security/oauth2/token", TokenHandler),
+        (r"/v2/shopping/flight-offers", FlightOffersHandler),
+        (r"/v1/shopping/flight-offers/pricing", FlightPricingHandler),
+        (r"/v1/booking/flight-orders", FlightOrdersHandler),
+        (r"/v1/reference-data/locations/hotels/by-city", HotelsByCityHandler),
+        (r"/v3/shopping/hotel-offers", HotelOffersHandler),
+        (r"/v3/shopping/hotel-offers/([^/]+)", HotelOfferHandler),
+        (r"/v2/booking/hotel-orders", HotelOrdersHandler),
+        (r"/v1beta/models/([^/:]+):(generateContent|streamGenerateContent)", GeminiHandler),
+        (r"/_fake/config", ConfigHandler),
+        (r"/_fake/stats", StatsHandler),
+    ]
+    return tornado.web.Application([(pattern, handler, {"state": state}) for pattern, handler in routes],
+                                   log_function=lambda handler: None)
+
+
+# ============================================================
+#  CLI
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve fake Amadeus and Gemini endpoints for benchmarks.")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--latency-ms", type=float, help="Amadeus latency per call")
+    parser.add_argument("--jitter-ms", type=float, help="± random Amadeus latency")
+    parser.add_argument("--error-rate", type=float, help="share of calls answered 500 (both services)")
+    parser.add_argument("--throttle-rate", type=float, help="share of calls answered 429 (both services)")
+    parser.add_argument("--gemini-ttft-ms", type=float, help="Gemini time to first token")
+    parser.add_argument("--config", help="JSON file merged over the defaults (see DEFAULT_CONFIG)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    config = {"amadeus": {}, "gemini": {}}
+    if args.config:
+        with open(args.config, encoding="utf8") as f:
+            _merge(config, json.load(f))
+    for key, value in (("latency_ms", args.latency_ms), ("jitter_ms", args.jitter_ms)):
+        if value is not None:
+            config["amadeus"][key] = value
+    for key, value in (("error_rate", args.error_rate), ("throttle_rate", args.throttle_rate)):
+        if value is not None:
+            config["amadeus"][key] = config["gemini"][key] = value
+    if args.gemini_ttft_ms is not None:
+        config["gemini"]["latency_ms"] = args.gemini_ttft_ms
+
+    async def serve():
+        make_app(config, args.seed).listen(args.port, address=args.address)
+        print(f"Fake upstream listening on http://{args.address}:{args.port}", flush=True)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Itinerary grounding
+Puts the flights and hotels a search found, and anything booked, into the
+planner prompt as a compact context block: actual departure/arrival times,
+hotel names and prices, deduplicated and cut to a token budget. The raw
+Amadeus JSON carries the same facts at many times the tokens; it is kept
+here only as a baseline to compare against.
+"""
+
+from dataclasses import asdict
+import json
+import math
+import os
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+GROUNDING_TOKEN_BUDGET = int(os.getenv("GROUNDING_TOKEN_BUDGET", "400"))  # estimated tokens for the context block
+CHARS_PER_TOKEN = 4  # Gemini's rule of thumb for English text
+
+GROUNDING_MODES = ("none", "compact", "json")
+BOOKED_STATES = {"booked": "booked", "queued": "booking", "repricing": "booking", "booking": "booking"}
+
+INSTRUCTIONS = ("Base the travel days on these actual search results: plan around the arrival and departure "
+                "times, and mention the hotel and flight prices where they help.")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+# ============================================================
+#  COMPACT CONTEXT
+# ============================================================
+
+def _time(dt, fallback: str) -> str:
+    return dt.strftime("%a %d %b %H:%M") if dt else fallback
+
+
+def _flight_line(offer) -> str:
+    stops = "non-stop" if not offer.stops else f"{offer.stops} stop{'s' if offer.stops > 1 else ''}"
+    return (f"- {offer.airline} {offer.origin}→{offer.destination}, departs {_time(offer.departure_at, offer.departure_display)},"
+            f" arrives {_time(offer.arrival_at, offer.arrival_display)}, {stops}, {offer.display_price}")
+
+
+def _hotel_line(offer) -> str:
+    return f"- {offer.hotel_name}, {offer.display_price}"
+
+
+def _booking_line(job) -> str:
+    kind = "Flight" if job.get("kind") == "flight" else "Hotel"
+    return f"- {kind}: {job.get('title') or '?'}, {job.get('price') or '?'} ({BOOKED_STATES[job['status']]})"
+
+
+def _cheapest_unique(offers, key) -> list:
+    """
+    Offers in price order, keeping the cheapest of each `key`.
+    """
+    seen, unique = set(), []
+    for offer in sorted(offers, key=lambda o: (o.price is None, o.price or 0.0)):
+        k = key(offer)
+        if k not in seen:
+            seen.add(k)
+            unique.append(offer)
+    return unique
+
+
+def build_context(flights=(), hotels=(), bookings=(), budget: int = GROUNDING_TOKEN_BUDGET):
+    """
+    The context block for parsed `flights` / `hotels` (offermodels) and
+    booking ledger rows, and its stats. Bookings always go in; flights and
+    hotels are added cheapest first, one of each in turn, while the
+    estimated size stays within `budget` tokens. Returns ("", stats) when
+    there is nothing to ground on.
+    """
+    booked = [_booking_line(job) for job in bookings if job.get("status") in BOOKED_STATES]
+    flight_lines = [_flight_line(o) for o in _cheapest_unique(
+        flights, lambda o: (o.airline, o.origin, o.destination, o.departure_display, o.arrival_display))]
+    hotel_lines = [_hotel_line(o) for o in _cheapest_unique(hotels, lambda o: o.hotel_name.casefold())]
+
+    sections = {"Booked:": booked, "Flights found (cheapest first):": [], "Hotels found (cheapest first):": []}
+    used = estimate_tokens("Trip facts:\n" + ("Booked:\n" + "\n".join(booked) if booked else ""))
+    queues = [(flight_lines, "Flights found (cheapest first):"), (hotel_lines, "Hotels found (cheapest first):")]
+    positions = [0, 0]
+    while True:
+        added = False
+        for n, (lines, title) in enumerate(queues):
+            if positions[n] >= len(lines):
+                continue
+            line = lines[positions[n]]
+            cost = estimate_tokens(line + "\n") + (0 if sections[title] else estimate_tokens(title + "\n"))
+            if used + cost > budget:
+                continue
+            sections[title].append(line)
+            positions[n] += 1
+            used += cost
+            added = True
+        if not added:
+            break
+
+    parts = [f"{title}\n" + "\n".join(lines) for title, lines in sections.items() if lines]
+    text = "Trip facts:\n" + "\n".join(parts) if parts else ""
+    stats = {
+        "tokens": estimate_tokens(text),
+        "flights": positions[0], "flights_found": len(flights), "unique_flights": len(flight_lines),
+        "hotels": positions[1], "hotels_found": len(hotels), "unique_hotels": len(hotel_lines),
+        "bookings": len(booked),
+    }
+    return text, stats
+
+
+# ============================================================
+#  NAIVE CONTEXT (baseline)
+# ============================================================
+
+def json_context(flights=(), hotels=(), bookings=()):
+    """
+    Everything as JSON: the raw Amadeus flight offers, the hotel offers and
+    the booking rows. Only for comparing against build_context.
+    """
+    payload = {
+        "flights": [offer.raw for offer in flights],
+        "hotels": [asdict(offer) for offer in hotels],
+        "bookings": [{k: job.get(k) for k in ("kind", "title", "price", "status")} for job in bookings],
+    }
+    text = "Trip facts (JSON):\n" + json.dumps(payload, separators=(",", ":"), default=str)
+    return text, {"tokens": estimate_tokens(text), "flights": len(flights), "flights_found": len(flights),
+                  "hotels": len(hotels), "hotels_found": len(hotels), "bookings": len(payload["bookings"])}
+
+
+def grounded_prompt(prompt: str, mode: str, flights=(), hotels=(), bookings=(), budget: int = GROUNDING_TOKEN_BUDGET):
+    """
+    `prompt` with the context block for `mode` ("none", "compact" or
+    "json") appended, and the stats of that block (prompt_tokens is the
+    estimate for the whole prompt).
+    """
+    if mode not in GROUNDING_MODES:
+        raise ValueError(f"grounding mode must be one of {', '.join(GROUNDING_MODES)}, not {mode!r}")
+    context, stats = ("", {"tokens": 0})
+    if mode == "compact":
+        context, stats = build_context(flights, hotels, bookings, budget)
+    elif mode == "json":
+        context, stats = json_context(flights, hotels, bookings)
+    full = f"{prompt}\n\n{context}\n\n{INSTRUCTIONS}" if context else prompt
+    return full, dict(stats, mode=mode if context else "none", prompt_tokens=estimate_tokens(full))
@@ -0,0 +1,294 @@
+"""
+Hotel reference-data store
+Local SQLite copy of the Amadeus hotel list (hotels.by_city). It is filled
+lazily the first time a city is searched and refreshed in the background,
+so hotel IDs for a search are resolved locally instead of over the network.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from telemetry import get_logger
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+HOTEL_STORE_PATH = os.getenv("HOTEL_STORE_PATH", os.path.join(".cache", "hotels.sqlite"))
+HOTEL_STORE_MAX_AGE = int(os.getenv("HOTEL_STORE_MAX_AGE", str(24 * 3600)))  # seconds before a city is refreshed
+HOTEL_STORE_REFRESH_INTERVAL = int(os.getenv("HOTEL_STORE_REFRESH_INTERVAL", "3600"))  # seconds between refresh sweeps
+HOTEL_STORE_MISS_TTL = int(os.getenv("HOTEL_STORE_MISS_TTL", "600"))  # seconds before a city with no list is asked for again
+
+# Cities are fetched once with the widest radius; smaller radii are filtered locally
+REFERENCE_RADIUS_KM = 50
+
+log = get_logger("hotelstore")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hotels (
+    hotel_id TEXT PRIMARY KEY,
+    city_code TEXT NOT NULL,
+    name TEXT,
+    chain_code TEXT,
+    rating INTEGER,
+    latitude REAL,
+    longitude REAL,
+    distance_km REAL
+);
+CREATE INDEX IF NOT EXISTS hotels_city_rating ON hotels (city_code, rating);
+CREATE INDEX IF NOT EXISTS hotels_city_distance ON hotels (city_code, distance_km);
+CREATE INDEX IF NOT EXISTS hotels_geo ON hotels (latitude, longitude);
+CREATE TABLE IF NOT EXISTS cities (
+    city_code TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS city_misses (
+    city_code TEXT PRIMARY KEY,
+    missed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS city_ratings (
+    city_code TEXT NOT NULL,
+    rating INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (city_code, rating)
+);
+"""
+
+
+def _distance_km(hotel: dict):
+    distance = hotel.get("distance") or {}
+    value = distance.get("value")
+    if value is None:
+        return None
+    unit = (distance.get("unit") or "KM").upper()
+    return value * 1.609344 if unit == "MI" else float(value)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+# ============================================================
+#  STORE
+# ============================================================
+
+class HotelStore:
+    """
+    Indexed hotel list per city code.
+
+    `fetch(city_code, rating=None)` must return the raw hotels.by_city data
+    list, or None when the city has no list (e.g. an unknown code); the
+    store never talks to Amadeus directly. A city without a list is not
+    asked for again for `miss_ttl` seconds.
+    """
+
+    def __init__(self, fetch, path: str = HOTEL_STORE_PATH, max_age: int = HOTEL_STORE_MAX_AGE,
+                 miss_ttl: int = HOTEL_STORE_MISS_TTL):
+        self.fetch = fetch
+        self.path = path
+        self.max_age = max_age
+        self.miss_ttl = miss_ttl
+        self._local = threading.local()
+        self._fill_lock = threading.Lock()  # guards _city_locks and _refresher, never held across a fetch
+        self._city_locks = {}  # city code -> lock held while that city is first fetched
+        self._refresher = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # ---------- lookups ----------
+
+    def hotel_ids(self, city_code: str, radius_km: float = 20, rating=None, limit: int = None):
+        """
+        Hotel IDs in `city_code` within `radius_km` of the city centre,
+        nearest first, optionally restricted to a star rating.
+        """
+        city_code = city_code.strip().upper()
+        if not self.ensure_city(city_code):
+            return []
+        if rating is not None:
+            self.ensure_rating(city_code, int(rating))
+
+        query = "SELECT hotel_id FROM hotels WHERE city_code = ? AND (distance_km IS NULL OR distance_km <= ?)"
+        args = [city_code, radius_km]
+        if rating is not None:
+            query += " AND rating = ?"
+            args.append(int(rating))
+        query += " ORDER BY distance_km"
+        if limit is not None:
+            query += " LIMIT ?"
+            args.append(limit)
+        return [row[0] for row in self._conn().execute(query, args)]
+
+    def near(self, latitude: float, longitude: float, radius_km: float, rating=None):
+        """
+        Hotels around an arbitrary point, using the geo index for a bounding
+        box and an exact great-circle check. Only covers cities already stored.
+        """
+        dlat = radius_km / 111.0
+        dlon = radius_km / max(1e-6, 111.0 * math.cos(math.radians(latitude)))
+        query = (
+            "SELECT hotel_id, name, rating, latitude, longitude FROM hotels"
+            " WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?"
+        )
+        args = [latitude - dlat, latitude + dlat, longitude - dlon, longitude + dlon]
+        if rating is not None:
+            query += " AND rating = ?"
+            args.append(int(rating))
+        hotels = []
+        for hotel_id, name, stars, lat, lon in self._conn().execute(query, args):
+            distance = haversine_km(latitude, longitude, lat, lon)
+            if distance <= radius_km:
+                hotels.append({"hotel_id": hotel_id, "name": name, "rating": stars, "distance_km": round(distance, 2)})
+        return sorted(hotels, key=lambda h: h["distance_km"])
+
+    # ---------- filling ----------
+
+    def _city_lock(self, city_code: str):
+        with self._fill_lock:
+            return self._city_locks.setdefault(city_code, threading.Lock())
+
+    def _settled(self, city_code: str) -> bool:
+        """
+        True if the city's list is stored, or it had none moments ago.
+        """
+        row = self._conn().execute(
+            "SELECT 1 FROM cities WHERE city_code = ?"
+            " UNION ALL SELECT 1 FROM city_misses WHERE city_code = ? AND missed_at > ?",
+            (city_code, city_code, time.time() - self.miss_ttl),
+        ).fetchone()
+        return row is not None
+
+    def _rated(self, city_code: str, rating: int) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM city_ratings WHERE city_code = ? AND rating = ?", (city_code, rating)
+        ).fetchone()
+        return row is not None
+
+    def ensure_city(self, city_code: str) -> bool:
+        """
+        Fill the city's list on first use. False if the city has none.
+        """
+        if not self._settled(city_code):
+            # one fetch per city; first searches for other cities are not held up
+            with self._city_lock(city_code):
+                # another thread may have filled it while we waited
+                if not self._settled(city_code):
+                    self.refresh_city(city_code)
+        self.start_refresher()
+        row = self._conn().execute("SELECT 1 FROM cities WHERE city_code = ?", (city_code,)).fetchone()
+        return row is not None
+
+    def ensure_rating(self, city_code: str, rating: int):
+        """
+        The hotel list only carries `rating` when it was requested with a
+        ratings filter, so each (city, rating) pair is tagged once and then
+        served locally.
+        """
+        if self._rated(city_code, rating):
+            return
+        with self._city_lock(city_code):
+            if self._rated(city_code, rating):
+                return
+            hotels = self.fetch(city_code, rating=rating) or []
+            conn = self._conn()
+            with conn:
+                self._upsert(conn, city_code, hotels, rating=rating)
+                conn.execute(
+                    "INSERT OR REPLACE INTO city_ratings (city_code, rating, fetched_at) VALUES (?, ?, ?)",
+                    (city_code, rating, time.time()),
+                )
+
+    def _record_miss(self, city_code: str):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO city_misses (city_code, missed_at) VALUES (?, ?)", (city_code, time.time())
+            )
+
+    def refresh_city(self, city_code: str):
+        hotels = self.fetch(city_code)
+        if hotels is None:
+            self._record_miss(city_code)
+            return
+        conn = self._conn()
+        with conn:
+            self._upsert(conn, city_code, hotels)
+            # drop hotels that are no longer listed for this city
+            conn.execute(
+                "DELETE FROM hotels WHERE city_code = ? AND hotel_id NOT IN (SELECT value FROM json_each(?))",
+                (city_code, json.dumps([hotel["hotelId"] for hotel in hotels])),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO cities (city_code, fetched_at) VALUES (?, ?)",
+                (city_code, time.time()),
+            )
+            conn.execute("DELETE FROM city_misses WHERE city_code = ?", (city_code,))
+
+    def _upsert(self, conn, city_code, hotels, rating=None):
+        rows = []
+        for hotel in hotels:
+            geo = hotel.get("geoCode") or {}
+            stars = hotel.get("rating", rating)
+            rows.append((
+                hotel["hotelId"], city_code, hotel.get("name"), hotel.get("chainCode"),
+                int(stars) if stars is not None else None,
+                geo.get("latitude"), geo.get("longitude"), _distance_km(hotel),
+            ))
+        # keep a known rating if this batch does not carry one
+        conn.executemany(
+            "INSERT INTO hotels (hotel_id, city_code, name, chain_code, rating, latitude, longitude, distance_km)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (hotel_id) DO UPDATE SET city_code = excluded.city_code, name = excluded.name,"
+            " chain_code = excluded.chain_code, rating = COALESCE(excluded.rating, hotels.rating),"
+            " latitude = excluded.latitude, longitude = excluded.longitude, distance_km = excluded.distance_km",
+            rows,
+        )
+
+    # ---------- background refresh ----------
+
+    def refresh_stale(self):
+        cutoff = time.time() - self.max_age
+        conn = self._conn()
+        # a failed refresh keeps the stored list and is retried a full max_age later
+        stale = [row[0] for row in conn.execute(
+            "SELECT city_code FROM cities WHERE fetched_at < ?"
+            " AND city_code NOT IN (SELECT city_code FROM city_misses WHERE missed_at >= ?)",
+            (cutoff, cutoff),
+        )]
+        for city_code in stale:
+            try:
+                self.refresh_city(city_code)
+                with conn:
+                    conn.execute("DELETE FROM city_ratings WHERE city_code = ?", (city_code,))
+            except Exception as e:
+                self._record_miss(city_code)
+                log.warning("hotel_list_refresh_failed city=%s error=%s", city_code, e)
+
+    def start_refresher(self, interval: int = HOTEL_STORE_REFRESH_INTERVAL):
+        with self._fill_lock:
+            if self._refresher is not None:
+                return
+
+            def loop():
+                while True:
+                    time.sleep(interval)
+                    self.refresh_stale()
+
+            self._refresher = threading.Thread(target=loop, name="hotel-store-refresh", daemon=True)
+            self._refresher.start()
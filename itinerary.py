@@ -0,0 +1,125 @@
+"""
+Itinerary generation
+Streams the planner agent's answer chunk by chunk so the UI can render it
+as it is generated, and records time-to-first-token and total generation
+time for every request.
+"""
+
+import threading
+import time
+
+from ratelimiter import rate_limiter, RateLimitError
+from telemetry import telemetry
+
+
+# ============================================================
+#  HELPERS
+# ============================================================
+
+def is_gemini_throttle(e) -> bool:
+    return "429" in str(e) or "Too many requests" in str(e)
+
+
+def _event_text(event):
+    """
+    Text delta carried by one streamed agno event, or None.
+    """
+    name = getattr(event, "event", None)
+    if name == "RunError":
+        raise RuntimeError(getattr(event, "content", None) or "Gemini run failed")
+    if name not in (None, "RunContent"):
+        return None
+    content = getattr(event, "content", None)
+    return content if isinstance(content, str) and content else None
+
+
+# ============================================================
+#  STREAMING
+# ============================================================
+
+class ItineraryStream:
+    """
+    Iterate to get the itinerary text generated so far (cumulative, so a
+    renderer can simply replace what it shows). A 429 in the middle of the
+    stream restarts generation after the rate limiter's backoff; the
+    restart yields "" so the partial text is cleared. `max_wait` bounds each
+    wait for a Gemini token as in RateLimiter.acquire; with max_wait=0 (the
+    Streamlit script thread) iteration raises RateLimitError instead of
+    sleeping, including before a restart.
+
+    Set `cancel_event` (or close the iterator) to stop generation early.
+    After iteration `metrics` holds ttft_s, total_s, chunks, retries,
+    cancelled and completed.
+    """
+
+    def __init__(self, agent, prompt: str, cancel_event: threading.Event = None, retries: int = 3,
+                 max_wait: float = None):
+        self.agent = agent
+        self.prompt = prompt
+        self.cancel_event = cancel_event or threading.Event()
+        self.retries = retries
+        self.max_wait = max_wait
+        self.text = ""
+        self.metrics = {"ttft_s": None, "total_s": None, "chunks": 0, "retries": 0,
+                        "cancelled": False, "completed": False}
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def __iter__(self):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    rate_limiter.acquire("gemini", self.max_wait)
+                except RateLimitError:
+                    outcome = "throttled"
+                    raise
+                self.text = ""
+                stream = None
+                try:
+                    # a 429 can come when the stream is opened as well as mid-stream
+                    stream = self.agent.run(self.prompt, stream=True)
+                    for event in stream:
+                        if self.cancel_event.is_set():
+                            self.metrics["cancelled"] = True
+                            outcome = "cancelled"
+                            return
+                        delta = _event_text(event)
+                        if delta is None:
+                            continue
+                        if self.metrics["ttft_s"] is None:
+                            self.metrics["ttft_s"] = round(time.perf_counter() - started, 3)
+                            telemetry.record("gemini", "first_token", time.perf_counter() - started, started=started)
+                        self.metrics["chunks"] += 1
+                        self.text += delta
+                        yield self.text
+                except Exception as e:
+                    if not is_gemini_throttle(e):
+                        rate_limiter.record_failure("gemini")
+                        raise
+                    rate_limiter.record_throttle("gemini")
+                    if attempt == self.retries:
+                        outcome = "throttled"
+                        raise RateLimitError("gemini", 0.0) from e
+                    self.metrics["retries"] += 1
+                    yield ""
+                    continue
+                finally:
+                    close = getattr(stream, "close", None)
+                    if close is not None:
+                        close()
+
+                rate_limiter.record_success("gemini")
+                self.metrics["completed"] = True
+                outcome = "ok"
+                return
+        except GeneratorExit:
+            # the consumer stopped iterating, e.g. a Streamlit rerun
+            self.metrics["cancelled"] = True
+            outcome = "cancelled"
+            raise
+        finally:
+            self.metrics["total_s"] = round(time.perf_counter() - started, 3)
+            telemetry.record("gemini", "stream", time.perf_counter() - started, outcome, started)
@@ -0,0 +1,186 @@
+"""
+Itinerary cache
+Persistent store of generated itineraries keyed on the normalized trip
+parameters, so popular trips are not sent to Gemini again. A near-duplicate
+lookup (same destination, theme, budget and trip length, similar activities)
+can serve a cached itinerary for shifted dates.
+"""
+
+from datetime import date, timedelta
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from telemetry import telemetry
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+ITINERARY_CACHE_PATH = os.getenv("ITINERARY_CACHE_PATH", os.path.join(".cache", "itineraries.sqlite"))
+ITINERARY_CACHE_TTL = int(os.getenv("ITINERARY_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+ITINERARY_CACHE_MAX_ENTRIES = int(os.getenv("ITINERARY_CACHE_MAX_ENTRIES", "1000"))
+SIMILAR_MIN_OVERLAP = 0.5  # Jaccard overlap of activities for a near-duplicate match
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS itineraries (
+    key TEXT PRIMARY KEY,
+    destination TEXT NOT NULL,
+    theme TEXT NOT NULL,
+    budget TEXT NOT NULL,
+    trip_length INTEGER NOT NULL,
+    start_date TEXT NOT NULL,
+    activities TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS itineraries_trip ON itineraries (destination, theme, budget, trip_length);
+CREATE INDEX IF NOT EXISTS itineraries_last_used ON itineraries (last_used);
+"""
+
+_ISO_DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+
+
+# ============================================================
+#  NORMALIZATION
+# ============================================================
+
+def normalize_trip(theme: str, destination: str, start_date, end_date, activities: str, budget: str) -> dict:
+    """
+    Canonical trip parameters: emoji and case are dropped from the theme,
+    activities become a sorted set of lower-case items.
+    """
+    start = start_date if isinstance(start_date, date) else date.fromisoformat(str(start_date))
+    end = end_date if isinstance(end_date, date) else date.fromisoformat(str(end_date))
+    items = {re.sub(r"\s+", " ", a).strip().lower() for a in re.split(r"[,;/\n]| and ", activities or "")}
+    return {
+        "theme": re.sub(r"[^a-z ]", "", theme.lower()).strip(),
+        "destination": destination.strip().upper(),
+        "start_date": start.isoformat(),
+        "trip_length": (end - start).days,
+        "activities": sorted(a for a in items if a),
+        "budget": budget.strip().lower(),
+    }
+
+
+def trip_key(trip: dict) -> str:
+    return hashlib.sha256(json.dumps(trip, sort_keys=True).encode("utf8")).hexdigest()
+
+
+def _overlap(a, b) -> float:
+    a, b = set(a), set(b)
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def shift_dates(text: str, days: int) -> str:
+    """
+    Move every ISO date in `text` by `days`.
+    """
+    if not days:
+        return text
+
+    def shift(match):
+        try:
+            return (date.fromisoformat(match.group(1)) + timedelta(days=days)).isoformat()
+        except ValueError:
+            return match.group(1)
+
+    return _ISO_DATE.sub(shift, text)
+
+
+# ============================================================
+#  CACHE
+# ============================================================
+
+class ItineraryCache:
+
+    def __init__(self, path: str = ITINERARY_CACHE_PATH, ttl: int = ITINERARY_CACHE_TTL,
+                 max_entries: int = ITINERARY_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "similar_hits": 0, "misses": 0}
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def lookup(self, trip: dict, allow_similar: bool = True):
+        """
+        Returns (content, match) where match is "exact", "similar" or None.
+        A similar match has its ISO dates shifted to the requested trip.
+        """
+        conn = self._conn()
+        cutoff = time.time() - self.ttl
+        key = trip_key(trip)
+        row = conn.execute(
+            "SELECT content FROM itineraries WHERE key = ? AND created_at >= ?", (key, cutoff)
+        ).fetchone()
+        if row is not None:
+            self._touch(key)
+            self.stats["hits"] += 1
+            return row[0], "exact"
+
+        if allow_similar:
+            best = None
+            candidates = conn.execute(
+                "SELECT key, start_date, activities, content FROM itineraries"
+                " WHERE destination = ? AND theme = ? AND budget = ? AND trip_length = ? AND created_at >= ?",
+                (trip["destination"], trip["theme"], trip["budget"], trip["trip_length"], cutoff),
+            )
+            for cand_key, start_date, activities, content in candidates:
+                score = _overlap(json.loads(activities), trip["activities"])
+                if score >= SIMILAR_MIN_OVERLAP and (best is None or score > best[0]):
+                    best = (score, cand_key, start_date, content)
+            if best is not None:
+                _, cand_key, start_date, content = best
+                self._touch(cand_key)
+                self.stats["similar_hits"] += 1
+                offset = (date.fromisoformat(trip["start_date"]) - date.fromisoformat(start_date)).days
+                return shift_dates(content, offset), "similar"
+
+        self.stats["misses"] += 1
+        return None, None
+
+    def put(self, trip: dict, content: str):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO itineraries"
+                " (key, destination, theme, budget, trip_length, start_date, activities, content, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (trip_key(trip), trip["destination"], trip["theme"], trip["budget"], trip["trip_length"],
+                 trip["start_date"], json.dumps(trip["activities"]), content, now, now),
+            )
+            conn.execute("DELETE FROM itineraries WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM itineraries WHERE key IN ("
+                " SELECT key FROM itineraries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def _touch(self, key):
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE itineraries SET last_used = ? WHERE key = ?", (time.time(), key))
+
+
+itinerary_cache = ItineraryCache()
+telemetry.add_collector("itinerary_cache", lambda: itinerary_cache.stats)
@@ -0,0 +1,293 @@
+"""
+Location index
+In-memory index of airports and their cities, loaded from a bundled CSV
+(data/airports.csv: every airport with an IATA code, from the OurAirports-
+derived `airportsdata` list, with major airports listed first so they win
+ties). Prefix lookups by code, city or airport name are a binary search
+over one sorted key array, well under a millisecond, so the UI can
+autocomplete and searches can be checked before anything is sent to Amadeus.
+"""
+
+from bisect import bisect_left
+import csv
+from dataclasses import dataclass
+from datetime import date
+import difflib
+import os
+import re
+import unicodedata
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+LOCATION_DATA_PATH = os.getenv(
+    "LOCATION_DATA_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "airports.csv")
+)
+# Codes missing from the index are rejected; LOCATION_STRICT=0 passes
+# well-formed ones through to Amadeus instead.
+LOCATION_STRICT = os.getenv("LOCATION_STRICT", "1") == "1"
+MAX_ADULTS = 9
+
+_CODE = re.compile(r"^[A-Z]{3}$")
+
+# match kinds, best first
+RANK_CODE, RANK_CITY, RANK_NAME, RANK_WORD = range(4)
+
+
+class InvalidSearchError(ValueError):
+    """
+    A search that would certainly fail upstream (unknown code, dates out of
+    order, ...). `suggestions` holds likely intended codes, if any.
+    """
+
+    def __init__(self, message: str, suggestions=()):
+        super().__init__(message)
+        self.suggestions = list(suggestions)
+
+
+def fold(text: str) -> str:
+    """
+    Lower-case, accent-free, single-spaced form used for matching.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+@dataclass(slots=True, frozen=True)
+class Airport:
+    iata: str
+    name: str
+    city: str
+    city_code: str
+    country: str
+
+    @property
+    def label(self) -> str:
+        return f"{self.iata} — {self.name} ({self.city}, {self.country})"
+
+
+def _close_matches(word: str, ranks: dict, limit: int, cutoff: float) -> list:
+    """
+    difflib.get_close_matches over the keys of `ranks`, with equally close
+    keys ordered by their rank instead of reverse-alphabetically.
+    """
+    matcher = difflib.SequenceMatcher(b=word)
+    scored = []
+    for candidate in difflib.get_close_matches(word, ranks, n=len(ranks), cutoff=cutoff):
+        matcher.set_seq1(candidate)
+        scored.append((-matcher.ratio(), ranks[candidate], candidate))
+    return [candidate for _, _, candidate in sorted(scored)[:limit]]
+
+
+# ============================================================
+#  INDEX
+# ============================================================
+
+class LocationIndex:
+
+    def __init__(self, airports, strict: bool = LOCATION_STRICT):
+        self.strict = strict
+        self.airports = {a.iata: a for a in airports}
+        # position in the data file; ties between matches go to the airport listed first
+        self._priority = {code: i for i, code in enumerate(self.airports)}
+        self.cities = {}
+        for a in self.airports.values():
+            self.cities.setdefault(a.city_code, []).append(a)
+
+        entries = set()
+        for a in self.airports.values():
+            entries.add((fold(a.iata), RANK_CODE, a.iata))
+            entries.add((fold(a.city_code), RANK_CITY, a.iata))
+            entries.add((fold(a.city), RANK_CITY, a.iata))
+            entries.add((fold(a.name), RANK_NAME, a.iata))
+            for word in set(fold(a.name).split()[1:] + fold(a.city).split()[1:]):
+                entries.add((word, RANK_WORD, a.iata))
+        # parallel arrays: bisect on the keys, read the rest by position
+        ordered = sorted(entries)
+        self._keys = [key for key, _, _ in ordered]
+        self._ranks = [rank for _, rank, _ in ordered]
+        self._codes = [code for _, _, code in ordered]
+
+    @classmethod
+    def load(cls, path: str = LOCATION_DATA_PATH, strict: bool = LOCATION_STRICT):
+        with open(path, newline="", encoding="utf8") as f:
+            airports = [
+                Airport(row["iata"].strip().upper(), row["name"].strip(), row["city"].strip(),
+                        (row.get("city_code") or row["iata"]).strip().upper(), row.get("country", "").strip().upper())
+                for row in csv.DictReader(f)
+                if row.get("iata")
+            ]
+        return cls(airports, strict=strict)
+
+    # ---------- lookups ----------
+
+    def airport(self, code: str):
+        return self.airports.get((code or "").strip().upper())
+
+    def is_known(self, code: str) -> bool:
+        code = (code or "").strip().upper()
+        return code in self.airports or code in self.cities
+
+    def city_code(self, code: str) -> str:
+        """
+        The city an airport code belongs to (CGK -> JKT, LHR -> LON); city
+        codes and unknown codes are returned unchanged.
+        """
+        code = (code or "").strip().upper()
+        airport = self.airports.get(code)
+        return airport.city_code if airport else code
+
+    def airports_in(self, city_code: str) -> list:
+        return list(self.cities.get((city_code or "").strip().upper(), []))
+
+    def describe(self, code: str) -> str:
+        """
+        Display label of an airport or city code.
+        """
+        airport = self.airport(code)
+        if airport:
+            return airport.label
+        airports = self.airports_in(code)
+        if not airports:
+            return code
+        return f"{code.strip().upper()} — {airports[0].city}, all airports ({', '.join(a.iata for a in airports)})"
+
+    def autocomplete(self, prefix: str, limit: int = 8) -> list:
+        """
+        Airports whose code, city or name (or a word of it) starts with
+        `prefix`, best matches first: code, then city, then name.
+        """
+        query = fold(prefix)
+        if not query:
+            return []
+        best = {}
+        i = bisect_left(self._keys, query)
+        while i < len(self._keys) and self._keys[i].startswith(query):
+            code = self._codes[i]
+            score = (self._ranks[i], self._keys[i] != query)
+            if code not in best or score < best[code]:
+                best[code] = score
+            i += 1
+        ranked = sorted(best, key=lambda code: (best[code], self._priority[code]))
+        return [self.airports[code] for code in ranked[:limit]]
+
+    def resolve(self, text: str):
+        """
+        The code meant by free text: a known code as is, or the city/airport
+        an unambiguous name refers to ("Amsterdam" -> AMS, "London" -> LON).
+        None when it cannot be told.
+        """
+        if self.is_known(text):
+            return text.strip().upper()
+        query = fold(text)
+        matches = self.autocomplete(text, limit=50)
+        if not matches:
+            return None
+        cities = {a.city_code for a in matches}
+        # "Malta" is Malta International's name as well as a town in Montana
+        exact = sorted((a for a in matches if query in (fold(a.city), fold(a.name))), key=lambda a: self._priority[a.iata])
+        if exact:
+            city_code = exact[0].city_code
+            if fold(exact[0].name) == query or len(self.cities[city_code]) == 1:
+                return exact[0].iata
+            return city_code
+        if len(matches) == 1:
+            return matches[0].iata
+        if len(cities) == 1:
+            city_code = cities.pop()
+            return city_code if len(self.cities[city_code]) > 1 else matches[0].iata
+        return None
+
+    def suggest(self, text: str, limit: int = 3) -> list:
+        """
+        Likely intended codes for something that is not a known code.
+        """
+        code = (text or "").strip().upper()
+        close = []
+        if _CODE.match(code):
+            codes = {c: self._priority[airports[0].iata] for c, airports in self.cities.items()}
+            codes.update(self._priority)
+            close = _close_matches(code, codes, limit, cutoff=0.6)
+        by_name = [a.iata for a in self.autocomplete(text, limit)]
+        # misspelt city names ("amsterdm")
+        city_names, ranks = {}, {}
+        for a in self.airports.values():
+            name = fold(a.city)
+            if name not in city_names:
+                city_names[name], ranks[name] = a.city_code, self._priority[a.iata]
+        by_city = [city_names[name] for name in _close_matches(fold(text), ranks, limit, cutoff=0.8)]
+        return list(dict.fromkeys(close + by_name + by_city))[:limit]
+
+    def check_code(self, text: str, role: str) -> str:
+        """
+        Normalized code for `text`, or InvalidSearchError if it cannot be a
+        location Amadeus knows.
+        """
+        code = (text or "").strip().upper()
+        if not _CODE.match(code):
+            resolved = self.resolve(text or "")
+            if resolved:
+                return resolved
+            raise InvalidSearchError(f"{role} '{text}' is not a 3-letter IATA code.", self.suggest(text))
+        if self.strict and not self.is_known(code):
+            suggestions = self.suggest(code)
+            hint = f" Did you mean {', '.join(suggestions)}?" if suggestions else ""
+            raise InvalidSearchError(f"Unknown {role.lower()} code '{code}'.{hint}", suggestions)
+        return code
+
+
+location_index = LocationIndex.load()
+
+
+# ============================================================
+#  PRE-FLIGHT VALIDATION
+# ============================================================
+
+def _as_date(value, role: str) -> date:
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise InvalidSearchError(f"{role} '{value}' is not a date (YYYY-MM-DD).")
+
+
+def validate_flight_search(origin, destination, departure_date, return_date=None, adults: int = 1,
+                           index: LocationIndex = None):
+    """
+    Reject flight searches that cannot succeed. Returns the normalized
+    (origin, destination) codes.
+    """
+    index = index or location_index
+    origin = index.check_code(origin, "Origin")
+    destination = index.check_code(destination, "Destination")
+    if index.city_code(origin) == index.city_code(destination):
+        raise InvalidSearchError(f"Origin and destination are the same place ({origin} / {destination}).")
+
+    departure = _as_date(departure_date, "Departure date")
+    if departure < date.today():
+        raise InvalidSearchError(f"Departure date {departure} is in the past.")
+    if return_date:
+        if _as_date(return_date, "Return date") < departure:
+            raise InvalidSearchError("Return date is before the departure date.")
+    if not 1 <= int(adults) <= MAX_ADULTS:
+        raise InvalidSearchError(f"Adults must be between 1 and {MAX_ADULTS}.")
+    return origin, destination
+
+
+def validate_hotel_search(city_code, check_in, check_out, index: LocationIndex = None) -> str:
+    """
+    Reject hotel searches that cannot succeed. Returns the city code to
+    search, so an airport code (e.g. CGK) becomes its city (JKT).
+    """
+    index = index or location_index
+    code = index.city_code(index.check_code(city_code, "City"))
+    arrival = _as_date(check_in, "Check-in date")
+    if arrival < date.today():
+        raise InvalidSearchError(f"Check-in date {arrival} is in the past.")
+    if _as_date(check_out, "Check-out date") <= arrival:
+        raise InvalidSearchError("Check-out must be after check-in.")
+    return code
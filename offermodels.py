@@ -0,0 +1,196 @@
+"""
+Offer models
+Compact records for flight and hotel offers, parsed once when a search
+returns. Display strings, numeric prices and datetimes are precomputed so
+the UI never walks the raw Amadeus payload again; the raw flight offer is
+kept compressed and only decoded when it is booked.
+"""
+
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+import json
+import re
+import zlib
+
+
+# ============================================================
+#  HELPERS
+# ============================================================
+
+_DURATION = re.compile(r"P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?")
+
+
+def parse_dt(iso):
+    try:
+        return datetime.fromisoformat(iso)
+    except (TypeError, ValueError):
+        try:
+            # fallback if missing seconds
+            return datetime.strptime(iso, "%Y-%m-%d %H:%M")
+        except (TypeError, ValueError):
+            return None
+
+
+def format_dt(dt, fallback="N/A"):
+    return dt.strftime("%b %d, %Y %H:%M") if dt else fallback
+
+
+def parse_duration_minutes(iso_duration):
+    """
+    Minutes in an ISO 8601 duration such as "PT14H30M" or "P1DT2H".
+    """
+    match = _DURATION.fullmatch(iso_duration or "")
+    if not match or not any(match.groups()):
+        return None
+    days, hours, minutes = (int(g) if g else 0 for g in match.groups())
+    return days * 1440 + hours * 60 + minutes
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ============================================================
+#  FLIGHTS
+# ============================================================
+
+@dataclass(slots=True)
+class FlightOffer:
+    offer_id: str
+    airline: str
+    origin: str
+    destination: str
+    departure_at: datetime | None
+    arrival_at: datetime | None
+    departure_display: str
+    arrival_display: str
+    stops: int
+    duration_minutes: int | None
+    itinerary_count: int
+    total_duration_minutes: int | None
+    price: float | None
+    currency: str
+    display_price: str
+    _raw: bytes = field(repr=False)
+
+    @classmethod
+    def from_amadeus(cls, offer: dict):
+        price = offer.get("price", {})
+        first_itin = offer.get("itineraries", [])[0] if offer.get("itineraries") else {}
+        segs = first_itin.get("segments", []) or []
+        first_seg = segs[0] if segs else {}
+        last_seg = segs[-1] if segs else first_seg
+        dep_time = first_seg.get("departure", {}).get("at", "N/A")
+        arr_time = last_seg.get("arrival", {}).get("at", "N/A")
+        departure_at = parse_dt(dep_time)
+        arrival_at = parse_dt(arr_time)
+        total = price.get("total", "N/A")
+        currency = price.get("currency", "")
+        # round trips carry one itinerary per direction
+        durations = [parse_duration_minutes(itin.get("duration")) for itin in offer.get("itineraries", [])]
+        return cls(
+            offer_id=str(offer.get("id", "")),
+            airline=first_seg.get("carrierCode", "N/A"),
+            origin=first_seg.get("departure", {}).get("iataCode", "N/A"),
+            destination=last_seg.get("arrival", {}).get("iataCode", "N/A"),
+            departure_at=departure_at,
+            arrival_at=arrival_at,
+            departure_display=format_dt(departure_at, dep_time),
+            arrival_display=format_dt(arrival_at, arr_time),
+            stops=max(0, len(segs) - 1),
+            duration_minutes=parse_duration_minutes(first_itin.get("duration")),
+            itinerary_count=len(durations),
+            total_duration_minutes=sum(durations) if durations and None not in durations else None,
+            price=_to_float(total),
+            currency=currency,
+            display_price=f"{total} {currency}".strip(),
+            _raw=zlib.compress(json.dumps(offer, separators=(",", ":")).encode("utf8")),
+        )
+
+    @property
+    def raw(self) -> dict:
+        """
+        The original Amadeus offer, as needed for booking.
+        """
+        return json.loads(zlib.decompress(self._raw))
+
+
+def parse_flight_offers(offers) -> list:
+    return [FlightOffer.from_amadeus(offer) for offer in offers or []]
+
+
+# ============================================================
+#  HOTELS
+# ============================================================
+
+@dataclass(slots=True)
+class HotelOffer:
+    offer_id: str | None  # None when the search result carried no offer ID; such an offer cannot be booked
+    hotel_name: str
+    price: float | None
+    currency: str
+    display_price: str
+
+    @classmethod
+    def from_simplified(cls, offer: dict):
+        """
+        Build from the simplified dicts returned by amadeuscaller.search_hotels.
+        """
+        price = offer.get("price")
+        currency = offer.get("currency", "")
+        return cls(
+            offer_id=offer.get("offer_id") or offer.get("id"),
+            hotel_name=offer.get("hotel_name") or offer.get("hotel", {}).get("name", "Unknown"),
+            price=_to_float(price),
+            currency=currency,
+            display_price=f"{price} {currency}".strip(),
+        )
+
+
+def parse_hotel_offers(offers) -> list:
+    return [HotelOffer.from_simplified(offer) for offer in offers or []]
+
+
+# ============================================================
+#  BUNDLES
+# ============================================================
+
+@dataclass(slots=True)
+class TripBundle:
+    score: float
+    total_price: float
+    currency: str
+    duration_minutes: int | None
+    flights: tuple             # one round-trip FlightOffer, or outbound + return
+    hotel: HotelOffer | None   # None when no hotel offers were found
+
+    @property
+    def display_price(self) -> str:
+        return f"{self.total_price:.2f} {self.currency}".strip()
+
+    def to_dict(self) -> dict:
+        """
+        JSON-safe form; flights are carried as their raw Amadeus offers.
+        """
+        return {
+            "score": self.score,
+            "total_price": self.total_price,
+            "currency": self.currency,
+            "duration_minutes": self.duration_minutes,
+            "flights": [flight.raw for flight in self.flights],
+            "hotel": asdict(self.hotel) if self.hotel else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(
+            score=data["score"],
+            total_price=data["total_price"],
+            currency=data["currency"],
+            duration_minutes=data["duration_minutes"],
+            flights=tuple(parse_flight_offers(data["flights"])),
+            hotel=HotelOffer(**data["hotel"]) if data.get("hotel") else None,
+        )
@@ -0,0 +1,96 @@
+"""
+Search orchestrator
+Runs independent searches (flights, hotels, ...) side by side so the user
+waits for the slowest one instead of the sum of all of them.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import contextvars
+import os
+import time
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+MAX_SEARCH_WORKERS = int(os.getenv("MAX_SEARCH_WORKERS", "8"))
+
+
+# ============================================================
+#  ORCHESTRATION
+# ============================================================
+
+class _Branch:
+    __slots__ = ("name", "timeout", "started")
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        self.started = None
+
+    def run(self, fn, kwargs):
+        self.started = time.perf_counter()
+        return fn(**kwargs)
+
+    def deadline(self, now):
+        # a branch that has not started yet cannot expire before now + timeout
+        if not self.timeout:
+            return None
+        return (self.started or now) + self.timeout
+
+
+def run_concurrently(branches: dict):
+    """
+    Run the branches side by side and yield results as each one finishes.
+
+    `branches` maps a name to a (function, kwargs, timeout_seconds) tuple.
+    At most MAX_SEARCH_WORKERS branches run at once; the others start as
+    running ones finish or time out, and each branch's timeout counts from
+    when it starts running. Yields (name, result, error, elapsed_seconds) in
+    completion order; exactly one of result/error is meaningful. A branch
+    that raises or runs past its own timeout yields an error without
+    affecting the others.
+    """
+    started = time.perf_counter()
+    queued = list(branches.items())
+    # A pool per call, with a thread per branch at most: a branch that
+    # overruns its timeout keeps its thread until it returns, but no longer
+    # counts against MAX_SEARCH_WORKERS, and it never holds up another call.
+    executor = ThreadPoolExecutor(max_workers=max(1, len(queued)), thread_name_prefix="search")
+    pending = {}
+
+    def launch():
+        while queued and len(pending) < MAX_SEARCH_WORKERS:
+            name, (fn, kwargs, timeout) = queued.pop(0)
+            branch = _Branch(name, timeout)
+            # each branch runs in a copy of the caller's context so it shares
+            # the caller's rate-limit deadline budget
+            pending[executor.submit(contextvars.copy_context().run, branch.run, fn, kwargs)] = branch
+
+    try:
+        launch()
+        while pending:
+            now = time.perf_counter()
+            deadlines = [d for d in (b.deadline(now) for b in pending.values()) if d is not None]
+            wait_for = max(0.0, min(deadlines) - now) if deadlines else None
+
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                branch = pending.pop(future)
+                elapsed = time.perf_counter() - started
+                try:
+                    yield branch.name, future.result(), None, elapsed
+                except Exception as e:
+                    yield branch.name, None, e, elapsed
+
+            # Expire the branches whose own deadline has passed
+            now = time.perf_counter()
+            for future, branch in list(pending.items()):
+                if branch.started is not None and now >= branch.deadline(now):
+                    pending.pop(future)
+                    yield branch.name, None, TimeoutError(f"{branch.name} search timed out"), now - started
+            launch()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
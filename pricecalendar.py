@@ -0,0 +1,132 @@
+"""
+Flexible-date price calendar
+Fans a flight search out over a window of departure (and return) dates and
+reduces the results to the cheapest total per date pair.
+"""
+
+from datetime import date, timedelta
+import os
+
+from amadeuscaller import search_flights
+from orchestrator import run_concurrently
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+CALENDAR_SEARCH_TIMEOUT = int(os.getenv("CALENDAR_SEARCH_TIMEOUT", "45"))  # seconds per single-date search
+
+
+# ============================================================
+#  CALENDAR
+# ============================================================
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def _date_window(center: date, window_days: int):
+    earliest = date.today()
+    days = [center + timedelta(days=offset) for offset in range(-window_days, window_days + 1)]
+    return [d for d in days if d >= earliest]
+
+
+def _cheapest(offers):
+    best = None
+    for offer in offers or []:
+        try:
+            total = float(offer["price"]["total"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if best is None or total < best[0]:
+            best = (total, offer)
+    return best
+
+
+def calendar_searches(window_days: int = 3, return_date=None) -> int:
+    """
+    Most flight searches one calendar makes: every date of each leg once
+    (fewer when part of the window is in the past).
+    """
+    return (2 * window_days + 1) * (2 if return_date else 1)
+
+
+def search_price_calendar(origin: str, destination: str, departure_date, return_date=None, window_days: int = 3,
+                          matrix: bool = False, adults: int = 1, max_results: int = 5, fresh: bool = False):
+    """
+    Cheapest fares around `departure_date` (± `window_days`).
+
+    Without `return_date` this is a one-way calendar. With it, the trip
+    length is kept and both legs shift together; with `matrix=True` every
+    departure date is paired with every return date in the return window.
+    Each leg/date is searched once (through the search cache), so a D x R
+    matrix costs D + R searches, not D * R.
+
+    Returns a dict:
+        departure_dates / return_dates: ISO dates on each axis
+        prices: {departure_date: {return_date or "": cheapest total}}
+        currency: currency of the totals
+        cheapest: the best cell, or None
+        outbound / inbound: {date: cheapest offer for that leg and date}
+        failed: searches that errored or timed out
+    """
+    departure_date = _as_date(departure_date)
+    departures = _date_window(departure_date, window_days)
+
+    if return_date is None:
+        pairs = [(d, None) for d in departures]
+    else:
+        return_date = _as_date(return_date)
+        if matrix:
+            returns = _date_window(return_date, window_days)
+            pairs = [(d, r) for d in departures for r in returns if r >= d]
+        else:
+            trip_length = return_date - departure_date
+            pairs = [(d, d + trip_length) for d in departures]
+
+    branches = {}
+    for dep, ret in pairs:
+        branches.setdefault(("outbound", dep), (search_flights, dict(
+            origin=origin, destination=destination, departure_date=dep.isoformat(),
+            adults=adults, max_results=max_results, fresh=fresh), CALENDAR_SEARCH_TIMEOUT))
+        if ret is not None:
+            branches.setdefault(("inbound", ret), (search_flights, dict(
+                origin=destination, destination=origin, departure_date=ret.isoformat(),
+                adults=adults, max_results=max_results, fresh=fresh), CALENDAR_SEARCH_TIMEOUT))
+
+    best = {"outbound": {}, "inbound": {}}
+    failed = []
+    for (leg, day), result, error, _ in run_concurrently(branches):
+        if error is not None:
+            failed.append({"leg": leg, "date": day.isoformat(), "error": str(error)})
+            continue
+        cheapest = _cheapest(result)
+        if cheapest is not None:
+            best[leg][day] = cheapest
+
+    prices = {}
+    currency = None
+    cheapest_cell = None
+    for dep, ret in pairs:
+        out = best["outbound"].get(dep)
+        back = best["inbound"].get(ret) if ret is not None else (0.0, None)
+        if out is None or back is None:
+            continue
+        total = round(out[0] + back[0], 2)
+        currency = currency or out[1]["price"].get("currency")
+        ret_key = ret.isoformat() if ret is not None else ""
+        prices.setdefault(dep.isoformat(), {})[ret_key] = total
+        if cheapest_cell is None or total < cheapest_cell["total"]:
+            cheapest_cell = {"departure_date": dep.isoformat(), "return_date": ret_key or None, "total": total}
+
+    return {
+        "departure_dates": sorted({dep.isoformat() for dep, _ in pairs}),
+        "return_dates": sorted({ret.isoformat() for _, ret in pairs if ret is not None}),
+        "prices": prices,
+        "currency": currency,
+        "cheapest": cheapest_cell,
+        "outbound": {day.isoformat(): offer for day, (_, offer) in best["outbound"].items()},
+        "inbound": {day.isoformat(): offer for day, (_, offer) in best["inbound"].items()},
+        "failed": failed,
+    }
@@ -0,0 +1,402 @@
+"""
+Price watches
+Users watch a flight route/date or a hotel stay; a background scheduler
+re-polls each unique query once (no matter how many users watch it) at a
+jittered interval, diffs the offers against the previous snapshot and stores
+only what changed. The UI just reads the change log.
+"""
+
+from datetime import date
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from amadeuscaller import search_flights, search_hotels
+from ratelimiter import rate_limiter, action_budget, RateLimitError
+from searchcache import make_key
+from telemetry import get_logger
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+PRICE_WATCH_PATH = os.getenv("PRICE_WATCH_PATH", os.path.join(".cache", "pricewatch.sqlite"))
+PRICE_WATCH_INTERVAL = int(os.getenv("PRICE_WATCH_INTERVAL", "1800"))  # seconds between polls of one query
+PRICE_WATCH_JITTER = 0.2        # polls are spread over interval ± 20%
+PRICE_WATCH_TICK = 15.0         # seconds between scheduler sweeps
+PRICE_WATCH_MIN_HEADROOM = 0.5  # only poll while at least half of the endpoint's bucket is free
+POLL_BUDGET = 10.0              # max seconds one poll may wait on rate limits
+LEASE_SECONDS = 300.0           # a claimed poll not finished by then may be taken over
+DEFER_SECONDS = (30.0, 90.0)    # retry window for polls skipped for lack of rate budget
+
+log = get_logger("pricewatch")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    query_key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    label TEXT NOT NULL,
+    expires_on TEXT NOT NULL,
+    next_poll_at REAL NOT NULL,
+    leased_until REAL NOT NULL DEFAULT 0,
+    last_polled_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS queries_due ON queries (next_poll_at);
+CREATE TABLE IF NOT EXISTS watches (
+    watch_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    query_key TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (session_id, query_key)
+);
+CREATE INDEX IF NOT EXISTS watches_query ON watches (query_key);
+CREATE TABLE IF NOT EXISTS snapshots (
+    query_key TEXT NOT NULL,
+    offer_key TEXT NOT NULL,
+    label TEXT NOT NULL,
+    price REAL NOT NULL,
+    currency TEXT,
+    PRIMARY KEY (query_key, offer_key)
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    query_key TEXT NOT NULL,
+    offer_key TEXT NOT NULL,
+    label TEXT NOT NULL,
+    change TEXT NOT NULL,
+    old_price REAL,
+    new_price REAL,
+    currency TEXT,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_query ON changes (query_key, seq);
+"""
+
+
+# ============================================================
+#  SNAPSHOTS
+# ============================================================
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _flight_snapshot(offers) -> dict:
+    """
+    {offer_key: (label, price, currency)}. Amadeus offer ids are only
+    positions in one response, so an offer is identified by its flights.
+    """
+    snapshot = {}
+    for offer in offers:
+        itineraries = offer.get("itineraries", [])
+        segments = [seg for itin in itineraries for seg in itin.get("segments", [])]
+        if not segments:
+            continue
+        key = "/".join(f"{s.get('carrierCode', '')}{s.get('number', '')}@{s.get('departure', {}).get('at', '')}"
+                       for s in segments)
+        first = segments[0]
+        stops = max(0, len(itineraries[0].get("segments", [])) - 1)
+        label = (f"{first.get('carrierCode', '')}{first.get('number', '')} {first.get('departure', {}).get('at', '')[11:16]}"
+                 f" ({stops} stop{'s' if stops != 1 else ''})")
+        price = _to_float(offer.get("price", {}).get("total"))
+        if price is not None and (key not in snapshot or price < snapshot[key][1]):
+            snapshot[key] = (label, price, offer.get("price", {}).get("currency"))
+    return snapshot
+
+
+def _hotel_snapshot(offers) -> dict:
+    # cheapest offer per hotel; hotel offer ids change between searches
+    snapshot = {}
+    for offer in offers:
+        name = offer.get("hotel_name")
+        price = _to_float(offer.get("price"))
+        if name and price is not None and (name not in snapshot or price < snapshot[name][1]):
+            snapshot[name] = (name, price, offer.get("currency"))
+    return snapshot
+
+
+# kind -> (search function, rate-limit bucket of its endpoint, snapshot builder)
+POLLERS = {
+    "flights": (search_flights, "amadeus:flight_offers_search", _flight_snapshot),
+    "hotels": (search_hotels, "amadeus:hotel_offers_search", _hotel_snapshot),
+}
+
+
+def diff_snapshots(old: dict, new: dict) -> list:
+    """
+    (offer_key, label, change, old_price, new_price, currency) for every
+    offer that appeared, disappeared or changed price.
+    """
+    changes = []
+    for key, (label, price, currency) in new.items():
+        if key not in old:
+            changes.append((key, label, "new", None, price, currency))
+        elif abs(price - old[key][1]) >= 0.01:
+            changes.append((key, label, "drop" if price < old[key][1] else "rise", old[key][1], price, currency))
+    for key, (label, price, currency) in old.items():
+        if key not in new:
+            changes.append((key, label, "gone", price, None, currency))
+    return changes
+
+
+# ============================================================
+#  WATCHES
+# ============================================================
+
+class PriceWatch:
+
+    def __init__(self, path: str = PRICE_WATCH_PATH, interval: int = PRICE_WATCH_INTERVAL,
+                 jitter: float = PRICE_WATCH_JITTER):
+        self.path = path
+        self.interval = interval
+        self.jitter = jitter
+        self.stats = {"polls": 0, "changes": 0, "deferred": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._scheduler = None
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self.stats[name] += n
+
+    # ---------- subscriptions ----------
+
+    def watch(self, session_id: str, kind: str, params: dict, label: str, expires_on) -> str:
+        """
+        Watch a search for `session_id`. Identical searches share one query
+        (and one poll); watching the same search twice returns the
+        existing watch. Polling stops after `expires_on` (the travel date).
+        """
+        query_key = make_key(kind, params)
+        expires_on = expires_on.isoformat() if isinstance(expires_on, date) else str(expires_on)
+        conn = self._transaction()
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO queries (query_key, kind, params, label, expires_on, next_poll_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (query_key, kind, json.dumps(params, sort_keys=True), label, expires_on, time.time()),
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO watches (watch_id, session_id, query_key, created_at) VALUES (?, ?, ?, ?)",
+                (uuid.uuid4().hex, session_id, query_key, time.time()),
+            )
+            watch_id = conn.execute(
+                "SELECT watch_id FROM watches WHERE session_id = ? AND query_key = ?", (session_id, query_key)
+            ).fetchone()[0]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return watch_id
+
+    def unwatch(self, watch_id: str):
+        """
+        Remove a watch; a query nobody watches any more is dropped with its
+        snapshot and change log.
+        """
+        conn = self._transaction()
+        try:
+            row = conn.execute("SELECT query_key FROM watches WHERE watch_id = ?", (watch_id,)).fetchone()
+            conn.execute("DELETE FROM watches WHERE watch_id = ?", (watch_id,))
+            if row is not None and conn.execute(
+                "SELECT 1 FROM watches WHERE query_key = ? LIMIT 1", (row[0],)
+            ).fetchone() is None:
+                for table in ("queries", "snapshots", "changes"):
+                    conn.execute(f"DELETE FROM {table} WHERE query_key = ?", (row[0],))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def watches(self, session_id: str) -> list:
+        """
+        The session's watches with the cheapest price of the last snapshot.
+        """
+        rows = self._conn().execute(
+            "SELECT w.watch_id, q.kind, q.label, q.last_polled_at, q.last_error,"
+            " (SELECT MIN(price) FROM snapshots s WHERE s.query_key = q.query_key),"
+            " (SELECT currency FROM snapshots s WHERE s.query_key = q.query_key ORDER BY price LIMIT 1)"
+            " FROM watches w JOIN queries q ON q.query_key = w.query_key"
+            " WHERE w.session_id = ? ORDER BY w.created_at",
+            (session_id,),
+        ).fetchall()
+        return [
+            {"watch_id": r[0], "kind": r[1], "label": r[2], "last_polled_at": r[3], "last_error": r[4],
+             "cheapest": r[5], "currency": r[6]}
+            for r in rows
+        ]
+
+    def changes_since(self, session_id: str, seq: int = 0, kinds=("drop",)) -> list:
+        """
+        Changes to the session's watched queries after sequence `seq` (and
+        after each watch was created), oldest first.
+        """
+        marks = ", ".join("?" for _ in kinds)
+        rows = self._conn().execute(
+            "SELECT c.seq, q.label, c.label, c.change, c.old_price, c.new_price, c.currency, c.at"
+            " FROM changes c JOIN watches w ON w.query_key = c.query_key JOIN queries q ON q.query_key = c.query_key"
+            f" WHERE w.session_id = ? AND c.seq > ? AND c.at >= w.created_at AND c.change IN ({marks})"
+            " ORDER BY c.seq",
+            (session_id, seq, *kinds),
+        ).fetchall()
+        return [
+            {"seq": r[0], "watch": r[1], "offer": r[2], "change": r[3], "old_price": r[4], "new_price": r[5],
+             "currency": r[6], "at": r[7]}
+            for r in rows
+        ]
+
+    # ---------- polling ----------
+
+    def _next_poll(self, now):
+        return now + self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _claim_due(self, limit: int):
+        now = time.time()
+        conn = self._transaction()
+        try:
+            due = conn.execute(
+                "SELECT query_key, kind, params FROM queries"
+                " WHERE next_poll_at <= ? AND leased_until < ? AND expires_on >= ?"
+                " ORDER BY next_poll_at LIMIT ?",
+                (now, now, date.today().isoformat(), limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE queries SET leased_until = ? WHERE query_key = ?",
+                [(now + LEASE_SECONDS, query_key) for query_key, _, _ in due],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return due
+
+    def _release(self, query_key, next_poll_at, polled_at=None, error=None):
+        self._conn().execute(
+            "UPDATE queries SET leased_until = 0, next_poll_at = ?, last_polled_at = COALESCE(?, last_polled_at),"
+            " last_error = ? WHERE query_key = ?",
+            (next_poll_at, polled_at, error, query_key),
+        )
+
+    def poll_due(self, limit: int = 5) -> int:
+        """
+        Poll up to `limit` due queries claimed by this process. A poll is
+        put off (not skipped) while its endpoint has little rate budget
+        left, so interactive searches keep priority. Returns polls made.
+        """
+        polled = 0
+        for query_key, kind, params in self._claim_due(limit):
+            search, bucket, _ = POLLERS[kind]
+            if rate_limiter.headroom(bucket) < PRICE_WATCH_MIN_HEADROOM:
+                self._count("deferred")
+                self._release(query_key, time.time() + random.uniform(*DEFER_SECONDS))
+                continue
+            try:
+                with action_budget(POLL_BUDGET):
+                    rate_limiter.acquire("pricewatch")
+                    offers = search(**json.loads(params), fresh=True)
+            except RateLimitError:
+                self._count("deferred")
+                self._release(query_key, time.time() + random.uniform(*DEFER_SECONDS))
+                continue
+            except Exception as e:
+                self._count("errors")
+                self._release(query_key, self._next_poll(time.time()), time.time(), str(e) or e.__class__.__name__)
+                continue
+            self._store(query_key, kind, offers)
+            polled += 1
+        return polled
+
+    def _store(self, query_key, kind, offers):
+        now = time.time()
+        if not offers:
+            # an empty answer is more likely an upstream hiccup than every offer selling out
+            self._release(query_key, self._next_poll(now), now, "No offers returned")
+            return
+        new = POLLERS[kind][2](offers)
+        conn = self._transaction()
+        try:
+            old = {key: (label, price, currency) for key, label, price, currency in conn.execute(
+                "SELECT offer_key, label, price, currency FROM snapshots WHERE query_key = ?", (query_key,)
+            )}
+            # the first poll only sets the baseline
+            changes = diff_snapshots(old, new) if old else []
+            conn.executemany(
+                "INSERT INTO changes (query_key, offer_key, label, change, old_price, new_price, currency, at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(query_key, *change, now) for change in changes],
+            )
+            for key, label, change, _, price, currency in changes:
+                if change == "gone":
+                    conn.execute("DELETE FROM snapshots WHERE query_key = ? AND offer_key = ?", (query_key, key))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO snapshots (query_key, offer_key, label, price, currency)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (query_key, key, label, price, currency),
+                    )
+            if not old:
+                conn.executemany(
+                    "INSERT INTO snapshots (query_key, offer_key, label, price, currency) VALUES (?, ?, ?, ?, ?)",
+                    [(query_key, key, *value) for key, value in new.items()],
+                )
+            conn.execute(
+                "UPDATE queries SET leased_until = 0, next_poll_at = ?, last_polled_at = ?, last_error = NULL"
+                " WHERE query_key = ?",
+                (self._next_poll(now), now, query_key),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._count("polls")
+        self._count("changes", len(changes))
+
+    def start(self, tick: float = PRICE_WATCH_TICK):
+        """
+        Start the background scheduler (once per process). Every process
+        may run one; leases make sure each due query is polled only once.
+        """
+        with self._start_lock:
+            if self._scheduler is not None:
+                return
+
+            def loop():
+                while True:
+                    time.sleep(tick * random.uniform(0.5, 1.5))
+                    try:
+                        self.poll_due()
+                    except Exception as e:
+                        log.warning("price_watch_sweep_failed error=%s", e)
+
+            self._scheduler = threading.Thread(target=loop, name="price-watch", daemon=True)
+            self._scheduler.start()
+
+
+price_watch = PriceWatch()
@@ -0,0 +1,324 @@
+"""
+Client-side rate limiting
+One token bucket per upstream key (e.g. "amadeus:flight_offers_search",
+"gemini"), shared by every thread and process through a small SQLite file.
+Buckets honor Retry-After, back off adaptively after 429s and open a circuit
+breaker after repeated failures. Waiting is bounded by the deadline of the
+current user action, so a throttled click fails fast instead of freezing
+the UI.
+"""
+
+from contextlib import contextmanager
+import contextvars
+import os
+import random
+import sqlite3
+import threading
+import time
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", os.path.join(".cache", "ratelimits.sqlite"))
+
+# (requests per second, burst) per key; a key falls back to its upstream
+# prefix ("amadeus:hotel_offers_search" -> "amadeus")
+DEFAULT_LIMITS = {
+    "amadeus": (10.0, 10),
+    "amadeus:hotel_offers_search": (5.0, 5),
+    "gemini": (0.25, 2),
+    "pricewatch": (0.2, 1),  # background price-watch polls, see pricewatch.py
+}
+
+DEFAULT_MAX_WAIT = 30.0         # seconds a call may wait when no action budget is set
+BREAKER_THRESHOLD = 5           # consecutive failures that open the circuit
+BREAKER_COOLDOWN = 30.0         # seconds the circuit stays open
+MIN_RATE_FACTOR = 0.1           # adaptive backoff never goes below 10% of the limit
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0,
+    rate_factor REAL NOT NULL DEFAULT 1,
+    throttles INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    open_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+class RateLimitError(Exception):
+    """
+    Raised when a call cannot be made within the current deadline budget.
+    """
+
+    def __init__(self, key: str, retry_after: float, message: str = None):
+        self.key = key
+        self.retry_after = retry_after
+        super().__init__(message or f"{key} is rate limited, retry in {retry_after:.1f}s")
+
+
+class CircuitOpenError(RateLimitError):
+    """
+    Raised while an upstream's circuit breaker is open.
+    """
+
+    def __init__(self, key: str, retry_after: float):
+        super().__init__(key, retry_after, f"{key} is unavailable (circuit open), retry in {retry_after:.1f}s")
+
+
+# ============================================================
+#  DEADLINE BUDGET
+# ============================================================
+
+_deadline = contextvars.ContextVar("rate_limit_deadline", default=None)
+
+
+@contextmanager
+def action_budget(seconds: float):
+    """
+    Bound the total time calls inside this block may spend waiting for rate
+    limits. Worker threads inherit it when started with a copied context.
+    """
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget():
+    deadline = _deadline.get()
+    if deadline is None:
+        return DEFAULT_MAX_WAIT
+    return max(0.0, deadline - time.monotonic())
+
+
+# ============================================================
+#  LIMITER
+# ============================================================
+
+class RateLimiter:
+
+    def __init__(self, path: str = RATE_LIMIT_PATH, limits: dict = None):
+        self.path = path
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.stats = {"acquired": 0, "waited": 0, "rejected": 0, "throttled": 0, "circuit_open": 0}
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        # per thread and per process: a connection inherited through fork() is not reused
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so the
+        # read-modify-write of a bucket is atomic across processes
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def limit_for(self, key: str):
+        if key in self.limits:
+            return self.limits[key]
+        return self.limits.get(key.split(":", 1)[0], (10.0, 10))
+
+    def _load(self, conn, key, now):
+        row = conn.execute(
+            "SELECT tokens, updated_at, blocked_until, rate_factor, throttles, failures, open_until"
+            " FROM buckets WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            _, burst = self.limit_for(key)
+            return [float(burst), now, 0.0, 1.0, 0, 0, 0.0]
+        return list(row)
+
+    def _save(self, conn, key, state):
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets"
+            " (key, tokens, updated_at, blocked_until, rate_factor, throttles, failures, open_until)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [key] + state,
+        )
+
+    def _try_acquire(self, key: str):
+        """
+        Take a token if one is available. Returns 0 on success, otherwise
+        the number of seconds until one could be.
+        """
+        rate, burst = self.limit_for(key)
+        now = time.time()
+        with self._transaction() as conn:
+            tokens, updated_at, blocked_until, rate_factor, throttles, failures, open_until = self._load(conn, key, now)
+            if open_until > now:
+                raise CircuitOpenError(key, open_until - now)
+
+            effective_rate = rate * rate_factor
+            tokens = min(float(burst), tokens + (now - updated_at) * effective_rate)
+            if blocked_until > now:
+                wait = blocked_until - now
+            elif tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / effective_rate
+            self._save(conn, key, [tokens, now, blocked_until, rate_factor, throttles, failures, open_until])
+        return wait
+
+    def acquire(self, key: str, max_wait: float = None):
+        """
+        Block until a token for `key` is available, but never past the
+        current action budget (or `max_wait` seconds, if less): raises
+        RateLimitError instead of waiting longer than that. max_wait=0 never
+        sleeps.
+        """
+        waited = False
+        slept = 0.0
+        while True:
+            try:
+                wait = self._try_acquire(key)
+            except CircuitOpenError:
+                self._count("circuit_open")
+                raise
+            if wait <= 0:
+                self._count("acquired")
+                if waited:
+                    self._count("waited")
+                return
+            allowed = remaining_budget() if max_wait is None else min(remaining_budget(), max_wait - slept)
+            if wait > allowed:
+                self._count("rejected")
+                raise RateLimitError(key, wait)
+            waited = True
+            time.sleep(wait)
+            slept += wait
+
+    def headroom(self, key: str) -> float:
+        """
+        Fraction of the bucket for `key` that is currently available (0..1),
+        without taking a token. 0 while the bucket is paused or its circuit
+        is open.
+        """
+        rate, burst = self.limit_for(key)
+        now = time.time()
+        tokens, updated_at, blocked_until, rate_factor, _, _, open_until = self._load(self._conn(), key, now)
+        if open_until > now or blocked_until > now:
+            return 0.0
+        tokens = min(float(burst), tokens + (now - updated_at) * rate * rate_factor)
+        return max(0.0, tokens) / burst
+
+    @staticmethod
+    def _recovered(state) -> bool:
+        # full rate, no throttles or failures counted: a success changes nothing
+        return state[3] >= 1.0 and state[4] == 0 and state[5] == 0
+
+    def record_success(self, key: str):
+        now = time.time()
+        # the common case is a healthy bucket, which needs no write lock
+        if self._recovered(self._load(self._conn(), key, now)):
+            return
+        with self._transaction() as conn:
+            state = self._load(conn, key, now)
+            if self._recovered(state):
+                return
+            # additive recovery after a throttle
+            state[3] = min(1.0, state[3] + 0.1)
+            state[4] = 0
+            state[5] = 0
+            self._save(conn, key, state)
+
+    def record_throttle(self, key: str, retry_after: float = None):
+        """
+        The upstream answered 429. Pause the bucket for Retry-After (or an
+        exponential backoff when absent) and halve its rate.
+        """
+        self._count("throttled")
+        now = time.time()
+        with self._transaction() as conn:
+            state = self._load(conn, key, now)
+            throttles = state[4] + 1
+            if retry_after is None:
+                retry_after = min(60.0, 2 ** (throttles - 1)) + random.random()
+            state[2] = max(state[2], now + retry_after)
+            state[3] = max(MIN_RATE_FACTOR, state[3] / 2)
+            state[4] = throttles
+            self._trip_breaker(state, now)
+            self._save(conn, key, state)
+
+    def record_failure(self, key: str):
+        now = time.time()
+        with self._transaction() as conn:
+            state = self._load(conn, key, now)
+            self._trip_breaker(state, now)
+            self._save(conn, key, state)
+
+    def _trip_breaker(self, state, now):
+        state[5] += 1
+        if state[5] >= BREAKER_THRESHOLD:
+            # stays counted, so one more failure after the cooldown (half-open) reopens it
+            state[6] = now + BREAKER_COOLDOWN
+
+    def call(self, key: str, fn, is_throttle, retry_after_of=None, is_failure=None, retries: int = 3,
+             max_wait: float = None):
+        """
+        Run `fn()` under the limit for `key`, retrying throttled attempts
+        (as classified by `is_throttle(exc)`) within the action budget;
+        `max_wait` as for acquire.
+        """
+        for attempt in range(retries + 1):
+            self.acquire(key, max_wait)
+            try:
+                result = fn()
+            except Exception as e:
+                if is_throttle(e):
+                    retry_after = retry_after_of(e) if retry_after_of else None
+                    self.record_throttle(key, retry_after)
+                    if attempt < retries:
+                        continue
+                    raise RateLimitError(key, retry_after or 0.0) from e
+                if is_failure is None or is_failure(e):
+                    self.record_failure(key)
+                raise
+            self.record_success(key)
+            return result
+
+    def snapshot(self):
+        now = time.time()
+        rows = self._conn().execute(
+            "SELECT key, tokens, blocked_until, rate_factor, failures, open_until FROM buckets ORDER BY key"
+        )
+        return {
+            key: {
+                "tokens": round(tokens, 2),
+                "blocked_for_s": round(max(0.0, blocked_until - now), 1),
+                "rate_factor": round(rate_factor, 2),
+                "failures": failures,
+                "circuit_open": open_until > now,
+            }
+            for key, tokens, blocked_until, rate_factor, failures, open_until in rows
+        }
+
+
+rate_limiter = RateLimiter()
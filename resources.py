@@ -0,0 +1,212 @@
+"""
+Process-wide resources
+Clients and agents that are expensive to build are created once per process
+on first use, and heavy SDKs (agno / Gemini) are only imported when they are
+actually needed. Also keeps a small startup/rerun profile so import time and
+per-rerun overhead can be tracked.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from telemetry import telemetry
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+AMADEUS_API_KEY = os.getenv("AMADEUS_API_KEY", "INSERT YOUR OWN")
+AMADEUS_API_SECRET = os.getenv("AMADEUS_API_SECRET", "INSERT YOUR OWN")
+
+AMADEUS_POOLED_HTTP = os.getenv("AMADEUS_POOLED_HTTP", "1") == "1"  # keep-alive pool + shared token
+AMADEUS_CASSETTE_MODE = os.getenv("AMADEUS_CASSETTE_MODE", "off")  # off | record | replay (amadeuscassette.py)
+AMADEUS_BASE_URL = os.getenv("AMADEUS_BASE_URL")  # e.g. http://127.0.0.1:9100 for the stand-in server (fakeupstream.py)
+
+GEMINI_MODEL_ID = os.getenv("GEMINI_MODEL_ID", "gemini-2.0-flash-exp")
+
+PROFILE_LOG = os.getenv("TRAVEL_PROFILE_LOG")  # optional JSONL file, one line per rerun
+
+
+# ============================================================
+#  STARTUP PROFILE
+# ============================================================
+
+class StartupProfile:
+    """
+    Import timings (recorded once per process) and recent rerun durations.
+    """
+
+    def __init__(self, keep: int = 50):
+        self.process_started = time.time()
+        self.imports = {}
+        self.reruns = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure_import(self, name: str):
+        """
+        Time an import block; only the first (cold) import is recorded.
+        """
+        before = len(sys.modules)
+        t0 = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - t0
+        if len(sys.modules) > before:
+            with self._lock:
+                self.imports.setdefault(name, round(elapsed * 1000, 1))
+
+    def record_rerun(self, seconds: float):
+        with self._lock:
+            self.reruns.append(seconds)
+        if PROFILE_LOG:
+            with open(PROFILE_LOG, "a", encoding="utf8") as f:
+                f.write(json.dumps({"ts": time.time(), "pid": os.getpid(), "rerun_ms": round(seconds * 1000, 1),
+                                    "imports_ms": self.imports}) + "\n")
+
+    def summary(self) -> dict:
+        with self._lock:
+            reruns = list(self.reruns)
+            imports = dict(self.imports)
+        return {
+            "imports_ms": imports,
+            "reruns": len(reruns),
+            "last_rerun_ms": round(reruns[-1] * 1000, 1) if reruns else None,
+            "mean_rerun_ms": round(sum(reruns) / len(reruns) * 1000, 1) if reruns else None,
+            "uptime_s": round(time.time() - self.process_started, 1),
+        }
+
+
+startup_profile = StartupProfile()
+
+
+# ============================================================
+#  SHARED CLIENTS
+# ============================================================
+
+_lock = threading.RLock()  # re-entrant: one resource may be built from another (client -> transport)
+_resources = {}
+
+
+def _get_or_create(name: str, factory):
+    resource = _resources.get(name)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(name)
+            if resource is None:
+                resource = factory()
+                _resources[name] = resource
+    return resource
+
+
+def get_amadeus_transport():
+    """
+    The keep-alive connection pool used by the Amadeus client.
+    """
+    def create():
+        from amadeustransport import PooledTransport
+        return PooledTransport()
+
+    return _get_or_create("amadeus_http", create)
+
+
+def get_amadeus_cassette():
+    """
+    The record/replay transport (amadeuscassette.py), or None unless
+    AMADEUS_CASSETTE_MODE is "record" or "replay". While recording, requests
+    go out through the pooled transport (or the SDK's urlopen).
+    """
+    def create():
+        from amadeuscassette import CassetteTransport
+        if AMADEUS_CASSETTE_MODE == "replay":
+            return CassetteTransport("replay")
+        from urllib.request import urlopen
+        return CassetteTransport("record", inner=get_amadeus_transport() if AMADEUS_POOLED_HTTP else urlopen)
+
+    if AMADEUS_CASSETTE_MODE not in ("record", "replay"):
+        return None
+    return _get_or_create("amadeus_cassette", create)
+
+
+def get_amadeus_client():
+    """
+    The process-wide Amadeus client. With AMADEUS_POOLED_HTTP it sends its
+    requests through the pooled transport and uses the access token shared
+    by all processes (see amadeustransport.py). AMADEUS_BASE_URL points it
+    at another host than the Amadeus test environment. With
+    AMADEUS_CASSETTE_MODE=replay it never touches the network, and keeps its
+    placeholder token to itself.
+    """
+    def create():
+        from amadeus import Client
+        options = dict(client_id=AMADEUS_API_KEY, client_secret=AMADEUS_API_SECRET)
+        if AMADEUS_BASE_URL:
+            url = urlsplit(AMADEUS_BASE_URL)
+            options.update(host=url.hostname, ssl=url.scheme == "https",
+                           port=url.port or (443 if url.scheme == "https" else 80))
+        cassette = get_amadeus_cassette()
+        if cassette is not None:
+            options["http"] = cassette
+        if not AMADEUS_POOLED_HTTP or AMADEUS_CASSETTE_MODE == "replay":
+            return Client(**options)
+
+        from amadeustransport import SharedAccessToken
+        options.setdefault("http", get_amadeus_transport())
+        client = Client(**options)
+        # the SDK only creates its own AccessToken if none is set
+        client.access_token = SharedAccessToken(client)
+        return client
+
+    return _get_or_create("amadeus", create)
+
+
+def amadeus_connection_stats() -> dict:
+    """
+    Connection reuse, token fetch and cassette counters (empty until the
+    client has been created).
+    """
+    transport = _resources.get("amadeus_http")
+    client = _resources.get("amadeus")
+    cassette = _resources.get("amadeus_cassette")
+    token = getattr(client, "access_token", None)
+    stats = {}
+    if transport is not None:
+        stats["http"] = dict(transport.stats, reuse_ratio=round(transport.reuse_ratio(), 3))
+        stats["token"] = dict(getattr(token, "stats", {}))
+    if cassette is not None:
+        stats["cassette"] = dict(cassette.stats, mode=cassette.mode, match=cassette.match)
+    return stats
+
+
+telemetry.add_collector("amadeus_connections", amadeus_connection_stats)
+
+
+def get_gemini_model(model_id: str = GEMINI_MODEL_ID):
+    def create():
+        with startup_profile.measure_import("agno.models.google"):
+            from agno.models.google import Gemini
+        return Gemini(id=model_id)
+
+    return _get_or_create(f"gemini:{model_id}", create)
+
+
+def get_planner():
+    """
+    The itinerary planner agent, built on first use.
+    """
+    def create():
+        with startup_profile.measure_import("agno.agent"):
+            from agno.agent import Agent
+        return Agent(
+            name="Planner",
+            instructions=["Generate an optimized itinerary for the user's trip."],
+            model=get_gemini_model(),
+        )
+
+    return _get_or_create("planner", create)
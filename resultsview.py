@@ -0,0 +1,152 @@
+"""
+Results view
+Sorting, filtering and pagination over parsed flight / hotel offers
+(offermodels.py), rendered as one HTML table per page. Each offer's row is
+built once and orderings are cached per sort + filter, so a rerun costs one
+join over the visible page however many offers the search returned, and
+re-sorting or filtering never repeats the search.
+"""
+
+from html import escape
+import math
+
+
+PAGE_SIZES = (10, 25, 50, 100)
+STOP_FILTERS = {"Any": None, "Non-stop only": 0, "Up to 1 stop": 1}
+
+
+# ============================================================
+#  HELPERS
+# ============================================================
+
+def format_minutes(minutes) -> str:
+    if minutes is None:
+        return "–"
+    return f"{minutes // 60}h {minutes % 60:02d}m"
+
+
+def format_stops(stops: int) -> str:
+    return "non-stop" if not stops else f"{stops} stop{'s' if stops > 1 else ''}"
+
+
+def _missing_last(value):
+    # offers without a price / duration / time sort after all others
+    return (value is None, value)
+
+
+def paginate(count: int, page: int, page_size: int):
+    """
+    (start, end, page, pages) for 1-based `page`, clamped to the pages
+    that exist.
+    """
+    pages = max(1, math.ceil(count / page_size))
+    page = min(max(1, int(page)), pages)
+    start = (page - 1) * page_size
+    return start, min(start + page_size, count), page, pages
+
+
+# ============================================================
+#  VIEW
+# ============================================================
+
+class ResultsView:
+    """
+    A view over one result list. `columns` are (header, cell) pairs where
+    `cell(offer)` returns display text; `sorts` maps a label to a key
+    function; `matches(offer, **filters)` decides whether an offer passes
+    the (hashable) filter values.
+    """
+
+    def __init__(self, offers: list, columns: list, sorts: dict, matches=None):
+        self.offers = offers
+        self.columns = columns
+        self.sorts = sorts
+        self.matches = matches
+        self._rows = [None] * len(offers)
+        self._orders = {}
+        self._header = "".join(f"<th>{escape(header)}</th>" for header, _ in columns)
+
+    def select(self, sort: str, **filters) -> list:
+        """
+        Indices into `offers`, filtered and in `sort` order.
+        """
+        key = (sort, tuple(sorted(filters.items())))
+        order = self._orders.get(key)
+        if order is None:
+            indices = range(len(self.offers))
+            if self.matches is not None and filters:
+                indices = [i for i in indices if self.matches(self.offers[i], **filters)]
+            sort_key = self.sorts[sort]
+            order = sorted(indices, key=lambda i: _missing_last(sort_key(self.offers[i])))
+            self._orders[key] = order
+        return order
+
+    def row(self, i: int) -> str:
+        html = self._rows[i]
+        if html is None:
+            cells = "".join(f"<td>{escape(str(cell(self.offers[i])))}</td>" for _, cell in self.columns)
+            html = self._rows[i] = f"<tr><td>{i + 1}</td>{cells}</tr>"
+        return html
+
+    def html(self, indices) -> str:
+        """
+        One table with a row per index in `indices`; rows are numbered by
+        their position in the original results, which booking labels use too.
+        """
+        return (f'<table class="offer-table"><thead><tr><th>#</th>{self._header}</tr></thead>'
+                f'<tbody>{"".join(self.row(i) for i in indices)}</tbody></table>')
+
+
+# ============================================================
+#  FLIGHTS / HOTELS
+# ============================================================
+
+FLIGHT_SORTS = {
+    "Price": lambda o: o.price,
+    "Duration": lambda o: o.total_duration_minutes if o.total_duration_minutes is not None else o.duration_minutes,
+    "Departure time": lambda o: o.departure_at,
+}
+
+HOTEL_SORTS = {
+    "Price": lambda o: o.price,
+    "Hotel name": lambda o: o.hotel_name.casefold(),
+}
+
+
+def _flight_matches(offer, airlines=(), max_stops=None) -> bool:
+    if airlines and offer.airline not in airlines:
+        return False
+    return max_stops is None or offer.stops <= max_stops
+
+
+def flight_view(offers: list) -> ResultsView:
+    return ResultsView(
+        offers,
+        [
+            ("Airline", lambda o: o.airline),
+            ("Route", lambda o: f"{o.origin} → {o.destination}"),
+            ("Departure", lambda o: o.departure_display),
+            ("Arrival", lambda o: o.arrival_display),
+            ("Duration", lambda o: format_minutes(o.duration_minutes)),
+            ("Stops", lambda o: format_stops(o.stops)),
+            ("Price", lambda o: o.display_price),
+        ],
+        FLIGHT_SORTS,
+        _flight_matches,
+    )
+
+
+def hotel_view(offers: list) -> ResultsView:
+    return ResultsView(
+        offers,
+        [
+            ("Hotel", lambda o: o.hotel_name),
+            ("Price", lambda o: o.display_price),
+            ("Offer ID", lambda o: o.offer_id or "N/A"),
+        ],
+        HOTEL_SORTS,
+    )
+
+
+def airlines_of(offers: list) -> list:
+    return sorted({offer.airline for offer in offers})
@@ -0,0 +1,266 @@
+"""
+Search response cache
+Keeps recent Amadeus search results so identical searches (and Streamlit
+reruns) do not hit the API again. Entries are keyed on the normalized search
+parameters and expire per endpoint.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from telemetry import telemetry, get_logger
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+CACHE_BACKEND = os.getenv("AMADEUS_CACHE_BACKEND", "memory")  # "memory" or "sqlite"
+CACHE_PATH = os.getenv("AMADEUS_CACHE_PATH", os.path.join(".cache", "amadeus_cache.sqlite"))
+CACHE_MAX_ENTRIES = int(os.getenv("AMADEUS_CACHE_MAX_ENTRIES", "512"))
+
+# seconds an entry is fresh, per endpoint
+DEFAULT_TTLS = {
+    "flights": 300,
+    "hotels": 600,
+}
+# extra seconds a stale entry may still be served while it is refreshed
+DEFAULT_STALE_TTLS = {
+    "flights": 600,
+    "hotels": 1800,
+}
+
+log = get_logger("searchcache")
+
+
+# ============================================================
+#  KEYS
+# ============================================================
+
+def normalize_params(params: dict) -> dict:
+    """
+    Normalize search parameters so equivalent searches share one key:
+    strings are stripped and upper-cased, dates become ISO strings and
+    None values are dropped.
+    """
+    normalized = {}
+    for name, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip().upper()
+        elif hasattr(value, "isoformat"):
+            value = value.isoformat()
+        elif isinstance(value, (list, tuple)):
+            value = sorted(str(v).strip().upper() for v in value)
+        normalized[name] = value
+    return normalized
+
+
+def make_key(endpoint: str, params: dict) -> str:
+    payload = json.dumps(normalize_params(params), sort_keys=True, default=str)
+    digest = hashlib.sha1(payload.encode("utf8")).hexdigest()
+    return f"{endpoint}:{digest}"
+
+
+# ============================================================
+#  BACKENDS
+# ============================================================
+
+class MemoryBackend:
+    """
+    In-process LRU store. Fast, but private to the current process.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, stored_at):
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend:
+    """
+    On-disk LRU store, shared by every process that points at the same file.
+    Values must be JSON serializable.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " stored_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        with self._conn() as conn:
+            row = conn.execute("SELECT value, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, stored_at):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, stored_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), stored_at, time.time()),
+            )
+            conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                " SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM entries")
+
+
+# ============================================================
+#  CACHE
+# ============================================================
+
+class ResponseCache:
+    """
+    TTL cache with stale-while-revalidate on top of a pluggable backend.
+
+    A fresh entry is returned directly. A stale entry (past its TTL but
+    within the stale window) is returned immediately while a background
+    refresh replaces it. Anything older is fetched synchronously.
+    """
+
+    def __init__(self, backend, ttls: dict = None, stale_ttls: dict = None):
+        self.backend = backend
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.stale_ttls = dict(DEFAULT_STALE_TTLS, **(stale_ttls or {}))
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "bypassed": 0, "refreshes": 0}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+
+    def get_or_fetch(self, endpoint: str, params: dict, fetch, bypass: bool = False):
+        """
+        Return the cached result for (endpoint, params), calling `fetch()` on
+        a miss. With `bypass=True` the cache is not read, but the fresh
+        result still replaces the stored entry.
+        """
+        key = make_key(endpoint, params)
+
+        if bypass:
+            self._count("bypassed")
+            return self._fetch_and_store(key, fetch)
+
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            ttl = self.ttls.get(endpoint, 0)
+            if age < ttl:
+                self._count("hits")
+                return value
+            if age < ttl + self.stale_ttls.get(endpoint, 0):
+                self._count("stale_hits")
+                self._refresh_in_background(key, fetch)
+                return value
+
+        self._count("misses")
+        return self._fetch_and_store(key, fetch)
+
+    def hit_ratio(self) -> float:
+        served = self.stats["hits"] + self.stats["stale_hits"]
+        total = served + self.stats["misses"]
+        return served / total if total else 0.0
+
+    def clear(self):
+        self.backend.clear()
+
+    # PRIVATE
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _fetch_and_store(self, key, fetch):
+        value = fetch()
+        # Only non-empty results are kept: errors come back as [] / None and
+        # must not be replayed for the whole TTL.
+        if value:
+            self.backend.set(key, value, time.time())
+        return value
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch_and_store(key, fetch)
+                self._count("refreshes")
+            except Exception as e:
+                log.warning("cache_refresh_failed key=%s error=%s", key, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresher.submit(refresh)
+
+
+def create_backend(kind: str = CACHE_BACKEND):
+    if kind == "sqlite":
+        return SQLiteBackend()
+    if kind == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+response_cache = ResponseCache(create_backend())
+telemetry.add_collector("search_cache", lambda: dict(response_cache.stats, hit_ratio=response_cache.hit_ratio()))
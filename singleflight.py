@@ -0,0 +1,216 @@
+"""
+Single-flight request coalescing
+While a search is already in flight, identical searches wait for its result
+instead of sending their own request upstream. Works across threads (every
+Streamlit session in a process) and, optionally, across processes through a
+small SQLite lock/result table.
+"""
+
+import builtins
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from ratelimiter import remaining_budget, RateLimitError, CircuitOpenError
+from telemetry import telemetry
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+SINGLEFLIGHT_CROSS_PROCESS = os.getenv("SINGLEFLIGHT_CROSS_PROCESS", "0") == "1"
+SINGLEFLIGHT_PATH = os.getenv("SINGLEFLIGHT_PATH", os.path.join(".cache", "singleflight.sqlite"))
+LEASE_SECONDS = 60.0          # an in-flight claim older than this is considered abandoned
+RESULT_SECONDS = 5.0          # a just-finished result may still be handed to late followers
+POLL_INTERVAL = 0.05
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inflight (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+"""
+
+
+def _dump_error(error) -> str:
+    return json.dumps({
+        "type": error.__class__.__name__,
+        "message": str(error) or error.__class__.__name__,
+        "key": getattr(error, "key", None),
+        "retry_after": getattr(error, "retry_after", None),
+    })
+
+
+def _load_error(text: str) -> Exception:
+    """
+    The exception another process's call failed with. Rate-limit and
+    built-in exceptions come back as their own class; anything else as a
+    RuntimeError naming it.
+    """
+    data = json.loads(text)
+    name, message = data["type"], data["message"]
+    if name == "CircuitOpenError":
+        return CircuitOpenError(data["key"], data["retry_after"])
+    if name == "RateLimitError":
+        return RateLimitError(data["key"], data["retry_after"], message)
+    cls = getattr(builtins, name, None)
+    if isinstance(cls, type) and issubclass(cls, Exception):
+        return cls(message)
+    return RuntimeError(f"Coalesced request failed: {name}: {message}")
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self, cross_process: bool = SINGLEFLIGHT_CROSS_PROCESS, path: str = SINGLEFLIGHT_PATH):
+        self.cross_process = cross_process
+        self.path = path
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.stats = {"leaders": 0, "coalesced": 0, "coalesced_cross_process": 0}
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if cross_process:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn().executescript(SCHEMA)
+
+    def do(self, key: str, fn):
+        """
+        Run `fn()` for `key` unless an identical call is already in flight,
+        in which case wait for and return (or raise) that call's outcome.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats["leaders"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            if not call.event.wait(remaining_budget()):
+                raise RateLimitError(key, 1.0, "An identical search is still in progress, retry in a moment")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_shared(key, fn) if self.cross_process else fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def coalesced_ratio(self) -> float:
+        coalesced = self.stats["coalesced"] + self.stats["coalesced_cross_process"]
+        total = coalesced + self.stats["leaders"]
+        return coalesced / total if total else 0.0
+
+    # ---------- cross-process ----------
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _claim(self, key):
+        """
+        Returns "lead" if this process now owns `key`, otherwise the row of
+        the process that does (or of a result finished moments ago).
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT owner, started_at, finished_at, result, error FROM inflight WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                owner, started_at, finished_at, result, error = row
+                if finished_at is None and now - started_at < LEASE_SECONDS:
+                    conn.execute("COMMIT")
+                    return row
+                if finished_at is not None and now - finished_at < RESULT_SECONDS:
+                    conn.execute("COMMIT")
+                    return row
+            conn.execute(
+                "INSERT OR REPLACE INTO inflight (key, owner, started_at, finished_at, result, error)"
+                " VALUES (?, ?, ?, NULL, NULL, NULL)",
+                (key, self.owner, now),
+            )
+            conn.execute("DELETE FROM inflight WHERE finished_at IS NOT NULL AND finished_at < ?", (now - RESULT_SECONDS,))
+            conn.execute("COMMIT")
+            return "lead"
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _run_shared(self, key, fn):
+        claim = self._claim(key)
+        if claim == "lead":
+            try:
+                result = fn()
+            except Exception as e:
+                self._finish(key, None, _dump_error(e))
+                raise
+            self._finish(key, json.dumps(result), None)
+            return result
+
+        # another process owns it: wait for its result, within the action budget
+        with self._lock:
+            self.stats["coalesced_cross_process"] += 1
+        budget = remaining_budget()
+        deadline = time.time() + min(LEASE_SECONDS, budget)
+        while True:
+            owner, started_at, finished_at, result, error = claim
+            if finished_at is not None:
+                if error is not None:
+                    raise _load_error(error)
+                return json.loads(result)
+            if time.time() > deadline:
+                if budget < LEASE_SECONDS:
+                    raise RateLimitError(key, 1.0, "An identical search is still in progress, retry in a moment")
+                # the owner looks stuck; do the work ourselves
+                return fn()
+            time.sleep(POLL_INTERVAL)
+            claim = self._conn().execute(
+                "SELECT owner, started_at, finished_at, result, error FROM inflight WHERE key = ?", (key,)
+            ).fetchone()
+            if claim is None:
+                return fn()
+
+    def _finish(self, key, result, error):
+        self._conn().execute(
+            "UPDATE inflight SET finished_at = ?, result = ?, error = ? WHERE key = ? AND owner = ?",
+            (time.time(), result, error, key, self.owner),
+        )
+
+
+single_flight = SingleFlight()
+telemetry.add_collector("singleflight", lambda: dict(single_flight.stats, coalesced_ratio=single_flight.coalesced_ratio()))
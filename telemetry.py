@@ -0,0 +1,346 @@
+"""
+Telemetry
+Timing spans, counters and payload sizes for the hot paths (Amadeus and
+Gemini calls, travel API requests), kept in process memory. Percentiles come
+from a window of recent calls per endpoint; totals can be exported in
+Prometheus text format or as JSONL. A trace collects the spans of one user
+action (a Streamlit rerun) for a per-click breakdown of where the time went.
+"""
+
+from bisect import bisect_left
+from collections import Counter, deque
+from contextlib import contextmanager
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from ratelimiter import RateLimitError
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "1") == "1"
+TELEMETRY_WINDOW = int(os.getenv("TELEMETRY_WINDOW", "1000"))  # recent calls per endpoint kept for percentiles
+TELEMETRY_JSONL = os.getenv("TELEMETRY_JSONL")  # optional file, one line per finished span
+TRAVEL_LOG_LEVEL = os.getenv("TRAVEL_LOG_LEVEL", "INFO").upper()
+
+# Prometheus histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+# ============================================================
+#  LOGGING
+# ============================================================
+
+_log_root = logging.getLogger("travel")
+_log_root.setLevel(TRAVEL_LOG_LEVEL)
+if not _log_root.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    _log_root.addHandler(_handler)
+    _log_root.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger under the "travel" hierarchy (level: TRAVEL_LOG_LEVEL). Messages
+    are "event key=value ..." with %-style arguments, so nothing is
+    formatted for a disabled level.
+    """
+    return logging.getLogger(f"travel.{name}")
+
+
+# ============================================================
+#  SERIES AND TRACES
+# ============================================================
+
+class _Latency:
+    __slots__ = ("count", "sum", "buckets", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)  # per bucket, made cumulative on export
+        self.recent = deque(maxlen=TELEMETRY_WINDOW)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        i = bisect_left(LATENCY_BUCKETS, seconds)
+        if i < len(self.buckets):
+            self.buckets[i] += 1
+        self.recent.append(seconds)
+
+    def quantiles(self) -> dict:
+        ordered = sorted(self.recent)
+        if not ordered:
+            return {q: None for q in QUANTILES}
+        # nearest rank
+        return {q: ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)] for q in QUANTILES}
+
+
+class Trace:
+    """
+    The spans recorded while one action ran, on any thread that inherited
+    its context (see orchestrator.run_concurrently).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, service: str, op: str, started: float, seconds: float, outcome: str):
+        with self._lock:
+            self.spans.append((started - self.started, seconds, service, op, outcome))
+
+    def summary(self) -> dict:
+        """
+        Spans in start order, plus the wall time no span covered (script
+        and rendering work, waiting between calls).
+        """
+        total = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        with self._lock:
+            spans = sorted(self.spans)
+        covered, reach = 0.0, 0.0
+        for offset, seconds, *_ in spans:
+            end = offset + seconds
+            if end > reach:
+                covered += end - max(offset, reach)
+                reach = end
+        return {
+            "action": self.name,
+            "total_ms": round(total * 1000, 1),
+            "untracked_ms": round(max(0.0, total - covered) * 1000, 1),
+            "spans": [
+                {"span": f"{service}:{op}", "start_ms": round(offset * 1000, 1),
+                 "duration_ms": round(seconds * 1000, 1), "outcome": outcome}
+                for offset, seconds, service, op, outcome in spans
+            ],
+        }
+
+
+# ============================================================
+#  TELEMETRY
+# ============================================================
+
+def _labels(pairs) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in pairs) + "}" if pairs else ""
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _flatten(prefix: str, value, out: dict):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _flatten(f"{prefix}_{key}", item, out)
+    elif isinstance(value, (int, float)):
+        out[prefix] = float(value)
+
+
+class Telemetry:
+
+    def __init__(self, enabled: bool = TELEMETRY_ENABLED, jsonl_path: str = TELEMETRY_JSONL):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self._latency = {}          # (service, op) -> _Latency
+        self._calls = Counter()     # (service, op, outcome) -> calls
+        self._counters = Counter()  # (name, labels) -> count
+        self._sizes = {}            # (name, labels) -> [count, bytes]
+        self._collectors = {}       # name -> fn returning a dict of numbers
+        self._trace = contextvars.ContextVar("telemetry_trace", default=None)
+        self._lock = threading.Lock()
+
+    # ---------- recording ----------
+
+    @contextmanager
+    def span(self, service: str, op: str):
+        """
+        Time the block as one call of `service`/`op`. The outcome is "ok",
+        "throttled" (RateLimitError), "cancelled" (the generator or stream
+        was closed) or "error".
+        """
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except RateLimitError:
+            outcome = "throttled"
+            raise
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            self.record(service, op, time.perf_counter() - started, outcome, started)
+
+    def record(self, service: str, op: str, seconds: float, outcome: str = "ok", started: float = None):
+        """
+        Record a call timed elsewhere (e.g. across a generator's lifetime).
+        """
+        if not self.enabled:
+            return
+        started = started if started is not None else time.perf_counter() - seconds
+        with self._lock:
+            series = self._latency.get((service, op))
+            if series is None:
+                series = self._latency[(service, op)] = _Latency()
+            series.add(seconds)
+            self._calls[(service, op, outcome)] += 1
+        trace = self._trace.get()
+        if trace is not None:
+            trace.add(service, op, started, seconds, outcome)
+        if self.jsonl_path:
+            line = {"ts": round(time.time(), 3), "pid": os.getpid(), "service": service, "op": op,
+                    "ms": round(seconds * 1000, 2), "outcome": outcome}
+            with open(self.jsonl_path, "a", encoding="utf8") as f:
+                f.write(json.dumps(line) + "\n")
+
+    def count(self, name: str, amount: int = 1, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += amount
+
+    def observe_size(self, name: str, nbytes: int, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            entry = self._sizes.setdefault(key, [0, 0])
+            entry[0] += 1
+            entry[1] += nbytes
+
+    def add_collector(self, name: str, fn):
+        """
+        `fn()` returns a (possibly nested) dict of numbers, such as a cache's
+        stats; it is read on every export.
+        """
+        self._collectors[name] = fn
+
+    # ---------- traces ----------
+
+    def start_trace(self, name: str) -> Trace:
+        trace = Trace(name)
+        self._trace.set(trace)
+        return trace
+
+    def finish_trace(self, trace: Trace) -> Trace:
+        trace.elapsed = time.perf_counter() - trace.started
+        if self._trace.get() is trace:
+            self._trace.set(None)
+        return trace
+
+    # ---------- reading ----------
+
+    def latency_table(self) -> list:
+        """
+        One row per service/op: calls, errors and p50/p95/p99 (ms) of the
+        recent window.
+        """
+        with self._lock:
+            series = {key: (s.count, s.sum, s.quantiles()) for key, s in self._latency.items()}
+            calls = dict(self._calls)
+        rows = []
+        for (service, op), (count, total, quantiles) in sorted(series.items()):
+            outcomes = {outcome: n for (s, o, outcome), n in calls.items() if (s, o) == (service, op)}
+            row = {"service": service, "op": op, "calls": count,
+                   "errors": outcomes.get("error", 0), "throttled": outcomes.get("throttled", 0),
+                   "mean_ms": round(total / count * 1000, 1) if count else None}
+            for q, value in quantiles.items():
+                row[f"p{int(q * 100)}_ms"] = round(value * 1000, 1) if value is not None else None
+            rows.append(row)
+        return rows
+
+    def gauges(self) -> dict:
+        out = {}
+        for name, fn in list(self._collectors.items()):
+            try:
+                _flatten(name, fn(), out)
+            except Exception:
+                continue
+        return out
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = [dict(name=name, labels=dict(labels), value=value) for (name, labels), value in self._counters.items()]
+            sizes = [dict(name=name, labels=dict(labels), count=count, bytes=nbytes)
+                     for (name, labels), (count, nbytes) in self._sizes.items()]
+        return {"latency": self.latency_table(), "counters": counters, "sizes": sizes, "gauges": self.gauges()}
+
+    def jsonl(self) -> str:
+        """
+        The current snapshot as JSONL, one metric per line.
+        """
+        snapshot = self.snapshot()
+        ts = round(time.time(), 3)
+        lines = [dict(type="latency", ts=ts, **row) for row in snapshot["latency"]]
+        lines += [dict(type="counter", ts=ts, **row) for row in snapshot["counters"]]
+        lines += [dict(type="size", ts=ts, **row) for row in snapshot["sizes"]]
+        lines += [dict(type="gauge", ts=ts, name=name, value=value) for name, value in snapshot["gauges"].items()]
+        return "".join(json.dumps(line) + "\n" for line in lines)
+
+    def prometheus(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            latency = {key: (s.count, s.sum, list(s.buckets)) for key, s in self._latency.items()}
+            calls = dict(self._calls)
+            counters = dict(self._counters)
+            sizes = {key: tuple(value) for key, value in self._sizes.items()}
+
+        out = ["# HELP travel_call_duration_seconds Duration of upstream calls",
+               "# TYPE travel_call_duration_seconds histogram"]
+        for (service, op), (count, total, buckets) in sorted(latency.items()):
+            base = [("service", service), ("op", op)]
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, buckets):
+                cumulative += n
+                out.append(f"travel_call_duration_seconds_bucket{_labels(base + [('le', f'{bound:g}')])} {cumulative}")
+            out.append(f"travel_call_duration_seconds_bucket{_labels(base + [('le', '+Inf')])} {count}")
+            out.append(f"travel_call_duration_seconds_sum{_labels(base)} {total:.6f}")
+            out.append(f"travel_call_duration_seconds_count{_labels(base)} {count}")
+
+        out += ["# HELP travel_calls_total Upstream calls by outcome", "# TYPE travel_calls_total counter"]
+        for (service, op, outcome), n in sorted(calls.items()):
+            out.append(f"travel_calls_total{_labels([('service', service), ('op', op), ('outcome', outcome)])} {n}")
+
+        for name in sorted({name for name, _ in counters}):
+            out.append(f"# TYPE travel_{name}_total counter")
+            for (counter, labels), n in sorted(counters.items()):
+                if counter == name:
+                    out.append(f"travel_{name}_total{_labels(labels)} {n}")
+
+        for name in sorted({name for name, _ in sizes}):
+            out.append(f"# TYPE travel_{name}_bytes summary")
+            for (size, labels), (count, nbytes) in sorted(sizes.items()):
+                if size == name:
+                    out.append(f"travel_{name}_bytes_sum{_labels(labels)} {nbytes}")
+                    out.append(f"travel_{name}_bytes_count{_labels(labels)} {count}")
+
+        for name, value in sorted(self.gauges().items()):
+            out.append(f"# TYPE travel_{name} gauge")
+            out.append(f"travel_{name} {value:g}")
+        return "\n".join(out) + "\n"
+
+
+telemetry = Telemetry()
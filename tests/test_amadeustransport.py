@@ -0,0 +1,64 @@
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from amadeustransport import SharedAccessToken
+
+
+class BlockingClient:
+    host = "test.api.amadeus.com"
+    client_id = "id"
+    client_secret = "secret"
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.fetches = 0
+
+    def _unauthenticated_request(self, method, path, params):
+        self.fetches += 1
+        self.started.set()
+        self.release.wait(5)
+        return SimpleNamespace(result={"access_token": f"token-{self.fetches}", "expires_in": 1799})
+
+
+def test_token_fetch_does_not_hold_the_write_lock(tmp_path):
+    path = str(tmp_path / "tokens.sqlite")
+    client = BlockingClient()
+    first, second = SharedAccessToken(client, path=path), SharedAccessToken(client, path=path)
+    tokens = {}
+
+    fetcher = threading.Thread(target=lambda: tokens.setdefault("first", first._token()))
+    fetcher.start()
+    assert client.started.wait(5)
+
+    # other processes can still write while the token is being fetched
+    conn = sqlite3.connect(path, timeout=0.5, isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("ROLLBACK")
+
+    # a second process waits for the token instead of fetching its own
+    waiter = threading.Thread(target=lambda: tokens.setdefault("second", second._token()))
+    waiter.start()
+    client.release.set()
+    fetcher.join(5)
+    waiter.join(5)
+
+    assert tokens == {"first": "token-1", "second": "token-1"}
+    assert client.fetches == 1
+    assert second.stats["shared"] == 1
+
+
+def test_failed_fetch_releases_the_claim(tmp_path):
+    path = str(tmp_path / "tokens.sqlite")
+
+    class FailingClient(BlockingClient):
+        def _unauthenticated_request(self, method, path, params):
+            raise OSError("connection refused")
+
+    token = SharedAccessToken(FailingClient(), path=path)
+    with pytest.raises(OSError):
+        token._token()
+    assert token._conn().execute("SELECT COUNT(*) FROM token_refreshes").fetchone()[0] == 0
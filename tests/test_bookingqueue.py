@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+import bookingqueue
+from bookingqueue import BookingQueue
+from offermodels import HotelOffer
+
+OFFER = {"id": "1", "price": {"total": "100.00"}}
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _slow_pricing(monkeypatch):
+    release = threading.Event()
+    orders = []
+
+    def price(offer):
+        release.wait(5)
+        return offer
+
+    def book(offer):
+        orders.append(offer)
+        return {"id": f"order-{len(orders)}"}
+
+    monkeypatch.setattr(bookingqueue, "price_flight_offer", price)
+    monkeypatch.setattr(bookingqueue, "book_flight", book)
+    return release, orders
+
+
+def test_reclaimed_job_is_booked_once(monkeypatch, tmp_path):
+    release, orders = _slow_pricing(monkeypatch)
+    queue = BookingQueue(path=str(tmp_path / "bookings.sqlite"), workers=2)
+    job_id = queue.submit_flight("s", OFFER)
+    _wait_for(lambda: queue.status(job_id)["status"] == "repricing")
+
+    # reclaimed although its worker is still pricing: a second worker claims it
+    assert queue.reclaim_stale(max_age=0) == 1
+    _wait_for(lambda: queue.status(job_id)["status"] == "repricing")
+    release.set()
+
+    _wait_for(lambda: queue.status(job_id)["status"] == "booked")
+    queue._pool.shutdown(wait=True)
+    assert len(orders) == 1
+    assert queue.status(job_id)["status"] == "booked"
+
+
+def test_live_job_is_not_reclaimed(monkeypatch, tmp_path):
+    release, orders = _slow_pricing(monkeypatch)
+    queue = BookingQueue(path=str(tmp_path / "bookings.sqlite"), workers=1)
+    job_id = queue.submit_flight("s", OFFER)
+    _wait_for(lambda: queue.status(job_id)["status"] == "repricing")
+    queue._conn().execute("UPDATE bookings SET updated_at = ? WHERE job_id = ?", (time.time() - 3600, job_id))
+
+    # the worker's heartbeat marks it as alive before the sweep
+    assert queue.reclaim_stale(max_age=600) == 0
+    release.set()
+    _wait_for(lambda: queue.status(job_id)["status"] == "booked")
+    queue._pool.shutdown(wait=True)
+    assert len(orders) == 1
+
+
+def test_hotel_offer_without_id_is_refused(tmp_path):
+    queue = BookingQueue(path=str(tmp_path / "bookings.sqlite"), workers=1)
+    offer = HotelOffer.from_simplified({"hotel_name": "No ID", "price": "90.00", "currency": "EUR"})
+    assert offer.offer_id is None
+    with pytest.raises(ValueError):
+        queue.submit_hotel("s", offer.offer_id, hotel_name=offer.hotel_name)
@@ -0,0 +1,60 @@
+import threading
+import time
+
+from hotelstore import HotelStore
+
+HOTELS = [{"hotelId": "H1", "name": "One", "distance": {"value": 1.0, "unit": "KM"}}]
+
+
+class CountingFetch:
+
+    def __init__(self, hotels=HOTELS, delay=0.0):
+        self.hotels = hotels
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, city_code, rating=None):
+        self.calls.append((city_code, rating))
+        time.sleep(self.delay)
+        return self.hotels
+
+
+def test_unknown_city_is_not_fetched_again_within_miss_ttl(tmp_path):
+    fetch = CountingFetch(hotels=None)
+    store = HotelStore(fetch, path=str(tmp_path / "hotels.sqlite"), miss_ttl=600)
+    assert store.hotel_ids("XXX", rating=4) == []
+    assert store.hotel_ids("XXX", rating=4) == []
+    assert fetch.calls == [("XXX", None)]
+
+
+def test_unknown_city_is_fetched_again_after_miss_ttl(tmp_path):
+    fetch = CountingFetch(hotels=None)
+    store = HotelStore(fetch, path=str(tmp_path / "hotels.sqlite"), miss_ttl=0)
+    store.hotel_ids("XXX")
+    store.hotel_ids("XXX")
+    assert len(fetch.calls) == 2
+
+
+def test_failed_refresh_is_not_retried_every_sweep(tmp_path):
+    fetch = CountingFetch()
+    store = HotelStore(fetch, path=str(tmp_path / "hotels.sqlite"), max_age=3600)
+    assert store.hotel_ids("PAR") == ["H1"]
+    with store._conn() as conn:
+        conn.execute("UPDATE cities SET fetched_at = ?", (time.time() - 7200,))
+    fetch.hotels = None
+    store.refresh_stale()
+    store.refresh_stale()
+    assert len(fetch.calls) == 2
+    assert store.hotel_ids("PAR") == ["H1"]
+
+
+def test_rating_is_fetched_once_under_concurrency(tmp_path):
+    fetch = CountingFetch(delay=0.1)
+    store = HotelStore(fetch, path=str(tmp_path / "hotels.sqlite"))
+    store.ensure_city("PAR")
+    threads = [threading.Thread(target=store.ensure_rating, args=("PAR", 4)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fetch.calls.count(("PAR", 4)) == 1
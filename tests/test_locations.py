@@ -0,0 +1,23 @@
+from datetime import date, timedelta
+
+import pytest
+
+from locations import InvalidSearchError, location_index, validate_flight_search
+
+DEPARTURE = (date.today() + timedelta(days=30)).isoformat()
+
+
+def test_unknown_code_is_rejected_with_suggestion():
+    with pytest.raises(InvalidSearchError) as e:
+        validate_flight_search("JFX", "LHR", DEPARTURE)
+    assert e.value.suggestions[0] == "JFK"
+
+
+def test_airports_outside_the_major_list_are_known():
+    assert validate_flight_search("LHE", "ZNZ", DEPARTURE) == ("LHE", "ZNZ")
+
+
+def test_major_airports_win_name_ties():
+    assert location_index.resolve("London") == "LON"
+    assert location_index.resolve("Malta") == "MLA"
+    assert location_index.autocomplete("lon")[0].iata == "LHR"
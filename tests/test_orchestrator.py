@@ -0,0 +1,46 @@
+import threading
+import time
+
+import orchestrator
+from orchestrator import run_concurrently
+
+
+def _outcomes(branches):
+    return {name: (result, type(error).__name__ if error else None) for name, result, error, _ in run_concurrently(branches)}
+
+
+def test_timeout_counts_from_branch_start(monkeypatch):
+    monkeypatch.setattr(orchestrator, "MAX_SEARCH_WORKERS", 2)
+    branches = {name: (lambda: time.sleep(0.3), {}, 0.5) for name in ("a", "b", "c")}
+    # "c" waits 0.3s for a worker and then runs well within its own 0.5s
+    assert _outcomes(branches) == {"a": (None, None), "b": (None, None), "c": (None, None)}
+
+
+def test_timed_out_branch_releases_its_slot(monkeypatch):
+    monkeypatch.setattr(orchestrator, "MAX_SEARCH_WORKERS", 1)
+    release = threading.Event()
+    branches = {
+        "stuck": (release.wait, {"timeout": 5}, 0.2),
+        "quick": (lambda: "ok", {}, 0.5),
+    }
+    try:
+        assert _outcomes(branches) == {"stuck": (None, "TimeoutError"), "quick": ("ok", None)}
+    finally:
+        release.set()
+
+
+def test_fan_out_is_capped(monkeypatch):
+    monkeypatch.setattr(orchestrator, "MAX_SEARCH_WORKERS", 3)
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def search():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    assert len(list(run_concurrently({i: (search, {}, 5) for i in range(10)}))) == 10
+    assert peak[0] == 3
@@ -0,0 +1,45 @@
+from datetime import date, timedelta
+import time
+
+from pricewatch import PriceWatch, diff_snapshots
+
+EXPIRES = date.today() + timedelta(days=30)
+
+
+def test_diff_snapshots():
+    old = {
+        "up": ("Up", 100.0, "EUR"),
+        "down": ("Down", 100.0, "EUR"),
+        "same": ("Same", 100.0, "EUR"),
+        "removed": ("Removed", 50.0, "EUR"),
+    }
+    new = {
+        "up": ("Up", 120.0, "EUR"),
+        "down": ("Down", 80.0, "EUR"),
+        "same": ("Same", 100.004, "EUR"),
+        "added": ("Added", 70.0, "EUR"),
+    }
+    assert sorted(diff_snapshots(old, new)) == sorted([
+        ("up", "Up", "rise", 100.0, 120.0, "EUR"),
+        ("down", "Down", "drop", 100.0, 80.0, "EUR"),
+        ("added", "Added", "new", None, 70.0, "EUR"),
+        ("removed", "Removed", "gone", 50.0, None, "EUR"),
+    ])
+
+
+def test_diff_snapshots_first_poll_is_all_new():
+    assert diff_snapshots({}, {"a": ("A", 10.0, "EUR")}) == [("a", "A", "new", None, 10.0, "EUR")]
+
+
+def test_leased_query_is_not_claimed_twice(tmp_path):
+    path = str(tmp_path / "pricewatch.sqlite")
+    first, second = PriceWatch(path=path), PriceWatch(path=path)
+    first.watch("s1", "flights", {"origin": "AMS", "destination": "LHR"}, "AMS-LHR", EXPIRES)
+
+    assert len(first._claim_due(5)) == 1
+    # another process sweeping while the lease is held gets nothing
+    assert second._claim_due(5) == []
+
+    # an expired lease (the poller died) may be taken over
+    first._conn().execute("UPDATE queries SET leased_until = ?", (time.time() - 1,))
+    assert len(second._claim_due(5)) == 1
@@ -0,0 +1,44 @@
+"""
+Smoke tests for the process-wide resources: building them must not hang
+or reach the network.
+"""
+
+import importlib
+import threading
+
+
+def _reload(monkeypatch, tmp_path, **env):
+    monkeypatch.setenv("AMADEUS_TOKEN_CACHE_PATH", str(tmp_path / "tokens.sqlite"))
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    import amadeustransport
+    import resources
+    importlib.reload(amadeustransport)
+    return importlib.reload(resources)
+
+
+def _build_in_thread(fn, timeout: float = 10.0):
+    result = {}
+    worker = threading.Thread(target=lambda: result.setdefault("value", fn()), daemon=True)
+    worker.start()
+    worker.join(timeout)
+    assert not worker.is_alive(), f"{fn.__name__}() did not return within {timeout}s"
+    return result["value"]
+
+
+def test_pooled_client_is_built_once(monkeypatch, tmp_path):
+    resources = _reload(monkeypatch, tmp_path, AMADEUS_POOLED_HTTP="1")
+    client = _build_in_thread(resources.get_amadeus_client)
+
+    from amadeustransport import PooledTransport, SharedAccessToken
+    assert isinstance(client.http, PooledTransport)
+    assert client.http is resources.get_amadeus_transport()
+    assert isinstance(client.access_token, SharedAccessToken)
+    assert resources.get_amadeus_client() is client
+
+
+def test_plain_client(monkeypatch, tmp_path):
+    resources = _reload(monkeypatch, tmp_path, AMADEUS_POOLED_HTTP="0")
+    client = _build_in_thread(resources.get_amadeus_client)
+    assert "amadeus_http" not in resources._resources
+    assert resources.get_amadeus_client() is client
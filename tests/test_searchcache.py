@@ -0,0 +1,102 @@
+from datetime import date
+import time
+
+from searchcache import MemoryBackend, ResponseCache, SQLiteBackend, make_key, normalize_params
+
+PARAMS = {"origin": "AMS", "destination": "LHR"}
+
+
+class Fetch:
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def _cache_with(value, age):
+    cache = ResponseCache(MemoryBackend(), ttls={"flights": 300}, stale_ttls={"flights": 600})
+    cache.backend.set(make_key("flights", PARAMS), value, time.time() - age)
+    return cache
+
+
+def test_fresh_entry_is_served_without_fetching():
+    cache = _cache_with(["cached"], age=10)
+    fetch = Fetch(["new"])
+    assert cache.get_or_fetch("flights", PARAMS, fetch) == ["cached"]
+    assert fetch.calls == 0
+    assert cache.stats["hits"] == 1
+
+
+def test_stale_entry_is_served_and_refreshed_in_background():
+    cache = _cache_with(["cached"], age=400)
+    fetch = Fetch(["new"])
+    assert cache.get_or_fetch("flights", PARAMS, fetch) == ["cached"]
+    cache._refresher.shutdown(wait=True)
+    assert fetch.calls == 1
+    assert cache.stats["stale_hits"] == 1 and cache.stats["refreshes"] == 1
+    assert cache.backend.get(make_key("flights", PARAMS))[0] == ["new"]
+
+
+def test_expired_entry_is_fetched():
+    cache = _cache_with(["cached"], age=1000)
+    fetch = Fetch(["new"])
+    assert cache.get_or_fetch("flights", PARAMS, fetch) == ["new"]
+    assert fetch.calls == 1
+    assert cache.stats["misses"] == 1
+
+
+def test_miss_stores_only_non_empty_results():
+    cache = ResponseCache(MemoryBackend())
+    empty = Fetch([])
+    cache.get_or_fetch("flights", PARAMS, empty)
+    cache.get_or_fetch("flights", PARAMS, empty)
+    assert empty.calls == 2
+    cache.get_or_fetch("flights", PARAMS, Fetch(["found"]))
+    assert cache.get_or_fetch("flights", PARAMS, Fetch(["other"])) == ["found"]
+
+
+def test_bypass_fetches_and_replaces_entry():
+    cache = _cache_with(["cached"], age=10)
+    fetch = Fetch(["new"])
+    assert cache.get_or_fetch("flights", PARAMS, fetch, bypass=True) == ["new"]
+    assert cache.stats["bypassed"] == 1 and cache.stats["hits"] == 0
+    assert cache.get_or_fetch("flights", PARAMS, fetch) == ["new"]
+    assert fetch.calls == 1
+
+
+def test_sqlite_backend_evicts_least_recently_used(tmp_path):
+    backend = SQLiteBackend(path=str(tmp_path / "cache.sqlite"), max_entries=2)
+    backend.set("a", [1], time.time())
+    time.sleep(0.01)
+    backend.set("b", [2], time.time())
+    time.sleep(0.01)
+    assert backend.get("a") is not None  # "a" is now more recent than "b"
+    time.sleep(0.01)
+    backend.set("c", [3], time.time())
+    assert backend.get("b") is None
+    assert backend.get("a")[0] == [1] and backend.get("c")[0] == [3]
+
+
+def test_normalize_params():
+    params = {
+        "origin": " ams ",
+        "departure_date": date(2030, 1, 2),
+        "return_date": None,
+        "airlines": ["kl", " BA"],
+        "adults": 2,
+    }
+    assert normalize_params(params) == {
+        "origin": "AMS",
+        "departure_date": "2030-01-02",
+        "airlines": ["BA", "KL"],
+        "adults": 2,
+    }
+
+
+def test_equivalent_searches_share_a_key():
+    assert make_key("flights", {"origin": "ams", "adults": 1, "max": None}) == make_key("flights", {"adults": 1, "origin": "AMS "})
+    assert make_key("flights", PARAMS) != make_key("hotels", PARAMS)
@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+
+from ratelimiter import RateLimitError, action_budget
+from singleflight import SingleFlight
+
+
+def test_follower_gives_up_within_its_budget():
+    flight = SingleFlight(cross_process=False)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "result"
+
+    leader = threading.Thread(target=lambda: flight.do("k", slow))
+    leader.start()
+    assert started.wait(5)
+
+    t0 = time.monotonic()
+    with action_budget(0.2), pytest.raises(RateLimitError):
+        flight.do("k", lambda: "unused")
+    assert time.monotonic() - t0 < 2
+
+    release.set()
+    leader.join(5)
+    assert flight.stats == {"leaders": 1, "coalesced": 1, "coalesced_cross_process": 0}
+
+
+def test_follower_gets_leader_result():
+    flight = SingleFlight(cross_process=False)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "result"
+
+    leader = threading.Thread(target=lambda: flight.do("k", slow))
+    leader.start()
+    assert started.wait(5)
+    threading.Timer(0.1, release.set).start()
+    with action_budget(5):
+        assert flight.do("k", lambda: "unused") == "result"
+    leader.join(5)
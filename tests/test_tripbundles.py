@@ -0,0 +1,59 @@
+from itertools import product
+import random
+
+import pytest
+
+import tripbundles
+from tripbundles import MAX_K, top_k_combinations
+
+
+def _lists(seed, sizes):
+    rng = random.Random(seed)
+    lists = []
+    for size in sizes:
+        items = [(rng.randint(0, 100), f"{len(lists)}-{i}") for i in range(size)]
+        lists.append(sorted(items, key=lambda pair: pair[0]))
+    return lists
+
+
+def _brute_force(lists, accept=None):
+    scored = []
+    for combination in product(*lists):
+        items = tuple(item for _, item in combination)
+        if accept is None or accept(items):
+            scored.append(sum(score for score, _ in combination))
+    return sorted(scored)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_brute_force_order(seed):
+    lists = _lists(seed, (6, 5, 7))
+    results = top_k_combinations(lists, 20)
+    assert [score for score, _ in results] == _brute_force(lists)[:20]
+    assert len({combination for _, combination in results}) == 20
+
+
+def test_accept_filters_without_stopping_the_search():
+    lists = _lists(7, (8, 8))
+    accept = lambda combination: combination[0].endswith(("1", "3", "5", "7"))
+    results = top_k_combinations(lists, 10, accept)
+    assert [score for score, _ in results] == _brute_force(lists, accept)[:10]
+    assert all(accept(combination) for _, combination in results)
+
+
+def test_expansions_are_capped_when_nothing_is_accepted(monkeypatch):
+    monkeypatch.setattr(tripbundles, "MAX_EXPANSIONS_PER_RESULT", 3)
+    calls = []
+
+    def reject(combination):
+        calls.append(combination)
+        return False
+
+    assert top_k_combinations(_lists(1, (10, 10, 10)), 4, reject) == []
+    assert len(calls) == 4 * 3
+
+
+@pytest.mark.parametrize("k", [0, -1, MAX_K + 1, 2.5, True])
+def test_rejects_out_of_range_k(k):
+    with pytest.raises(ValueError):
+        top_k_combinations(_lists(1, (3, 3)), k)
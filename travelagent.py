@@ -1,14 +1,44 @@
-import streamlit as st
-import os
 import time
-import random
-from datetime import datetime
-from agno.agent import Agent
-from agno.models.google import Gemini
+_rerun_started = time.perf_counter()
 
-# import your amadeus helpers (must be in same folder)
-from amadeuscaller import search_flights as am_search_flights, book_flight as am_book_flight, \
-    search_hotels as am_search_hotels, book_hotel as am_book_hotel
+from resources import startup_profile, get_planner, amadeus_connection_stats, AMADEUS_CASSETTE_MODE
+
+with startup_profile.measure_import("app"):
+    import streamlit as st
+    import os
+    import statistics
+    import uuid
+
+    from orchestrator import run_concurrently
+    from ratelimiter import rate_limiter, action_budget, RateLimitError
+    from offermodels import parse_flight_offers, parse_hotel_offers
+    from grounding import grounded_prompt
+    from resultsview import (flight_view, hotel_view, airlines_of, paginate, FLIGHT_SORTS, HOTEL_SORTS,
+                             PAGE_SIZES, STOP_FILTERS)
+    from locations import location_index, validate_flight_search, validate_hotel_search, InvalidSearchError
+    from telemetry import telemetry, TELEMETRY_WINDOW
+
+    # With TRAVEL_API_URL set, the app is a thin client of the travel API
+    # (travelapi.py); otherwise it runs the searches and bookings itself.
+    TRAVEL_API_URL = os.getenv("TRAVEL_API_URL")
+    if TRAVEL_API_URL:
+        from travelclient import get_api_client
+        api = get_api_client(TRAVEL_API_URL)
+        am_search_flights, am_search_hotels = api.search_flights, api.search_hotels
+        search_price_calendar, search_trip_bundles = api.search_price_calendar, api.search_trip_bundles
+        booking_queue, price_watch = api.bookings, api.watches
+    else:
+        api = None
+        # import your amadeus helpers (must be in same folder)
+        from amadeuscaller import search_flights as am_search_flights, search_hotels as am_search_hotels
+        from pricecalendar import search_price_calendar
+        from tripbundles import search_trip_bundles
+        from searchcache import response_cache
+        from singleflight import single_flight
+        from itinerary import ItineraryStream, is_gemini_throttle
+        from itinerarycache import itinerary_cache, normalize_trip
+        from bookingqueue import booking_queue
+        from pricewatch import price_watch
 
 # ==========================
 # 🔑 Keys / Config
@@ -16,6 +46,23 @@ from amadeuscaller import search_flights as am_search_flights, book_flight as am
 GOOGLE_API_KEY = "INSERT YOUR OWN"
 os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
 
+# offers fetched per flight search; the results are shown a page at a time
+FLIGHT_MAX_RESULTS = 100
+# per-branch timeouts (seconds) for the concurrent Amadeus searches
+FLIGHT_SEARCH_TIMEOUT = 30
+HOTEL_SEARCH_TIMEOUT = 45
+# max seconds one click may spend waiting on client-side rate limits
+ACTION_BUDGET = 20
+
+# background re-polling of watched searches and recovery of abandoned
+# bookings (once per process; the travel API runs its own)
+if api is None:
+    price_watch.start()
+    booking_queue.start()
+
+# upstream calls made during this rerun are collected for the performance panel
+rerun_trace = telemetry.start_trace(time.strftime("%H:%M:%S"))
+
 # ==========================
 # Streamlit UI Setup
 # ==========================
@@ -25,13 +72,9 @@ st.markdown(
     <style>
         .title { text-align: center; font-size: 36px; font-weight: bold; color: #ff5733; }
         .subtitle { text-align: center; font-size: 16px; color: #555; }
-        .offer-box {
-            border: 1px solid #e6e6e6;
-            border-radius: 10px;
-            padding: 12px;
-            margin-bottom: 12px;
-            background: #fff;
-        }
+        .offer-table { width: 100%; border-collapse: collapse; margin-bottom: 12px; font-size: 14px; }
+        .offer-table th, .offer-table td { border-bottom: 1px solid #e6e6e6; padding: 6px 10px; text-align: left; }
+        .offer-table th { background: #fafafa; }
         .small { font-size: 13px; color: #666; }
     </style>
     """,
@@ -39,15 +82,37 @@ st.markdown(
 )
 st.markdown('<h1 class="title">✈️ AI-Powered Travel Planner</h1>', unsafe_allow_html=True)
 st.markdown('<p class="subtitle">Search and book flights & hotels (Amadeus sandbox). Gemini handles planning & research.</p>', unsafe_allow_html=True)
+if api is None and AMADEUS_CASSETTE_MODE == "replay":
+    st.info("📼 Offline: Amadeus responses are replayed from recorded cassettes (AMADEUS_CASSETTE_MODE=replay).")
+elif api is None and AMADEUS_CASSETTE_MODE == "record":
+    st.caption("📼 Recording Amadeus responses to a cassette (AMADEUS_CASSETTE_MODE=record).")
 
 # ==========================
 # Inputs
 # ==========================
+def location_input(label: str, value: str) -> str:
+    """
+    Text input for an airport or city. Shows where the entry resolves to, or
+    the closest matches from the local location index, and returns the code
+    to search (city names like "Amsterdam" are accepted too).
+    """
+    text = st.text_input(label, value=value)
+    code = location_index.resolve(text)
+    if code:
+        st.caption(location_index.describe(code))
+        return code
+    if text.strip():
+        codes = [a.iata for a in location_index.autocomplete(text, limit=4)] or location_index.suggest(text, limit=4)
+        st.caption("Did you mean: " + " · ".join(map(location_index.describe, codes)) if codes
+                   else "⚠️ Not a known airport or city")
+    return text.strip().upper()
+
+
 col1, col2, col3 = st.columns([2, 2, 1])
 with col1:
-    source = st.text_input("🛫 From (IATA):", value="CGK")
+    source = location_input("🛫 From (IATA or city):", value="CGK")
 with col2:
-    destination = st.text_input("🛬 To (IATA):", value="AMS")
+    destination = location_input("🛬 To (IATA or city):", value="AMS")
 with col3:
     passengers = st.number_input("👥 Adults", min_value=1, max_value=9, value=1)
 
@@ -67,6 +132,9 @@ st.sidebar.title("Preferences")
 budget = st.sidebar.radio("💰 Budget:", ["Economy", "Standard", "Luxury"])
 flight_class = st.sidebar.radio("✈️ Flight Class:", ["ECONOMY", "BUSINESS", "FIRST"])
 hotel_rating_choice = st.sidebar.selectbox("🏨 Hotel Rating:", ["Any", "3⭐", "4⭐", "5⭐"])
+fresh_prices = st.sidebar.checkbox("🔄 Always fetch fresh prices", value=False, help="Skip cached search results")
+reprice_bookings = st.sidebar.checkbox("🔁 Re-check price before booking", value=True,
+                                       help="Confirm the offer's current price before the order is placed")
 
 # convert hotel rating to numeric or None
 if hotel_rating_choice == "Any":
@@ -77,251 +145,536 @@ else:
 # ==========================
 # Gemini Agents (left in place for itinerary/research)
 # ==========================
-gemini_model = Gemini(id="gemini-2.0-flash-exp")
+# The planner agent (and the agno/Gemini SDK behind it) is created once per
+# process on first use, see resources.get_planner
 
-planner = Agent(
-    name="Planner",
-    instructions=["Generate an optimized itinerary for the user's trip."],
-    model=gemini_model, 
-)
+def gemini_busy(e: RateLimitError):
+    retry = f" in {e.retry_after:.0f}s" if e.retry_after >= 1 else " shortly"
+    st.warning(f"Gemini is busy, try again{retry}.")
 
-def safe_run(agent, prompt, retries=4):
-    for i in range(retries):
-        try:
-            return agent.run(prompt, stream=False)
-        except Exception as e:
-            if "429" in str(e) or "Too many requests" in str(e):
-                wait = (2 ** i) + random.random()
-                st.warning(f"Rate limit hit. Retrying in {wait:.1f}s...")
-                time.sleep(wait)
-            else:
-                raise e
-    return type("E", (), {"content": "(Request failed)"})()
 
-def format_dt(iso):
+def safe_run(agent, prompt):
+    # Gemini calls share the process-wide "gemini" bucket. A call that cannot
+    # run right away (max_wait=0) or is throttled fails fast instead of
+    # sleeping in the script thread; a 429 pauses the bucket, so there is
+    # nothing to retry here. Returns None when the call did not run.
     try:
-        dt = datetime.fromisoformat(iso)
-        return dt.strftime("%b %d, %Y %H:%M")
-    except Exception:
-        try:
-            # fallback if missing seconds
-            dt = datetime.strptime(iso, "%Y-%m-%d %H:%M")
-            return dt.strftime("%b %d, %Y %H:%M")
-        except Exception:
-            return iso
+        with telemetry.span("gemini", "run"):
+            return rate_limiter.call("gemini", lambda: agent.run(prompt, stream=False), is_throttle=is_gemini_throttle,
+                                     is_failure=lambda e: not is_gemini_throttle(e), retries=0, max_wait=0)
+    except RateLimitError as e:
+        gemini_busy(e)
+        return None
 
 # ==========================
 # Session state defaults
 # ==========================
 if "flight_results" not in st.session_state:
-    st.session_state.flight_results = []  # list of Amadeus flight offers (raw)
+    st.session_state.flight_results = []  # list of offermodels.FlightOffer
 if "hotel_results" not in st.session_state:
-    st.session_state.hotel_results = []   # list of hotel offers (from amadeuscaller format)
-if "bookings" not in st.session_state:
-    st.session_state.bookings = []
-
-# Booking triggers
-if "selected_flight_idx" not in st.session_state:
-    st.session_state.selected_flight_idx = None
-if "selected_hotel_offer" not in st.session_state:
-    st.session_state.selected_hotel_offer = None
-if "do_book_flight" not in st.session_state:
-    st.session_state.do_book_flight = False
-if "do_book_hotel" not in st.session_state:
-    st.session_state.do_book_hotel = False
+    st.session_state.hotel_results = []   # list of offermodels.HotelOffer
+if "results_for" not in st.session_state:
+    st.session_state.results_for = {}  # "flights" / "hotels" -> the inputs those results were searched with
+
+# Bookings live in the booking ledger (bookingqueue.py). The session id is
+# kept in the URL so a page reload still finds its bookings.
+if "session_id" not in st.session_state:
+    st.session_state.session_id = st.query_params.get("sid") or uuid.uuid4().hex
+    st.query_params["sid"] = st.session_state.session_id
+if "booking_jobs" not in st.session_state:
+    st.session_state.booking_jobs = {}  # job_id -> latest ledger row
+    st.session_state.booking_seq = 0
 
 # ==========================
 # Main action button (search + itinerary)
 # ==========================
+def search_problems() -> dict:
+    """
+    Why the flight / hotel search for the current inputs would fail, checked
+    locally (codes, dates) before anything is sent to Amadeus.
+    """
+    problems = {}
+    try:
+        validate_flight_search(source, destination, departure_date, adults=passengers)
+    except InvalidSearchError as e:
+        problems["flights"] = str(e)
+    try:
+        validate_hotel_search(destination, departure_date, return_date)
+    except InvalidSearchError as e:
+        problems["hotels"] = str(e)
+    return problems
+
+
+def search_inputs() -> dict:
+    # what each search depends on, to tell whether its results still match the inputs
+    return {
+        "flights": (source, destination, str(departure_date)),
+        "hotels": (destination, str(departure_date), str(return_date)),
+    }
+
+
 if st.button("🚀 Generate Travel Plan"):
-    # 1) Try Amadeus flight search first
-    with st.spinner("✈️ Searching flights (Amadeus)..."):
-        try:
-            am_flights = am_search_flights(origin=source, destination=destination, departure_date=str(departure_date), adults=passengers, max_results=5)
-            if not am_flights:
-                raise Exception("No flights from Amadeus")
-            st.session_state.flight_results = am_flights
-        except Exception as e:
-            st.warning(f"Amadeus flight search failed: {e}. No flight results available")
-
-    # 2) Try Amadeus hotel search (uses your amadeuscaller.search_hotels format)
-    with st.spinner("🏨 Searching hotels (Amadeus)..."):
-        try:
-            am_hotels = am_search_hotels(city_code=destination, check_in=str(departure_date), check_out=str(return_date), radius_km=20, rating=hotel_rating)
-            if not am_hotels:
-                raise Exception("No hotels from Amadeus")
-            # am_search_hotels returns simplified list of dicts: {hotel_name, offer_id, price, currency}
-            st.session_state.hotel_results = am_hotels
-        except Exception as e:
-            st.warning(f"Amadeus hotel search failed: {e}. No hotel results available.")
-            st.session_state.hotel_results = []
+    # Flights and hotels are independent, so both searches start together and
+    # each result is shown as soon as its own branch finishes.
+    branches = {
+        "flights": (am_search_flights, dict(origin=source, destination=destination, departure_date=str(departure_date), adults=passengers, max_results=FLIGHT_MAX_RESULTS, fresh=fresh_prices), FLIGHT_SEARCH_TIMEOUT),
+        "hotels": (am_search_hotels, dict(city_code=destination, check_in=str(departure_date), check_out=str(return_date), radius_km=20, rating=hotel_rating, fresh=fresh_prices), HOTEL_SEARCH_TIMEOUT),
+    }
+    # searches that cannot succeed are reported here instead of being sent
+    for name, problem in search_problems().items():
+        st.error(f"{name.capitalize()} search skipped: {problem}")
+        del branches[name]
+    if branches:
+        with st.status("Searching flights & hotels (Amadeus)...", expanded=True) as search_status, action_budget(ACTION_BUDGET):
+            failed = 0
+            for name, result, error, elapsed in run_concurrently(branches):
+                if name == "flights":
+                    if error is None and result:
+                        # parsed once here; reruns only read the precomputed fields
+                        st.session_state.flight_results = parse_flight_offers(result)
+                        st.session_state.results_for["flights"] = search_inputs()["flights"]
+                        st.write(f"✈️ {len(result)} flight offers found ({elapsed:.1f}s)")
+                    else:
+                        failed += 1
+                        st.warning(f"Amadeus flight search failed: {error or 'No flights from Amadeus'}. No flight results available")
+                else:
+                    if error is None and result:
+                        # am_search_hotels returns simplified list of dicts: {hotel_name, offer_id, price, currency}
+                        st.session_state.hotel_results = parse_hotel_offers(result)
+                        st.session_state.results_for["hotels"] = search_inputs()["hotels"]
+                        st.write(f"🏨 {len(result)} hotel offers found ({elapsed:.1f}s)")
+                    else:
+                        failed += 1
+                        st.warning(f"Amadeus hotel search failed: {error or 'No hotels from Amadeus'}. No hotel results available.")
+                        st.session_state.hotel_results = []
+            search_status.update(
+                label="Search complete" if not failed else "Search finished with partial results",
+                state="complete" if failed < len(branches) else "error",
+                expanded=bool(failed),
+            )
 
 # ==========================
-# Display Flights (cards)
+# Flexible dates (price calendar)
 # ==========================
-st.header("✈️ Flight Offers")
+with st.expander("📅 Flexible dates — price calendar"):
+    flex_days = st.slider("Search ± days around the selected dates", min_value=1, max_value=7, value=3)
+    flex_matrix = st.checkbox("Full departure × return matrix", value=False)
+    if st.button("Search price calendar"):
+        with st.spinner("Searching nearby dates (Amadeus)..."), action_budget(ACTION_BUDGET):
+            st.session_state.price_calendar = search_price_calendar(
+                origin=source, destination=destination, departure_date=departure_date, return_date=return_date,
+                window_days=flex_days, matrix=flex_matrix, adults=passengers, fresh=fresh_prices,
+            )
 
-if st.session_state.flight_results:
-    # Distinguish Amadeus offers (they are dicts with 'price') vs SerpAPI normalized fallback
-    for i, offer in enumerate(st.session_state.flight_results):
-        # Identify shape
-        is_serp = "raw" in offer and "airline" in offer and ("departure_time" in offer)
-        if is_serp:
-            airline = offer.get("airline", "Unknown")
-            price = offer.get("price", "Unknown")
-            dep = offer.get("departure_city", "Unknown")
-            arr = offer.get("arrival_city", "Unknown")
-            dep_time = offer.get("departure_time", "N/A")
-            arr_time = offer.get("arrival_time", "N/A")
-            display_price = f"{price}"
+    calendar = st.session_state.get("price_calendar")
+    if calendar:
+        if calendar["cheapest"]:
+            best = calendar["cheapest"]
+            st.success(
+                f"Cheapest: {best['total']} {calendar['currency'] or ''} — departing {best['departure_date']}"
+                + (f", returning {best['return_date']}" if best["return_date"] else "")
+            )
+            # rows: departure dates, columns: return dates ("" for one-way)
+            st.dataframe({ret or "one-way": {dep: row.get(ret) for dep, row in calendar["prices"].items()}
+                          for ret in (calendar["return_dates"] or [""])})
         else:
-            # Amadeus offer structure
-            price = offer.get("price", {}).get("total", "N/A")
-            currency = offer.get("price", {}).get("currency", "")
-            first_itin = offer.get("itineraries", [])[0] if offer.get("itineraries") else {}
-            segs = first_itin.get("segments", []) or []
-            first_seg = segs[0] if segs else {}
-            last_seg = segs[-1] if segs else first_seg
-            airline = first_seg.get("carrierCode", "N/A")
-            dep = first_seg.get("departure", {}).get("iataCode", "N/A")
-            arr = last_seg.get("arrival", {}).get("iataCode", "N/A")
-            dep_time = first_seg.get("departure", {}).get("at", "N/A")
-            arr_time = last_seg.get("arrival", {}).get("at", "N/A")
-            display_price = f"{price} {currency}"
-
-        # Render card
-        with st.container():
-            st.markdown(f'<div class="offer-box">', unsafe_allow_html=True)
-            st.markdown(f"**Offer #{i+1} — {airline}**")
-            st.markdown(f"**Route:** {dep} → {arr}")
-            st.markdown(f"**Departure:** {format_dt(dep_time)}")
-            st.markdown(f"**Arrival:** {format_dt(arr_time)}")
-            st.markdown(f"**Price:** {display_price}")
-            st.markdown("</div>", unsafe_allow_html=True)
-
-            # Book button: set session state then handle booking below
-            if st.button(f"Book Flight #{i+1}", key=f"book_flight_{i}"):
-                st.session_state.selected_flight_idx = i
-                st.session_state.do_book_flight = True
+            st.info("No fares found in this date window.")
+        if calendar["failed"]:
+            st.caption(f"{len(calendar['failed'])} date searches failed or timed out.")
 
-else:
-    st.info("No flight results yet. Click 'Generate Travel Plan' to search (Amadeus first, SerpAPI fallback).")
+# ==========================
+# Trip packages (flight + hotel bundles)
+# ==========================
+with st.expander("🧳 Trip packages — best flight + hotel combinations"):
+    bundle_k = st.slider("Packages to show", min_value=1, max_value=10, value=5)
+    bundle_round_trip = st.checkbox("Search as one round trip", value=True,
+                                    help="Off: outbound and return are searched separately and combined freely")
+    bundle_max_total = st.number_input("Maximum total price (0 = no limit)", min_value=0, value=0, step=50)
+    if st.button("Find packages"):
+        with st.spinner("Searching flights & hotels for the whole trip (Amadeus)..."), action_budget(ACTION_BUDGET):
+            st.session_state.trip_bundles = search_trip_bundles(
+                origin=source, destination=destination, departure_date=departure_date, return_date=return_date,
+                adults=passengers, budget=budget, k=bundle_k, round_trip=bundle_round_trip, rating=hotel_rating,
+                max_total=bundle_max_total or None, fresh=fresh_prices,
+            )
 
-# Handle flight booking trigger (separate block so click persists through rerun)
-if st.session_state.do_book_flight:
-    idx = st.session_state.selected_flight_idx
-    if idx is not None and idx < len(st.session_state.flight_results):
-        offer = st.session_state.flight_results[idx]
-        try:
-            st.info("Booking flight... (simulated with dummy traveller data)")
-            print(offer)
-            booking_resp = am_book_flight(offer)  # uses dummy traveler inside amadeuscaller
-            st.success("Flight booked (sandbox).")
-            # record booking summary
-            st.session_state.bookings.append({
-                    "type": "flight",
-                    "offer_index": idx,
-                    "airline": offer.get("itineraries", [{}])[0].get("segments", [{}])[0].get("carrierCode", ""),
-                    "price": offer.get("price", {}).get("total", "")
-            })
-                # show returned booking id/info if available
-            if booking_resp:
-                st.json(booking_resp)
-            else: 
-                raise Exception
-        except Exception as e:
-            st.error(f"Booking failed: {e}")
-    else:
-        st.error("Selected flight no longer available.")
-    # reset trigger
-    st.session_state.do_book_flight = False
-    st.session_state.selected_flight_idx = None
+    packages = st.session_state.get("trip_bundles")
+    if packages:
+        if not packages["bundles"]:
+            st.info("No packages found for these dates.")
+        for i, bundle in enumerate(packages["bundles"]):
+            flights = " + ".join(f"{f.airline} {f.origin}{'⇄' if f.itinerary_count > 1 else '→'}{f.destination}"
+                                 for f in bundle.flights)
+            hours = f" · {bundle.duration_minutes / 60:.1f}h in the air" if bundle.duration_minutes else ""
+            hotel = f" · 🏨 {bundle.hotel.hotel_name} ({bundle.hotel.display_price})" if bundle.hotel else ""
+            st.markdown(f"**#{i+1} — {bundle.display_price}**{hours}  \n✈️ {flights}{hotel}")
+            if st.button(f"Book package #{i+1}", key=f"book_bundle_{i}"):
+                for f in bundle.flights:
+                    booking_queue.submit_flight(st.session_state.session_id, f.raw, title=f.airline,
+                                                price=f.display_price, reprice=reprice_bookings)
+                if bundle.hotel:
+                    booking_queue.submit_hotel(st.session_state.session_id, bundle.hotel.offer_id,
+                                               hotel_name=bundle.hotel.hotel_name, price=str(bundle.hotel.price),
+                                               display_price=bundle.hotel.display_price, reprice=reprice_bookings)
+                st.toast(f"Package #{i+1} queued for booking")
+        st.caption(f"Ranked from {packages['candidates']} possible combinations ({budget} budget)."
+                   + (f" {packages['skipped_currency']} hotel offers in another currency were left out."
+                      if packages["skipped_currency"] else ""))
+        if packages["failed"]:
+            st.caption(f"{len(packages['failed'])} searches failed or timed out.")
 
 # ==========================
-# Display Hotels (cards)
+# Display Flights & Hotels (paged tables)
 # ==========================
+def cached_view(name: str, offers: list, build, reset=()):
+    """
+    The results view for `offers`, built once per search. A new search
+    clears the widget state (`reset` keys) that referred to the old one.
+    """
+    view = st.session_state.get(name)
+    if view is None or view.offers is not offers:
+        view = st.session_state[name] = build(offers)
+        for key in reset:
+            st.session_state.pop(key, None)
+    return view
+
+
+def paged_results(prefix: str, view, sort: str, **filters) -> list:
+    """
+    Render the current page of `view` as one table, with page controls, and
+    return the indices of the offers on it. Sorting, filtering and paging
+    only reorder the already parsed results.
+    """
+    order = view.select(sort, **filters)
+    if not order:
+        st.info("No offers match the filters.")
+        return []
+    size_col, page_col, count_col = st.columns([1, 1, 2])
+    page_size = size_col.selectbox("Per page", PAGE_SIZES, key=f"{prefix}_page_size")
+    pages = paginate(len(order), 1, page_size)[3]
+    # a new sort, filter or page size can leave fewer pages than the one shown
+    if st.session_state.get(f"{prefix}_page", 1) > pages:
+        st.session_state[f"{prefix}_page"] = pages
+    page = page_col.number_input("Page", min_value=1, max_value=pages, step=1, key=f"{prefix}_page")
+    start, end, page, pages = paginate(len(order), page, page_size)
+    count_col.caption(f"Offers {start + 1}–{end} of {len(order)} · page {page} of {pages}")
+    st.markdown(view.html(order[start:end]), unsafe_allow_html=True)
+    return order[start:end]
+
+
+st.header("✈️ Flight Offers")
+
+if st.session_state.flight_results:
+    flights = cached_view("flight_view", st.session_state.flight_results, flight_view,
+                          reset=("flight_airlines", "flight_page", "flight_choice"))
+    sort_col, airline_col, stops_col = st.columns(3)
+    flight_sort = sort_col.selectbox("Sort by", list(FLIGHT_SORTS), key="flight_sort")
+    flight_airlines = airline_col.multiselect("Airlines", airlines_of(flights.offers), key="flight_airlines")
+    flight_stops = stops_col.selectbox("Stops", list(STOP_FILTERS), key="flight_stops")
+    shown = paged_results("flight", flights, flight_sort,
+                          airlines=tuple(flight_airlines), max_stops=STOP_FILTERS[flight_stops])
+
+    if shown:
+        # Book button: the booking runs on the booking queue, the
+        # sidebar follows its progress
+        choice_col, book_col = st.columns([3, 1])
+        choice = choice_col.selectbox(
+            "Flight to book", shown, key="flight_choice",
+            format_func=lambda i: f"#{i + 1} — {flights.offers[i].airline}, {flights.offers[i].departure_display}, "
+                                  f"{flights.offers[i].display_price}",
+        )
+        if book_col.button("Book flight", key="book_flight"):
+            offer = flights.offers[choice]
+            booking_queue.submit_flight(st.session_state.session_id, offer.raw, title=offer.airline,
+                                        price=offer.display_price, reprice=reprice_bookings)
+            st.toast(f"Flight #{choice + 1} queued for booking (simulated with dummy traveller data)")
+
+    if st.button("👀 Watch this route's prices", key="watch_flights"):
+        price_watch.watch(
+            st.session_state.session_id, "flights",
+            dict(origin=source, destination=destination, departure_date=str(departure_date), adults=passengers, max_results=5),
+            label=f"✈️ {source} → {destination}, {departure_date}", expires_on=departure_date,
+        )
+        st.toast("Watching this route — price drops will show in the sidebar")
+else:
+    st.info("No flight results yet. Click 'Generate Travel Plan' to search (Amadeus).")
+
 st.header("🏨 Hotel Offers")
 
 if st.session_state.hotel_results:
-    for i, offer in enumerate(st.session_state.hotel_results):
-        # Your amadeuscaller.search_hotels returns simplified offers (hotel_name, offer_id, price, currency)
-        hotel_name = offer.get("hotel_name") or offer.get("hotel", {}).get("name", "Unknown")
-        offer_id = offer.get("offer_id") or offer.get("id")
-        price = offer.get("price")
-        currency = offer.get("currency", "")
-        with st.container():
-            st.markdown(f'<div class="offer-box">', unsafe_allow_html=True)
-            st.markdown(f"**Hotel #{i+1} — {hotel_name}**")
-            st.markdown(f"**Price:** {price} {currency}")
-            st.markdown(f"**Offer ID:** {offer_id}")
-            st.markdown("</div>", unsafe_allow_html=True)
-            if st.button(f"Book Hotel #{i+1}", key=f"book_hotel_{i}"):
-                st.session_state.selected_hotel_offer = offer_id
-                st.session_state.do_book_hotel = True
+    hotels = cached_view("hotel_view", st.session_state.hotel_results, hotel_view,
+                         reset=("hotel_page", "hotel_choice"))
+    hotel_sort = st.selectbox("Sort by", list(HOTEL_SORTS), key="hotel_sort")
+    shown = paged_results("hotel", hotels, hotel_sort)
+
+    choice_col, book_col = st.columns([3, 1])
+    choice = choice_col.selectbox(
+        "Hotel to book", shown, key="hotel_choice",
+        format_func=lambda i: f"#{i + 1} — {hotels.offers[i].hotel_name}, {hotels.offers[i].display_price}",
+    )
+    no_offer_id = choice is not None and hotels.offers[choice].offer_id is None
+    if book_col.button("Book hotel", key="book_hotel", disabled=no_offer_id,
+                       help="This offer has no offer ID and cannot be booked" if no_offer_id else None):
+        offer = hotels.offers[choice]
+        booking_queue.submit_hotel(st.session_state.session_id, offer.offer_id, hotel_name=offer.hotel_name,
+                                   price=str(offer.price), display_price=offer.display_price,
+                                   reprice=reprice_bookings)
+        st.toast(f"{offer.hotel_name} queued for booking (simulated with dummy payment)")
+    if st.button("👀 Watch hotel prices", key="watch_hotels"):
+        price_watch.watch(
+            st.session_state.session_id, "hotels",
+            dict(city_code=destination, check_in=str(departure_date), check_out=str(return_date), radius_km=20, rating=hotel_rating),
+            label=f"🏨 {destination}, {departure_date} – {return_date}", expires_on=departure_date,
+        )
+        st.toast("Watching hotel prices — price drops will show in the sidebar")
 else:
     st.info("No hotel results yet. Click 'Generate Travel Plan' to search (Amadeus).")
 
-# Handle hotel booking trigger
-if st.session_state.do_book_hotel:
-    hotel_offer_id = st.session_state.selected_hotel_offer
-    if hotel_offer_id:
-        try:
-            st.info("Booking hotel... (simulated with dummy payment)")
-            booking_resp = am_book_hotel(hotel_offer_id)  # expects a single offer id
-            st.success("Hotel booked (sandbox).")
-            st.session_state.bookings.append({
-                "type": "hotel",
-                "offer_id": hotel_offer_id,
-                "hotel_name": hotel_offer_id  # we didn't keep name here; could map if needed
-            })
-            if booking_resp:
-                st.json(booking_resp)
-            else: 
-                raise Exception
-        except Exception as e:
-            st.error(f"Hotel booking failed: {e}")
-    else:
-        st.error("No hotel offer selected.")
-    st.session_state.do_book_hotel = False
-    st.session_state.selected_hotel_offer = None
-
 # ==========================
 # Itinerary & Research area (Gemini)
 # ==========================
 st.header("🗺️ AI Itinerary & Research")
-if st.button("🧭 Generate Itinerary (Gemini)"):
-    with st.spinner("Generating..."):
-        prompt = (
-            f"Create a {travel_theme.lower()} itinerary for {destination} from {departure_date} to {return_date}. "
-            f"User likes: {activity_preferences}. Budget: {budget}."
-        )
-        res = safe_run(planner, prompt)
-        st.session_state.last_itinerary = res.content if res else "(No itinerary)"
+ITINERARY_SOURCES = {"exact": "Served from cache", "similar": "Adapted from a cached itinerary for a similar trip"}
+# the full-JSON option is only there to compare prompt size and latency against
+GROUNDING_OPTIONS = {"Off": "none", "Search results (compact)": "compact", "Search results (full JSON)": "json"}
+stream_itinerary = st.checkbox("Stream itinerary as it is generated", value=True)
+grounding_option = st.radio("Ground the itinerary in", list(GROUNDING_OPTIONS), index=0, horizontal=True,
+                            help="Add the flights, hotels and bookings found above to the prompt, within a token budget")
+itinerary_streamed = False
+gen_col, regen_col = st.columns([3, 1])
+with gen_col:
+    generate_clicked = st.button("🧭 Generate Itinerary (Gemini)")
+with regen_col:
+    regenerate_clicked = st.button("♻️ Regenerate", help="Ignore cached itineraries and ask Gemini again")
+
+if generate_clicked or regenerate_clicked:
+    prompt = (
+        f"Create a {travel_theme.lower()} itinerary for {destination} from {departure_date} to {return_date}. "
+        f"User likes: {activity_preferences}. Budget: {budget}."
+    )
+    # only results searched for the current destination and dates describe this trip
+    current = search_inputs()
+    grounding_flights = st.session_state.flight_results if st.session_state.results_for.get("flights") == current["flights"] else []
+    grounding_hotels = st.session_state.hotel_results if st.session_state.results_for.get("hotels") == current["hotels"] else []
+    prompt, grounding = grounded_prompt(prompt, GROUNDING_OPTIONS[grounding_option], grounding_flights,
+                                        grounding_hotels, list(st.session_state.booking_jobs.values()))
+    # an itinerary grounded in this search's results is not reused for other searches
+    use_cache = grounding["mode"] == "none"
+    if api is not None:
+        # the travel API looks up and fills the itinerary cache itself
+        cached, match = None, None
+    else:
+        trip = normalize_trip(travel_theme, destination, departure_date, return_date, activity_preferences, budget)
+        cached, match = (None, None) if regenerate_clicked or not use_cache else itinerary_cache.lookup(trip)
 
-if "last_itinerary" in st.session_state:
+    if cached is not None:
+        st.session_state.last_itinerary = cached
+        st.session_state.itinerary_source = ITINERARY_SOURCES[match]
+    elif stream_itinerary or api is not None:
+        # Changing any input reruns the script, which stops this loop and
+        # closes the stream, so an outdated itinerary is never finished.
+        st.session_state.itinerary_source = None
+        st.subheader("Suggested itinerary")
+        placeholder = st.empty()
+        if api is not None:
+            stream = api.itinerary(prompt, dict(theme=travel_theme, destination=destination, start_date=departure_date,
+                                                end_date=return_date, activities=activity_preferences, budget=budget),
+                                   regenerate=regenerate_clicked, cache=use_cache)
+        else:
+            stream = ItineraryStream(get_planner(), prompt, max_wait=0)
+        try:
+            with action_budget(ACTION_BUDGET):
+                for text in stream:
+                    placeholder.markdown(text + " ▌")
+            placeholder.markdown(stream.text or "(No itinerary)")
+            st.session_state.last_itinerary = stream.text or "(No itinerary)"
+            if api is None and use_cache and stream.metrics["completed"] and stream.text:
+                itinerary_cache.put(trip, stream.text)
+            if getattr(stream, "source", None):
+                st.session_state.itinerary_source = ITINERARY_SOURCES[stream.source]
+                st.caption(f"♻️ {st.session_state.itinerary_source}")
+        except RateLimitError as e:
+            gemini_busy(e)
+        finally:
+            st.session_state.setdefault("itinerary_metrics", []).append(
+                dict(stream.metrics, mode="stream", grounding=grounding["mode"], prompt_tokens=grounding["prompt_tokens"]))
+        itinerary_streamed = True
+    else:
+        st.session_state.itinerary_source = None
+        with st.spinner("Generating..."), action_budget(ACTION_BUDGET):
+            started = time.perf_counter()
+            res = safe_run(get_planner(), prompt)
+            if res is None:
+                # Gemini was busy; the warning is shown instead of an itinerary
+                st.session_state.pop("last_itinerary", None)
+            else:
+                st.session_state.last_itinerary = res.content or "(No itinerary)"
+                elapsed = round(time.perf_counter() - started, 3)
+                st.session_state.setdefault("itinerary_metrics", []).append({
+                    "ttft_s": elapsed, "total_s": elapsed, "mode": "blocking", "grounding": grounding["mode"],
+                    "prompt_tokens": grounding["prompt_tokens"],
+                    # Gemini's own count, only reported for blocking runs
+                    "reported_prompt_tokens": getattr(getattr(res, "metrics", None), "input_tokens", None),
+                })
+                if use_cache and isinstance(res.content, str) and res.content:
+                    itinerary_cache.put(trip, res.content)
+
+if "last_itinerary" in st.session_state and not itinerary_streamed:
     st.subheader("Suggested itinerary")
+    if st.session_state.get("itinerary_source"):
+        st.caption(f"♻️ {st.session_state.itinerary_source}")
     st.write(st.session_state.last_itinerary)
 
+def grounding_comparison(metrics: list) -> list:
+    """
+    Median prompt size and generation times per grounding mode, with the
+    change in total time against the ungrounded and the full-JSON prompt.
+    """
+    by_mode = {}
+    for m in metrics:
+        if m.get("ttft_s") is not None and m.get("completed", True):
+            by_mode.setdefault(m.get("grounding", "none"), []).append(m)
+    rows = []
+    for mode in ("none", "compact", "json"):
+        runs = by_mode.get(mode)
+        if not runs:
+            continue
+        rows.append({
+            "grounding": mode, "runs": len(runs),
+            "prompt_tokens": statistics.median(r.get("prompt_tokens") or 0 for r in runs),
+            "first_text_s": round(statistics.median(r["ttft_s"] for r in runs), 2),
+            "total_s": round(statistics.median(r["total_s"] for r in runs), 2),
+        })
+    for base in rows:
+        if base["grounding"] == "compact":
+            continue
+        for row in rows:
+            change = f"{(row['total_s'] / base['total_s'] - 1) * 100:+.0f}%" if base["total_s"] else "–"
+            row["total_vs_" + ("ungrounded" if base["grounding"] == "none" else "full_json")] = change
+    return rows
+
+
+if st.session_state.get("itinerary_metrics"):
+    last = st.session_state.itinerary_metrics[-1]
+    if last.get("ttft_s") is not None:
+        tokens = f" · ~{last['prompt_tokens']} prompt tokens ({last['grounding']} grounding)" if last.get("prompt_tokens") else ""
+        st.caption(f"First text after {last['ttft_s']:.1f}s · total {last['total_s']:.1f}s ({last['mode']}){tokens}")
+    comparison = grounding_comparison(st.session_state.itinerary_metrics)
+    if len(comparison) > 1:
+        with st.expander("Grounding: prompt size and latency"):
+            st.dataframe(comparison, hide_index=True)
+
 # ==========================
 # Bookings sidebar
 # ==========================
-st.sidebar.header("📦 Your Bookings")
-if st.session_state.bookings:
-    for i, b in enumerate(st.session_state.bookings):
-        if b["type"] == "flight":
-            st.sidebar.markdown(f"**Flight #{i+1}:** {b.get('airline')} — {b.get('price')}")
-        else:
-            st.sidebar.markdown(f"**Hotel #{i+1}:** {b.get('offer_id')}")
-else:
-    st.sidebar.info("No bookings yet. Use the Book buttons on offers.")
+BOOKING_ICONS = {"queued": "⏳", "repricing": "🔁", "booking": "⏳", "booked": "✅",
+                 "price_changed": "💱", "failed": "❌", "interrupted": "⚠️"}
+
+
+@st.fragment(run_every="2s")
+def bookings_panel():
+    # only ledger rows changed since the last poll are read
+    for job in booking_queue.changes_since(st.session_state.session_id, st.session_state.booking_seq):
+        st.session_state.booking_jobs[job["job_id"]] = job
+        st.session_state.booking_seq = job["seq"]
+
+    st.header("📦 Your Bookings")
+    jobs = sorted(st.session_state.booking_jobs.values(), key=lambda j: j["created_at"])
+    if not jobs:
+        st.info("No bookings yet. Use the Book buttons on offers.")
+    for i, job in enumerate(jobs):
+        icon = BOOKING_ICONS.get(job["status"], "•")
+        label = "Flight" if job["kind"] == "flight" else "Hotel"
+        st.markdown(f"{icon} **{label} #{i+1}:** {job['title']} — {job['price']}  \n"
+                    f"<span class='small'>{job['status'].replace('_', ' ')}</span>", unsafe_allow_html=True)
+        if job["error"]:
+            st.caption(job["error"])
+        if job["status"] == "price_changed":
+            if st.button("Book at new price", key=f"accept_{job['job_id']}"):
+                booking_queue.accept_price_change(job["job_id"])
+
+
+@st.fragment(run_every="30s")
+def price_watch_panel():
+    # watches are polled in the background; this only reads the change log
+    if "price_drops" not in st.session_state:
+        st.session_state.price_drops = []
+        st.session_state.price_watch_seq = 0
+    drops = price_watch.changes_since(st.session_state.session_id, st.session_state.price_watch_seq)
+    if drops:
+        st.session_state.price_drops = (st.session_state.price_drops + drops)[-10:]
+        st.session_state.price_watch_seq = drops[-1]["seq"]
+
+    watches = price_watch.watches(st.session_state.session_id)
+    if not watches:
+        return
+    st.header("👀 Price Watches")
+    for change in reversed(st.session_state.price_drops):
+        st.success(f"📉 {change['watch']} — {change['offer']}: {change['old_price']:g} → "
+                   f"{change['new_price']:g} {change['currency'] or ''}")
+    for w in watches:
+        cheapest = f"from {w['cheapest']:g} {w['currency'] or ''}" if w["cheapest"] is not None else "waiting for first check"
+        st.markdown(f"{w['label']}  \n<span class='small'>{cheapest}</span>", unsafe_allow_html=True)
+        if st.button("Stop watching", key=f"unwatch_{w['watch_id']}"):
+            price_watch.unwatch(w["watch_id"])
+            st.rerun(scope="fragment")
+
+
+with st.sidebar:
+    bookings_panel()
+    price_watch_panel()
 
 # debug
 if st.checkbox("Show debug info"):
     st.write({
         "flight_results_count": len(st.session_state.flight_results),
         "hotel_results_count": len(st.session_state.hotel_results),
-        "bookings": st.session_state.bookings
+        "bookings": list(st.session_state.booking_jobs.values()),
+        "startup_profile": startup_profile.summary(),
+        "itinerary_metrics": st.session_state.get("itinerary_metrics", [])[-10:],
     })
+    if api is not None:
+        st.write({"travel_api": TRAVEL_API_URL, **api.stats()})
+    else:
+        st.write({
+            "search_cache": dict(response_cache.stats, hit_ratio=round(response_cache.hit_ratio(), 3)),
+            "coalesced_searches": dict(single_flight.stats, coalesced_ratio=round(single_flight.coalesced_ratio(), 3)),
+            "rate_limits": dict(rate_limiter.stats, buckets=rate_limiter.snapshot()),
+            "amadeus_connections": amadeus_connection_stats(),
+            "price_watch": price_watch.stats,
+            "itinerary_cache": itinerary_cache.stats,
+        })
+
+# ==========================
+# Performance
+# ==========================
+# every upstream call made while this rerun (= the click that caused it)
+# ran, including those on search worker threads
+finished_trace = telemetry.finish_trace(rerun_trace)
+if finished_trace.spans:
+    st.session_state.action_traces = ([finished_trace.summary()] + st.session_state.get("action_traces", []))[:5]
+
+with st.expander("📈 Performance"):
+    latency = telemetry.latency_table()
+    if api is not None:
+        latency += [dict(row, service=f"{row['service']} (server)") for row in api.stats()["telemetry"]["latency"]]
+    if latency:
+        st.caption(f"Latency percentiles over the last {TELEMETRY_WINDOW} calls per endpoint")
+        st.dataframe(latency, hide_index=True)
+    else:
+        st.caption("No upstream calls yet.")
+
+    for trace in st.session_state.get("action_traces", []):
+        st.markdown(f"**Click at {trace['action']}** — {trace['total_ms']:.0f} ms total, "
+                    f"{trace['untracked_ms']:.0f} ms outside upstream calls")
+        st.dataframe(trace["spans"], hide_index=True)
+
+    col_prom, col_jsonl = st.columns(2)
+    col_prom.download_button("Export (Prometheus)", telemetry.prometheus(), file_name="travel-metrics.prom")
+    col_jsonl.download_button("Export (JSONL)", telemetry.jsonl(), file_name="travel-metrics.jsonl")
 
 st.markdown("---")
 st.caption("⚠️ Note: bookings are simulated (dummy traveler/payment data). Use sandbox credentials.")
+
+# per-rerun overhead of this script (import cost is only paid on the first run)
+startup_profile.record_rerun(time.perf_counter() - _rerun_started)
@@ -0,0 +1,478 @@
+"""
+Travel API
+Headless JSON service over the same search, booking, price-watch and
+itinerary code the Streamlit app uses. Requests are served on a tornado
+event loop; the blocking Amadeus/Gemini calls run on a bounded thread pool,
+so a slow upstream never holds up the loop and never gets more than
+API_MAX_UPSTREAM concurrent requests. Long results (hotel offers, the
+itinerary) are streamed as newline-delimited JSON.
+
+Run with:  python travelapi.py [--port 8800] [--processes 0]
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import contextvars
+import functools
+import inspect
+import json
+import os
+
+import tornado.httpserver
+import tornado.iostream
+import tornado.netutil
+import tornado.process
+import tornado.web
+from amadeus import ResponseError
+
+from amadeuscaller import search_flights, search_hotels, stream_hotel_offers
+from bookingqueue import booking_queue
+from itinerary import ItineraryStream
+from itinerarycache import itinerary_cache, normalize_trip
+from locations import location_index, InvalidSearchError
+from orchestrator import MAX_SEARCH_WORKERS
+from pricecalendar import search_price_calendar, calendar_searches
+from pricewatch import price_watch
+from ratelimiter import rate_limiter, action_budget, RateLimitError
+from resources import get_planner, amadeus_connection_stats
+from searchcache import response_cache
+from singleflight import single_flight
+from telemetry import telemetry
+from tripbundles import search_trip_bundles, MAX_K
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+API_PORT = int(os.getenv("TRAVEL_API_PORT", "8800"))
+API_MAX_UPSTREAM = int(os.getenv("TRAVEL_API_MAX_UPSTREAM", "16"))  # concurrent blocking upstream calls
+API_ACTION_BUDGET = float(os.getenv("TRAVEL_API_ACTION_BUDGET", "20"))  # max seconds a request waits on rate limits
+
+# tuning arguments of the search functions that stay at the server's settings
+SERVER_ONLY_ARGS = ("max_hotels", "chunk_size", "max_workers")
+# upper bounds for arguments that multiply the upstream work of one request
+ARG_LIMITS = {
+    "window_days": 7,      # the app's price-calendar slider
+    "k": MAX_K,            # packages returned
+    "max_results": 100,    # offers per flight search, as the app requests
+}
+
+_executor = ThreadPoolExecutor(max_workers=API_MAX_UPSTREAM + 4, thread_name_prefix="api")
+_upstream = None       # asyncio.Semaphore, created on the serving loop
+_upstream_multi = None  # asyncio.Lock, so requests taking several slots never deadlock
+
+_DONE = object()
+
+
+def _error_line(error) -> dict:
+    line = {"error": str(error) or error.__class__.__name__}
+    if isinstance(error, RateLimitError):
+        line["retry_after"] = error.retry_after
+    return line
+
+
+@asynccontextmanager
+async def _upstream_slots(count: int = 1):
+    """
+    Hold `count` of the API_MAX_UPSTREAM slots, for a request that makes up
+    to that many upstream calls at once.
+    """
+    global _upstream, _upstream_multi
+    if _upstream is None:
+        _upstream, _upstream_multi = asyncio.Semaphore(API_MAX_UPSTREAM), asyncio.Lock()
+    count = max(1, min(count, API_MAX_UPSTREAM))
+    held = 0
+    try:
+        if count == 1:
+            await _upstream.acquire()
+            held = 1
+        else:
+            async with _upstream_multi:
+                while held < count:
+                    await _upstream.acquire()
+                    held += 1
+        yield
+    finally:
+        for _ in range(held):
+            _upstream.release()
+
+
+def _budgeted(fn):
+    """
+    Run `fn` under the per-request rate-limit budget (set inside the
+    worker thread, where the limiter reads it).
+    """
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with action_budget(API_ACTION_BUDGET):
+            return fn(*args, **kwargs)
+    return run
+
+
+# ============================================================
+#  HANDLERS
+# ============================================================
+
+class APIHandler(tornado.web.RequestHandler):
+
+    def prepare(self):
+        self.closed = False
+        self.body = {}
+        if self.request.body:
+            try:
+                self.body = json.loads(self.request.body)
+            except ValueError:
+                raise tornado.web.HTTPError(400, reason="Body is not valid JSON")
+            if not isinstance(self.body, dict):
+                raise tornado.web.HTTPError(400, reason="Body must be a JSON object")
+
+    def on_connection_close(self):
+        self.closed = True
+
+    def write_json(self, data, status: int = 200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(data, default=str))
+
+    def write_error(self, status_code, **kwargs):
+        error = kwargs.get("exc_info", (None, None))[1]
+        payload = {"error": self._reason}
+        if isinstance(error, RateLimitError):
+            self.set_status(429)
+            self.set_header("Retry-After", str(int(error.retry_after) + 1))
+            payload["error"] = str(error)
+        elif isinstance(error, ResponseError):
+            self.set_status(502)
+            payload["error"] = f"Amadeus error: {error}"
+        elif isinstance(error, InvalidSearchError):
+            self.set_status(400)
+            payload.update(error=str(error), suggestions=error.suggestions)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(payload))
+
+    def args_for(self, fn, **extra):
+        """
+        The JSON body as keyword arguments of `fn`; unknown or missing
+        arguments, and the server-only tuning arguments, are a 400, not a
+        crash in the worker or a way around API_MAX_UPSTREAM.
+        """
+        tuning = sorted(set(SERVER_ONLY_ARGS) & set(self.body))
+        if tuning:
+            raise tornado.web.HTTPError(400, reason=f"{', '.join(tuning)} cannot be set by clients")
+        for name, limit in ARG_LIMITS.items():
+            value = self.body.get(name)
+            if value is not None and (type(value) is not int or not 0 < value <= limit):
+                raise tornado.web.HTTPError(400, reason=f"{name} must be an integer from 1 to {limit}")
+        kwargs = dict(self.body, **extra)
+        try:
+            inspect.signature(fn).bind(**kwargs)
+        except TypeError as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+        return kwargs
+
+    async def local(self, fn, *args, **kwargs):
+        # quick ledger reads/writes: off the loop, but not counted as upstream
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+    async def upstream(self, fn, *args, slots: int = 1, **kwargs):
+        # `slots`: upstream calls `fn` may have in flight at once
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, _budgeted(fn), *args, **kwargs)
+        async with _upstream_slots(slots):
+            return await loop.run_in_executor(_executor, call)
+
+    async def stream_ndjson(self, make_iterator, to_line, on_close=None, final_line=None):
+        """
+        Iterate `make_iterator()` on a worker thread and write one JSON line
+        per item as soon as it is produced, then `final_line()` if given.
+        Stops early (and calls `on_close`) when the client goes away.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def produce():
+            try:
+                with action_budget(API_ACTION_BUDGET):
+                    iterator = make_iterator()
+                    try:
+                        for item in iterator:
+                            loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+                            if self.closed:
+                                break
+                    finally:
+                        close = getattr(iterator, "close", None)
+                        if close is not None:
+                            close()
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, (_DONE, e))
+                return
+            loop.call_soon_threadsafe(queue.put_nowait, (_DONE, None))
+
+        self.set_header("Content-Type", "application/x-ndjson")
+        error = None
+        async with _upstream_slots():
+            worker = loop.run_in_executor(_executor, contextvars.copy_context().run, produce)
+            try:
+                while True:
+                    item, error = await queue.get()
+                    if item is _DONE:
+                        if error is not None:
+                            self.write(json.dumps(_error_line(error)) + "\n")
+                        break
+                    line = to_line(item)
+                    if line is not None and not self.closed:
+                        self.write(json.dumps(line, default=str) + "\n")
+                        await self.flush()
+            except tornado.iostream.StreamClosedError:
+                self.closed = True
+            finally:
+                if self.closed and on_close is not None:
+                    on_close()
+                await worker
+        if not self.closed:
+            if final_line is not None and error is None:
+                self.write(json.dumps(final_line(), default=str) + "\n")
+            self.finish()
+
+
+class HealthHandler(APIHandler):
+    def get(self):
+        self.write_json({"ok": True})
+
+
+def _stats() -> dict:
+    return {
+        "search_cache": dict(response_cache.stats, hit_ratio=round(response_cache.hit_ratio(), 3)),
+        "coalesced_searches": dict(single_flight.stats, coalesced_ratio=round(single_flight.coalesced_ratio(), 3)),
+        "rate_limits": dict(rate_limiter.stats, buckets=rate_limiter.snapshot()),
+        "amadeus_connections": amadeus_connection_stats(),
+        "itinerary_cache": itinerary_cache.stats,
+        "price_watch": price_watch.stats,
+        "telemetry": telemetry.snapshot(),
+    }
+
+
+class StatsHandler(APIHandler):
+    async def get(self):
+        # the rate-limit buckets and the telemetry collectors read SQLite
+        self.write_json(await self.local(_stats))
+
+
+class MetricsHandler(APIHandler):
+    """
+    This process's telemetry in Prometheus text format (?format=jsonl for
+    JSONL).
+    """
+
+    async def get(self):
+        # collectors may read SQLite, so the export runs off the loop
+        if self.get_query_argument("format", "prometheus") == "jsonl":
+            self.set_header("Content-Type", "application/x-ndjson")
+            self.finish(await self.local(telemetry.jsonl))
+        else:
+            self.set_header("Content-Type", "text/plain; version=0.0.4")
+            self.finish(await self.local(telemetry.prometheus))
+
+
+class LocationsHandler(APIHandler):
+    def get(self):
+        prefix = self.get_query_argument("q", "")
+        limit = min(int(self.get_query_argument("limit", "8")), 50)
+        self.write_json({"locations": [
+            {"iata": a.iata, "name": a.name, "city": a.city, "city_code": a.city_code, "country": a.country}
+            for a in location_index.autocomplete(prefix, limit)
+        ]})
+
+
+class FlightSearchHandler(APIHandler):
+    async def post(self):
+        offers = await self.upstream(search_flights, **self.args_for(search_flights))
+        self.write_json({"offers": offers or []})
+
+
+class HotelSearchHandler(APIHandler):
+    async def post(self):
+        offers = await self.upstream(search_hotels, **self.args_for(search_hotels))
+        self.write_json({"offers": offers or []})
+
+
+class HotelStreamHandler(APIHandler):
+    async def post(self):
+        kwargs = self.args_for(stream_hotel_offers)
+        await self.stream_ndjson(lambda: stream_hotel_offers(**kwargs), lambda chunk: {"offers": chunk})
+
+
+class CalendarHandler(APIHandler):
+    async def post(self):
+        kwargs = self.args_for(search_price_calendar)
+        # the date searches run in parallel on the orchestrator's pool
+        slots = min(calendar_searches(kwargs.get("window_days", 3), kwargs.get("return_date")), MAX_SEARCH_WORKERS)
+        self.write_json(await self.upstream(search_price_calendar, slots=slots, **kwargs))
+
+
+class PackagesHandler(APIHandler):
+    async def post(self):
+        result = await self.upstream(search_trip_bundles, **self.args_for(search_trip_bundles))
+        self.write_json(dict(result, bundles=[bundle.to_dict() for bundle in result["bundles"]]))
+
+
+class ItineraryHandler(APIHandler):
+    """
+    Streams {"delta": text} lines ({"reset": true} when generation restarts
+    after a 429) and ends with {"done": true, "source": ..., "metrics": ...}.
+    Cached itineraries come back as a single delta.
+    """
+
+    async def post(self):
+        try:
+            prompt = self.body["prompt"]
+            trip = normalize_trip(**self.body["trip"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise tornado.web.HTTPError(400, reason=f"Expected prompt and trip: {e}")
+
+        # "cache": false for prompts grounded in one search's results
+        use_cache = self.body.get("cache", True)
+        if use_cache and not self.body.get("regenerate"):
+            cached, match = await self.local(itinerary_cache.lookup, trip)
+            if cached is not None:
+                self.set_header("Content-Type", "application/x-ndjson")
+                self.write(json.dumps({"delta": cached}) + "\n")
+                self.finish(json.dumps({"done": True, "source": match, "metrics": None}) + "\n")
+                return
+
+        stream = ItineraryStream(await self.local(get_planner), prompt)
+        sent = {"text": ""}
+
+        def to_line(text):
+            previous, sent["text"] = sent["text"], text
+            if text.startswith(previous):
+                return {"delta": text[len(previous):]} if len(text) > len(previous) else None
+            return {"reset": True, "delta": text}
+
+        def generate():
+            yield from stream
+            if use_cache and stream.metrics["completed"] and stream.text:
+                itinerary_cache.put(trip, stream.text)
+
+        await self.stream_ndjson(generate, to_line, on_close=stream.cancel,
+                                 final_line=lambda: {"done": True, "source": None, "metrics": stream.metrics})
+
+
+class BookingsHandler(APIHandler):
+    async def get(self):
+        session_id = self.get_query_argument("session_id")
+        since = int(self.get_query_argument("since", "0"))
+        self.write_json({"changes": await self.local(booking_queue.changes_since, session_id, since)})
+
+    async def post(self):
+        kind = self.body.pop("kind", None)
+        submit = {"flight": booking_queue.submit_flight, "hotel": booking_queue.submit_hotel}.get(kind)
+        if submit is None:
+            raise tornado.web.HTTPError(400, reason='kind must be "flight" or "hotel"')
+        try:
+            job_id = await self.local(submit, **self.args_for(submit))
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+        self.write_json({"job_id": job_id}, status=202)
+
+
+class BookingHandler(APIHandler):
+    async def get(self, job_id):
+        job = await self.local(booking_queue.status, job_id)
+        if job is None:
+            raise tornado.web.HTTPError(404, reason="No such booking")
+        self.write_json(job)
+
+
+class AcceptPriceHandler(APIHandler):
+    async def post(self, job_id):
+        self.write_json({"accepted": await self.local(booking_queue.accept_price_change, job_id)})
+
+
+class WatchesHandler(APIHandler):
+    async def get(self):
+        session_id = self.get_query_argument("session_id")
+        self.write_json({"watches": await self.local(price_watch.watches, session_id)})
+
+    async def post(self):
+        watch_id = await self.local(price_watch.watch, **self.args_for(price_watch.watch))
+        self.write_json({"watch_id": watch_id}, status=201)
+
+
+class WatchHandler(APIHandler):
+    async def delete(self, watch_id):
+        await self.local(price_watch.unwatch, watch_id)
+        self.set_status(204)
+        self.finish()
+
+
+class WatchChangesHandler(APIHandler):
+    async def get(self):
+        session_id = self.get_query_argument("session_id")
+        since = int(self.get_query_argument("since", "0"))
+        self.write_json({"changes": await self.local(price_watch.changes_since, session_id, since)})
+
+
+def _record_request(handler):
+    # replaces tornado's access log: every request becomes an "api" span
+    status = handler.get_status()
+    outcome = "ok" if status < 400 else "throttled" if status == 429 else "error"
+    op = f"{handler.request.method} {type(handler).__name__.removesuffix('Handler')}"
+    telemetry.record("api", op, handler.request.request_time(), outcome)
+
+
+def make_app():
+    return tornado.web.Application([
+        (r"/healthz", HealthHandler),
+        (r"/metrics", MetricsHandler),
+        (r"/v1/stats", StatsHandler),
+        (r"/v1/locations", LocationsHandler),
+        (r"/v1/flights/search", FlightSearchHandler),
+        (r"/v1/flights/calendar", CalendarHandler),
+        (r"/v1/hotels/search", HotelSearchHandler),
+        (r"/v1/hotels/stream", HotelStreamHandler),
+        (r"/v1/packages", PackagesHandler),
+        (r"/v1/itinerary", ItineraryHandler),
+        (r"/v1/bookings", BookingsHandler),
+        (r"/v1/bookings/([0-9a-f]+)", BookingHandler),
+        (r"/v1/bookings/([0-9a-f]+)/accept-price", AcceptPriceHandler),
+        (r"/v1/watches", WatchesHandler),
+        (r"/v1/watches/changes", WatchChangesHandler),
+        (r"/v1/watches/([0-9a-f]+)", WatchHandler),
+    ], log_function=_record_request)
+
+
+# ============================================================
+#  CLI
+# ============================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the travel search/booking functions as a JSON API.")
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="worker processes sharing the port (0 = one per CPU core; not on Windows)")
+    args = parser.parse_args(argv)
+
+    sockets = tornado.netutil.bind_sockets(args.port, address=args.address)
+    if args.processes != 1:
+        tornado.process.fork_processes(args.processes)
+
+    async def serve():
+        server = tornado.httpserver.HTTPServer(make_app())
+        server.add_sockets(sockets)
+        # background threads are started per worker process, after the fork
+        price_watch.start()
+        booking_queue.start()
+        print(f"Travel API listening on http://{args.address}:{args.port} (pid {os.getpid()})")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Travel API client
+Thin client of travelapi.py with the same call signatures as the in-process
+functions (search_flights, search_hotels, search_price_calendar,
+search_trip_bundles, the booking queue and price watches), so the Streamlit
+app can switch between the two with TRAVEL_API_URL. One keep-alive HTTP
+connection pool per process.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+from locations import InvalidSearchError
+from offermodels import TripBundle
+from ratelimiter import RateLimitError
+from telemetry import telemetry
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+TRAVEL_API_TIMEOUT = float(os.getenv("TRAVEL_API_TIMEOUT", "60"))  # seconds to wait for a response (or a stream line)
+
+
+class TravelAPIError(Exception):
+    pass
+
+
+def _route(path: str) -> str:
+    # booking/watch ids would make one telemetry series per id
+    return re.sub(r"/[0-9a-f]{16,}", "/{id}", path)
+
+
+# ============================================================
+#  CLIENT
+# ============================================================
+
+class TravelAPIClient:
+
+    def __init__(self, base_url: str, timeout: float = TRAVEL_API_TIMEOUT):
+        import httpx
+
+        self.http = httpx.Client(base_url=base_url.rstrip("/"), timeout=httpx.Timeout(timeout, connect=5.0),
+                                 limits=httpx.Limits(max_keepalive_connections=16))
+        self.bookings = RemoteBookingQueue(self)
+        self.watches = RemotePriceWatch(self)
+
+    # ---------- transport ----------
+
+    @staticmethod
+    def _check(response):
+        if response.status_code == 429:
+            raise RateLimitError("travel-api", float(response.headers.get("Retry-After", "1")))
+        if response.status_code >= 400:
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            if "suggestions" in body:
+                raise InvalidSearchError(body["error"], body["suggestions"])
+            raise TravelAPIError(body.get("error") or f"HTTP {response.status_code}")
+
+    def request(self, method: str, path: str, payload: dict = None, **params):
+        content = json.dumps(payload, default=str) if payload is not None else None
+        with telemetry.span("travel_api", f"{method} {_route(path)}"):
+            response = self.http.request(method, path, content=content, params=params or None,
+                                         headers={"Content-Type": "application/json"})
+            self._check(response)
+            return response.json() if response.status_code != 204 else None
+
+    def stream_lines(self, path: str, payload: dict):
+        """
+        POST `payload` and yield each JSON line of the streamed answer. An
+        error line from the server is raised here.
+        """
+        with telemetry.span("travel_api", f"POST {path}"), \
+                self.http.stream("POST", path, content=json.dumps(payload, default=str),
+                                 headers={"Content-Type": "application/json"}) as response:
+            if response.status_code >= 400:
+                response.read()
+                self._check(response)
+            for raw in response.iter_lines():
+                if not raw:
+                    continue
+                line = json.loads(raw)
+                if "error" in line:
+                    if "retry_after" in line:
+                        raise RateLimitError("travel-api", line["retry_after"])
+                    raise TravelAPIError(line["error"])
+                yield line
+
+    # ---------- searches ----------
+
+    def locations(self, prefix: str, limit: int = 8) -> list:
+        return self.request("GET", "/v1/locations", q=prefix, limit=limit)["locations"]
+
+    def search_flights(self, **kwargs):
+        return self.request("POST", "/v1/flights/search", kwargs)["offers"]
+
+    def search_hotels(self, **kwargs):
+        return self.request("POST", "/v1/hotels/search", kwargs)["offers"]
+
+    def stream_hotel_offers(self, **kwargs):
+        for line in self.stream_lines("/v1/hotels/stream", kwargs):
+            yield line["offers"]
+
+    def search_price_calendar(self, **kwargs):
+        return self.request("POST", "/v1/flights/calendar", kwargs)
+
+    def search_trip_bundles(self, **kwargs):
+        result = self.request("POST", "/v1/packages", kwargs)
+        result["bundles"] = [TripBundle.from_dict(bundle) for bundle in result["bundles"]]
+        return result
+
+    def itinerary(self, prompt: str, trip: dict, regenerate: bool = False, cache: bool = True):
+        """
+        `trip` holds the normalize_trip arguments (theme, destination,
+        start_date, end_date, activities, budget); the service serves and
+        fills the itinerary cache itself unless `cache` is False.
+        """
+        return RemoteItineraryStream(self, {"prompt": prompt, "trip": trip, "regenerate": regenerate, "cache": cache})
+
+    def stats(self) -> dict:
+        return self.request("GET", "/v1/stats")
+
+
+class RemoteItineraryStream:
+    """
+    Same iteration contract as itinerary.ItineraryStream (cumulative text,
+    `text`, `metrics`, `cancel()`), plus `source` ("exact" / "similar" when
+    the service answered from its cache).
+    """
+
+    def __init__(self, client: TravelAPIClient, payload: dict):
+        self.client = client
+        self.payload = payload
+        self.text = ""
+        self.source = None
+        self.cancel_event = threading.Event()
+        self.metrics = {"ttft_s": None, "total_s": None, "chunks": 0, "retries": 0,
+                        "cancelled": False, "completed": False}
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def __iter__(self):
+        started = time.perf_counter()
+        lines = self.client.stream_lines("/v1/itinerary", self.payload)
+        try:
+            for line in lines:
+                if self.cancel_event.is_set():
+                    self.metrics["cancelled"] = True
+                    return
+                if line.get("done"):
+                    self.source = line.get("source")
+                    self.metrics["retries"] = (line.get("metrics") or {}).get("retries", 0)
+                    self.metrics["completed"] = True
+                    continue
+                if line.get("reset"):
+                    self.text = ""
+                self.text += line.get("delta", "")
+                if self.metrics["ttft_s"] is None:
+                    self.metrics["ttft_s"] = round(time.perf_counter() - started, 3)
+                self.metrics["chunks"] += 1
+                yield self.text
+        except GeneratorExit:
+            self.metrics["cancelled"] = True
+            raise
+        finally:
+            lines.close()
+            self.metrics["total_s"] = round(time.perf_counter() - started, 3)
+
+
+class RemoteBookingQueue:
+    """
+    The parts of bookingqueue.BookingQueue the app uses.
+    """
+
+    def __init__(self, client: TravelAPIClient):
+        self.client = client
+
+    def submit_flight(self, session_id: str, flight_offer: dict, title: str = None, price: str = None,
+                      reprice: bool = True) -> str:
+        return self.client.request("POST", "/v1/bookings", dict(
+            kind="flight", session_id=session_id, flight_offer=flight_offer, title=title, price=price,
+            reprice=reprice))["job_id"]
+
+    def submit_hotel(self, session_id: str, hotel_offer_id: str | None, hotel_name: str = None, price: str = None,
+                     display_price: str = None, reprice: bool = True) -> str:
+        return self.client.request("POST", "/v1/bookings", dict(
+            kind="hotel", session_id=session_id, hotel_offer_id=hotel_offer_id, hotel_name=hotel_name,
+            price=price, display_price=display_price, reprice=reprice))["job_id"]
+
+    def accept_price_change(self, job_id: str) -> bool:
+        return self.client.request("POST", f"/v1/bookings/{job_id}/accept-price")["accepted"]
+
+    def changes_since(self, session_id: str, seq: int = 0) -> list:
+        return self.client.request("GET", "/v1/bookings", session_id=session_id, since=seq)["changes"]
+
+    def status(self, job_id: str):
+        return self.client.request("GET", f"/v1/bookings/{job_id}")
+
+
+class RemotePriceWatch:
+    """
+    The parts of pricewatch.PriceWatch the app uses.
+    """
+
+    def __init__(self, client: TravelAPIClient):
+        self.client = client
+
+    def watch(self, session_id: str, kind: str, params: dict, label: str, expires_on) -> str:
+        return self.client.request("POST", "/v1/watches", dict(
+            session_id=session_id, kind=kind, params=params, label=label, expires_on=expires_on))["watch_id"]
+
+    def unwatch(self, watch_id: str):
+        self.client.request("DELETE", f"/v1/watches/{watch_id}")
+
+    def watches(self, session_id: str) -> list:
+        return self.client.request("GET", "/v1/watches", session_id=session_id)["watches"]
+
+    def changes_since(self, session_id: str, seq: int = 0) -> list:
+        return self.client.request("GET", "/v1/watches/changes", session_id=session_id, since=seq)["changes"]
+
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_api_client(base_url: str) -> TravelAPIClient:
+    """
+    One client (and connection pool) per base URL and process.
+    """
+    with _lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = _clients[base_url] = TravelAPIClient(base_url)
+        return client
@@ -0,0 +1,188 @@
+"""
+Trip bundles
+Searches the flights for both directions and the hotels for the stay side by
+side, then ranks the best K flight + hotel packages by total price, travel
+time and budget tier. Candidates are enumerated best-first over the
+individually sorted offer lists, so the flights x hotels cross product is
+never built.
+"""
+
+from datetime import date
+import heapq
+import os
+
+from amadeuscaller import search_flights, search_hotels
+from offermodels import TripBundle, parse_flight_offers, parse_hotel_offers
+from orchestrator import run_concurrently
+
+
+# ============================================================
+#  CONFIGURATION
+# ============================================================
+
+BUNDLE_SEARCH_TIMEOUT = int(os.getenv("BUNDLE_SEARCH_TIMEOUT", "45"))  # seconds per search branch
+
+# Price-equivalent of one minute of travel time per budget tier: economy
+# travellers take the cheapest option, luxury travellers pay to fly shorter.
+BUDGET_TIERS = {
+    "economy": 0.05,
+    "standard": 0.25,
+    "luxury": 1.0,
+}
+
+MAX_EXPANSIONS_PER_RESULT = 50  # bounds the search when `max_total` rejects most candidates
+MAX_K = 50  # packages one search may ask for
+
+
+# ============================================================
+#  TOP-K
+# ============================================================
+
+def _check_k(k):
+    if type(k) is not int or not 0 < k <= MAX_K:
+        raise ValueError(f"k must be an integer from 1 to {MAX_K}")
+
+
+def top_k_combinations(lists, k: int, accept=None):
+    """
+    The `k` lowest-scoring combinations taking one item from each list,
+    best first. Every list must hold (score, item) pairs sorted by score; a
+    combination scores the sum of its parts.
+
+    Works like a k-way merge over the grid of index tuples: starting from
+    all-zeros, each popped combination pushes its successors (one index + 1),
+    so only O(k * len(lists)) combinations are ever scored. `accept` can
+    reject combinations (e.g. over budget) without stopping the search.
+    `k` must be from 1 to MAX_K.
+    """
+    _check_k(k)
+    if not lists or any(not items for items in lists):
+        return []
+
+    start = (0,) * len(lists)
+    heap = [(sum(items[0][0] for items in lists), start)]
+    seen = {start}
+    results = []
+    expansions = 0
+    limit = k * MAX_EXPANSIONS_PER_RESULT
+    while heap and len(results) < k and expansions < limit:
+        score, indexes = heapq.heappop(heap)
+        expansions += 1
+        combination = tuple(items[i][1] for items, i in zip(lists, indexes))
+        if accept is None or accept(combination):
+            results.append((score, combination))
+        for position, items in enumerate(lists):
+            following = indexes[position] + 1
+            if following >= len(items):
+                continue
+            successor = indexes[:position] + (following,) + indexes[position + 1:]
+            if successor in seen:
+                continue
+            seen.add(successor)
+            heapq.heappush(heap, (score - items[indexes[position]][0] + items[following][0], successor))
+    return results
+
+
+# ============================================================
+#  BUNDLES
+# ============================================================
+
+def _scored_flights(offers, minute_price: float, currency: str):
+    offers = [o for o in offers if o.price is not None and o.currency == currency]
+    known = [o.total_duration_minutes for o in offers if o.total_duration_minutes is not None]
+    # unknown durations are ranked like the slowest known offer
+    fallback = max(known) if known else 0
+    scored = [(o.price + minute_price * (o.total_duration_minutes or fallback), o) for o in offers]
+    scored.sort(key=lambda pair: pair[0])
+    return scored
+
+
+def search_trip_bundles(origin: str, destination: str, departure_date, return_date, adults: int = 1,
+                        budget: str = "Standard", k: int = 5, round_trip: bool = True, rating=None,
+                        max_total: float = None, max_results: int = 10, fresh: bool = False):
+    """
+    Best `k` packages for the trip.
+
+    With `round_trip=True` one round-trip search is made (one price for both
+    directions); otherwise the outbound and return legs are searched as two
+    one-way searches and combined freely. The hotel search for the stay runs
+    at the same time. Bundles only combine offers in one currency (that of
+    the cheapest flight); hotels in other currencies are left out.
+
+    Returns a dict:
+        bundles: list of TripBundle, best first
+        currency: currency of the totals
+        candidates: size of the full cross product that was not built
+        skipped_currency: hotel offers left out for their currency
+        failed: searches that errored or timed out
+    """
+    _check_k(k)
+    departure = departure_date.isoformat() if isinstance(departure_date, date) else str(departure_date)
+    ret = return_date.isoformat() if isinstance(return_date, date) else str(return_date)
+    minute_price = BUDGET_TIERS.get(budget.strip().lower(), BUDGET_TIERS["standard"])
+
+    flight_args = dict(adults=adults, max_results=max_results, fresh=fresh)
+    branches = {
+        "hotels": (search_hotels, dict(city_code=destination, check_in=departure, check_out=ret, radius_km=20,
+                                       rating=rating, fresh=fresh), BUNDLE_SEARCH_TIMEOUT),
+    }
+    if round_trip:
+        branches["round_trip"] = (search_flights, dict(origin=origin, destination=destination, departure_date=departure,
+                                                       return_date=ret, **flight_args), BUNDLE_SEARCH_TIMEOUT)
+    else:
+        branches["outbound"] = (search_flights, dict(origin=origin, destination=destination, departure_date=departure,
+                                                     **flight_args), BUNDLE_SEARCH_TIMEOUT)
+        branches["return"] = (search_flights, dict(origin=destination, destination=origin, departure_date=ret,
+                                                   **flight_args), BUNDLE_SEARCH_TIMEOUT)
+
+    offers = {}
+    failed = []
+    for name, result, error, _ in run_concurrently(branches):
+        if error is not None:
+            failed.append({"search": name, "error": str(error)})
+            result = None
+        offers[name] = parse_hotel_offers(result) if name == "hotels" else parse_flight_offers(result)
+
+    empty = {"bundles": [], "currency": None, "candidates": 0, "skipped_currency": 0, "failed": failed}
+    flight_legs = ["round_trip"] if round_trip else ["outbound", "return"]
+    priced = [o for leg in flight_legs for o in offers[leg] if o.price is not None]
+    if not priced:
+        return empty
+    currency = min(priced, key=lambda o: o.price).currency
+
+    lists = [_scored_flights(offers[leg], minute_price, currency) for leg in flight_legs]
+    # an offer without an ID cannot be booked as part of a package
+    hotels = [h for h in offers["hotels"] if h.price is not None and h.offer_id is not None]
+    matching = sorted(((h.price, h) for h in hotels if h.currency == currency), key=lambda pair: pair[0])
+    if matching:
+        lists.append(matching)
+    if any(not items for items in lists):
+        return dict(empty, currency=currency)
+
+    def total_price(combination):
+        return sum(offer.price for offer in combination)
+
+    accept = None if max_total is None else (lambda combination: total_price(combination) <= max_total)
+    bundles = []
+    for score, combination in top_k_combinations(lists, k, accept):
+        flights = combination[:len(flight_legs)]
+        durations = [f.total_duration_minutes for f in flights]
+        bundles.append(TripBundle(
+            score=round(score, 2),
+            total_price=round(total_price(combination), 2),
+            currency=currency,
+            duration_minutes=None if None in durations else sum(durations),
+            flights=flights,
+            hotel=combination[-1] if matching else None,
+        ))
+
+    candidates = 1
+    for items in lists:
+        candidates *= len(items)
+    return {
+        "bundles": bundles,
+        "currency": currency,
+        "candidates": candidates,
+        "skipped_currency": len(hotels) - len(matching),
+        "failed": failed,
+    }